@@ -1,7 +1,9 @@
-import csv
+import os
+import sys
 import math
+import argparse
+import time
 import random
-import threading
 from kivy.app import App
 from kivy.clock import Clock
 from kivy.config import Config
@@ -11,14 +13,29 @@ from kivy.uix.popup import Popup
 from kivy.uix.widget import Widget
 from kivy.uix.button import Button
 from kivy.core.window import Window
-from kivy.core.audio import SoundLoader
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.textinput import TextInput
-from kivy.uix.scrollview import ScrollView
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
 from kivy.uix.behaviors import ButtonBehavior
 from kivy.uix.relativelayout import RelativeLayout
 from kivy.uix.screenmanager import ScreenManager, Screen
-from kivy.graphics import Color, Rectangle, Rotate, Translate, PushMatrix, PopMatrix
+from kivy.properties import NumericProperty
+from kivy.graphics import Color, InstructionGroup, Mesh, Rectangle, Rotate, Translate, PushMatrix, PopMatrix
+
+import sprites
+import levelfile
+from audio import AudioManager
+from animation import Animation, Animator, Tween, ease_out
+from assets import Preloader
+from glyphs import GlyphLabel
+from projectiles import BULLET, CUPCAKE, LASER
+from gameloop import FixedStepLoop, TICK_RATE, lerp
+from levelfile import LEVELS
+from leaderboard import LeaderboardStore, LeaderboardWriter
+from replay import Player, Recorder, Recording
+from profiler import FrameProfiler
+from timers import TimerWheel
 
 
 """ Set the window size to be fixed, and the width 
@@ -34,62 +51,64 @@ Config.set('graphics', 'maxfps', '60')
 # Write config changes
 Config.write()
 
-
-def collides(rect1, rect2):
-    # Extract the top-left corner and dimensions of rectangles using tuple unpacking
-    r1x, r1y, r1w, r1h = rect1[0][0], rect1[0][1], rect1[1][0], rect1[1][1]
-    r2x, r2y, r2w, r2h = rect2[0][0], rect2[0][1], rect2[1][0], rect2[1][1]
-
-    # Check if the rectangles are overlapping (either to the left/right or above/below)
-    if (r1x + r1w <= r2x) or (r2x + r2w <= r1x) or (r1y + r1h <= r2y) or (r2y + r2h <= r1y):
-        return False
-
-    else:
-        return True
-
-
-def distance(point1, point2):
-    return ((point1[0] - point2[0]) ** 2 + (point1[1] - point2[1]) ** 2) ** 0.5
+# shared by every screen: menus ask the preloader to load the next level while they are shown
+audio = AudioManager()
+preloader = Preloader(audio)
+# every cosmetic animation of every screen is stepped by this one
+animator = Animator()
 
 
 class DataHandler:
-    @staticmethod
-    # we use static method because we don't need the class, 
-    # but the function is related to the use of the object, 
-    # and it is convenient for the function to be in the object's namespace.
-    def read_leaderboard():
-        leaderboard = []
-        try:
-            with open('leaderboard.csv', 'r') as file:
-                for line in file:
-                    try:
-                        name, score = line.strip().split(',')
-                        leaderboard.append((name, score))
-                    except ValueError:
-                        # This catches lines that don't correctly split into name and score
-                        print(f"Skipping malformed line: {line.strip()}")
-        except FileNotFoundError:
-            print("leaderboard.csv not found. Please check the file path.")
-        return leaderboard
-
-    @staticmethod
-    def update_leaderboard(name, score, file_path='leaderboard.csv'):
-        with open(file_path, mode='a', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow([name, score])
-
-
-class Bullet(Widget):
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-
-        # Create a rectangle for the bullet with a specific size and source
-        with self.canvas:
-            self.ellipse = Rectangle(size=(Window.width/100, Window.width/100), source=("./img/bullet.png"))
-
-    def set_pos(self, x, y):
-        # Set the position of the bullet
-        self.ellipse.pos = (x, y)
+    # The scores live in leaderboard.db (see leaderboard.py). The store we read from and the
+    # writer thread start on first use; leaderboard.csv is only read to import old scores.
+    store = None
+    writer = None
+    # called on the main thread with every batch of submissions once it is saved,
+    # and with every batch that couldn't be (the writer tries it again later)
+    on_saved = None
+    on_failed = None
+    # seconds the app waits for the writer when it quits, what isn't written by then goes to the csv
+    close_timeout = 5
+
+    @classmethod
+    def get_store(cls):
+        if cls.store is None:
+            cls.store = LeaderboardStore()
+        return cls.store
+
+    @classmethod
+    def read_leaderboard(cls, after=None, count=None):
+        # (name, score, id) entries following the entry (score, id) after, or from the top,
+        # all of them by default, best score first
+        store = cls.get_store()
+        return store.page_after(after, len(store) if count is None else count)
+
+    @classmethod
+    def get_writer(cls):
+        if cls.writer is None:
+            # the store creates the file and imports the csv before the writer opens it
+            cls.get_store()
+            cls.writer = LeaderboardWriter(on_saved=cls._saved_in_background, on_failed=cls._failed_in_background)
+        return cls.writer
+
+    @classmethod
+    def _saved_in_background(cls, batch):
+        Clock.schedule_once(lambda dt: cls.on_saved(batch) if cls.on_saved else None)
+
+    @classmethod
+    def _failed_in_background(cls, batch):
+        Clock.schedule_once(lambda dt: cls.on_failed(batch) if cls.on_failed else None)
+
+    @classmethod
+    def update_leaderboard(cls, name, score):
+        # returns right away with the Submission, the score is written in the background
+        return cls.get_writer().submit(name, score)
+
+    @classmethod
+    def close(cls, timeout=None):
+        # wait for the scores not written yet
+        if cls.writer is not None:
+            cls.writer.close(timeout)
 
 
 class PowerBar(Widget):
@@ -102,44 +121,22 @@ class PowerBar(Widget):
             self.powerbar = Rectangle(size=(100, 15), pos=(Window.width/16, Window.height/1.11))
 
 
-class Rock(Widget):
-    def __init__(self, **kwargs):
-        super(Rock, self).__init__(**kwargs)
-        self.size = (Window.width / 20, Window.height / 20)  # Example size, adjust as needed
-        with self.canvas:
-            self.rect = Rectangle(source="./img/block.jpeg", pos=self.pos, size=self.size)
-    
-    # position update mechanism
-    def on_pos(self, *args):
-        # if the rectangle exists, update its position
-        if hasattr(self, 'rect'):
-            self.rect.pos = self.pos
-
-
 class Mirror(Widget):
-    def __init__(self, **kwargs):
+    def __init__(self, pos=None, **kwargs):
         super().__init__(**kwargs)
-        # initialize the cooldown to False
-        self.cooldown = False
+        # the cooldown used to avoid multiple collisions now lives in the simulation's MirrorState
+        if pos is None:
+            pos = (Window.width/2, Window.height/1.2)
+
         with self.canvas:
-            self.mirror = Rectangle(size=(300, 30), pos=(Window.width/2, Window.height/1.2))
+            self.mirror = Rectangle(size=(300, 30), pos=pos)
             self.mirror_color = Color(0, 0, 0, 1)
-    
-    # start the cooldown, that is used to avoid multiple collisions
-    def start_cooldown(self):
-        self.cooldown = True
-        threading.Timer(0.5, self.reset_cooldown).start()
-
-    def reset_cooldown(self):
-        self.cooldown = False
 
 
 class VerticalMirror(Widget):
     def __init__(self, pos=None, **kwargs):
         super().__init__(**kwargs)
         # the same is done for the vertical mirror
-        self.cooldown = False
-        
         if pos is None:
             pos = (Window.width/1.2, Window.height/4)
         
@@ -147,51 +144,102 @@ class VerticalMirror(Widget):
             # notice the size proportions have been inverted wrt the horizontal mirror
             self.verticalmirror = Rectangle(size=(30, 270), pos=pos)
             self.verticalmirror_color = Color(1, 1, 1, 1)
-    
-    def start_cooldown(self):
-        self.cooldown = True
-        threading.Timer(0.5, self.reset_cooldown).start()
 
-    def reset_cooldown(self):
-        self.cooldown = False
 
+# a projectile that moved more than this in one step was teleported (or its slot reused),
+# it is drawn where it is instead of sliding across the screen
+SNAP_DISTANCE = 100
 
-class Laser(Widget):
-    def __init__(self, **kwargs):
+
+class ProjectileRenderer(Widget):
+    # Draws every bullet, cupcake and laser of the world's projectile pool. The canvas instructions
+    # for each pool slot are created once here, so firing never creates widgets or instructions.
+    # Positions are interpolated between the last two simulation steps.
+    def __init__(self, pool, rng=random, active=None, **kwargs):
         super().__init__(**kwargs)
+        self.pool = pool
+        # the laser colors cycle while a laser is on screen and active() says so (the level isn't paused)
+        self.active = active
+        self.color_animation = None
+        # seeded per session, so a replay shows the same laser colors
+        self.rng = rng
+        self.textures = {BULLET: preloader.texture("bullet.png"),
+                         CUPCAKE: preloader.texture("cupcake.png"),
+                         LASER: None}
         # sets the color of the laser
-        self.color_target = [random.random() for _ in range(3)]
-
+        self.laser_rgb = [1, 0, 0]
+        self.color_target = [self.rng.random() for _ in range(3)]
+        # slot -> kind drawn during the last sync, so we know which ones to hide or redress
+        self.visible = {}
+        # slot -> (x, y) before the last simulation step
+        self.previous = {}
+
+        self.slots = []
         with self.canvas:
-            self.laser_color = Color(1, 0, 0, 1)
-            PushMatrix() # avoid laser rotation
-            self.laser_translation = Translate(0, 0)
-            self.laser_rotation = Rotate(angle=0, origin=(0, 0))
-            self.laser = Rectangle(size=(100, Window.width/100), pos=(0, 0))
-            PopMatrix()
-
-    def set_trans_laser(self, x, y):
-        self.laser_translation.x = x
-        self.laser_translation.y = y
-
-    def set_pos_laser(self, x, y):
-        self.laser.pos = (x, y)
-
-    def set_rotation(self, angle):
-        self.laser_rotation.angle = angle
-    
+            for _ in range(pool.capacity):
+                color = Color(1, 1, 1, 0)
+                PushMatrix() # avoid laser rotation
+                translation = Translate(0, 0)
+                rotation = Rotate(angle=0, origin=(0, 0))
+                rect = Rectangle(size=(0, 0), pos=(0, 0))
+                PopMatrix()
+                self.slots.append((color, translation, rotation, rect))
+
+    def capture(self):
+        # called right before every simulation step
+        pool = self.pool
+        self.previous = {slot: (pool.x[slot], pool.y[slot]) for slot in pool.live}
+
+    def sync(self, alpha=1.0):
+        pool = self.pool
+        # hide the slots that died since the last frame
+        for slot in [slot for slot in self.visible if not pool.alive(slot)]:
+            self.slots[slot][0].a = 0
+            del self.visible[slot]
+
+        # only live slots are touched
+        for slot in pool.live:
+            color, translation, rotation, rect = self.slots[slot]
+            kind = pool.kind[slot]
+            if self.visible.get(slot) != kind:
+                # the slot was just spawned (maybe reused by another kind), dress it up for its kind
+                self.visible[slot] = kind
+                rect.texture = self.textures[kind]
+                rect.size = (pool.w[slot], pool.h[slot])
+                color.rgba = self.laser_rgb + [1] if kind == LASER else (1, 1, 1, 1)
+                if kind == LASER and self.color_animation is None:
+                    self.color_animation = animator.add(Animation(self.update_color, active=self.active,
+                                                                  on_complete=self.colors_stopped), owner=self)
+            x, y = pool.x[slot], pool.y[slot]
+            previous = self.previous.get(slot)
+            if previous is not None and abs(x - previous[0]) + abs(y - previous[1]) < SNAP_DISTANCE:
+                x, y = lerp(previous[0], x, alpha), lerp(previous[1], y, alpha)
+            translation.x = x
+            translation.y = y
+            rotation.angle = pool.angle[slot] if kind == LASER else 0
+
+    def shows(self, kind):
+        return kind in self.visible.values()
+
+    def colors_stopped(self):
+        self.color_animation = None
 
     def update_color(self, dt):
+        # the animation ends with the last laser on screen, so the animator can go idle
+        if not self.shows(LASER):
+            return False
         # calculates the difference between target color and current
-        color_diff = [self.color_target[i] - self.laser_color.rgba[i] for i in range(3)]
+        color_diff = [self.color_target[i] - self.laser_rgb[i] for i in range(3)]
 
         # if the difference is less than 0.01, change the target color
         if all(abs(diff) < 0.01 for diff in color_diff):
-            self.color_target = [random.random() for _ in range(3)]
+            self.color_target = [self.rng.random() for _ in range(3)]
 
         # renews current color by getting it closer to the target
-        new_color = [self.laser_color.rgba[i] + color_diff[i] * dt * 8 for i in range(3)]
-        self.laser_color.rgba = new_color + [1]
+        self.laser_rgb = [self.laser_rgb[i] + color_diff[i] * dt * 8 for i in range(3)]
+        for slot, kind in self.visible.items():
+            if kind == LASER:
+                self.slots[slot][0].rgba = self.laser_rgb + [1]
 
 
 class Wormhole(Widget):
@@ -203,31 +251,51 @@ class Wormhole(Widget):
         self.add_widget(self.rear)    
 
 
-class Cupcake(Widget):
-    def __init__(self, **kwargs):
+class WallRenderer(Widget):
+    # Draws every block sharing one texture as a single Mesh: four vertices (x, y, u, v) per
+    # block in one vertex buffer, so the whole wall is one draw call and no widget per block.
+    # A destroyed block has its quad collapsed in place, the rest of the buffer is untouched,
+    # and the buffer is uploaded once before the next frame however many blocks went in this one.
+    # corners are the quads baked by the level compiler (x, y of 4 corners per block), if any.
+    def __init__(self, image, bodies, corners=None, **kwargs):
         super().__init__(**kwargs)
-
-        # Create a rectangle for the bomb with a fixed size and source
+        texture = preloader.texture(image)
+        # the texture coordinates of the four corners, in the order Rectangle uses them
+        u0, v0, u1, v1, u2, v2, u3, v3 = texture.tex_coords
+        self.vertices = []
+        indices = []
+        # body -> index of its first vertex value in self.vertices
+        self.offsets = {}
+        for quad, body in enumerate(bodies):
+            if corners:
+                x0, y0, x1, y1, x2, y2, x3, y3 = corners[quad * 8:quad * 8 + 8]
+            else:
+                (x0, y0), (w, h) = body.rect()
+                x1, y1, x2, y2, x3, y3 = x0 + w, y0, x0 + w, y0 + h, x0, y0 + h
+            self.offsets[body] = len(self.vertices)
+            self.vertices.extend((x0, y0, u0, v0, x1, y1, u1, v1, x2, y2, u2, v2, x3, y3, u3, v3))
+            first = quad * 4
+            indices.extend((first, first + 1, first + 2, first + 2, first + 3, first))
         with self.canvas:
-            self.ellipse = Rectangle(size=(Window.width/50, Window.width/50), source=("./img/cupcake.png"))
+            Color(1, 1, 1, 1)
+            self.mesh = Mesh(vertices=self.vertices, indices=indices, mode='triangles', texture=texture)
+        self.trigger_upload = Clock.create_trigger(self.upload, -1)
 
-    def set_pos(self, x, y):
-        # Set the position of the bomb
-        self.ellipse.pos = (x, y)
+    def __contains__(self, body):
+        return body in self.offsets
 
+    def remove_block(self, body):
+        # a quad with all four corners on the same point draws nothing
+        offset = self.offsets.pop(body)
+        x, y = self.vertices[offset], self.vertices[offset + 1]
+        for corner in range(1, 4):
+            self.vertices[offset + corner * 4] = x
+            self.vertices[offset + corner * 4 + 1] = y
+        self.trigger_upload()
 
-class Perpetio(Widget):
-    def __init__(self, **kwargs):
-        super(Perpetio, self).__init__(**kwargs)
-        self.size = (Window.width / 20, Window.height / 20)  # Example size, adjust as needed
-        with self.canvas:
-            self.rect = Rectangle(source="./img/perpetio.jpg", pos=self.pos, size=self.size)
-    
-    # position update mechanism
-    def on_pos(self, *args):
-        # if the rectangle exists, update its position
-        if hasattr(self, 'rect'):
-            self.rect.pos = self.pos
+    def upload(self, *args):
+        # assigning the list again is what uploads the new buffer
+        self.mesh.vertices = self.vertices
 
 
 class OptionsButton(RelativeLayout):
@@ -237,7 +305,7 @@ class OptionsButton(RelativeLayout):
         self.size = (50, 50) 
         self.pos_hint = {'right': 0.975, 'top': 0.98}
         # Options Button
-        self.options_btn = ImageButton(source='./img/options.png', size=self.size, pos=self.pos, size_hint=self.size_hint)
+        self.options_btn = ImageButton(source=sprites.source('options.png'), size=self.size, pos=self.pos, size_hint=self.size_hint)
         self.options_btn.bind(on_press=self.open_options)
         self.add_widget(self.options_btn)
     
@@ -261,9 +329,9 @@ class OptionsButton(RelativeLayout):
 
         # Content layout
         content = BoxLayout(orientation='vertical', padding=10, spacing=10)
-        quit_btn = ImageButton(source='./img/quit.png', on_press=self.quit_game)
-        resume_btn = ImageButton(source='./img/resume.png', on_press=self.close_options)
-        help_btn = ImageButton(source='./img/tut.png', on_press=self.open_help)
+        quit_btn = ImageButton(source=sprites.source('quit.png'), on_press=self.quit_game)
+        resume_btn = ImageButton(source=sprites.source('resume.png'), on_press=self.close_options)
+        help_btn = ImageButton(source=sprites.source('tut.png'), on_press=self.open_help)
 
         content.add_widget(quit_btn)
         content.add_widget(resume_btn)
@@ -276,11 +344,20 @@ class OptionsButton(RelativeLayout):
         # Create the popup without the default title and with no border
         self.popup = Popup(title='', content=root_layout, size_hint=(None, None), size=(400, 400), 
                            background_color=[0, 0, 0, 0])
+        # the game doesn't go on behind the options
+        self.game = getattr(self.parent, 'game_widget', None)
+        if self.game is not None:
+            self.game.pause()
+            self.popup.bind(on_dismiss=self.resume_game)
         self.popup.open()
 
     def close_options(self, instance):
         self.popup.dismiss()
 
+    def resume_game(self, instance):
+        if self.game.world is not None:
+            self.game.start()
+
     def quit_game(self, instance):
         App.get_running_app().stop()
         
@@ -322,9 +399,10 @@ class Music_button(Button):
         self.pos_hint = {'right': 0.92, 'top': 0.98}
 
         self.music_state = False
-        self.song = SoundLoader.load('./music/sweetbip.mp3')
+        self.song = audio.track('./music/sweetbip.mp3')
+        self.pulse = None
         with self.canvas:
-            self.musicbutton = ImageButton(size=self.size, source="./img/musica_on.png")
+            self.musicbutton = ImageButton(size=self.size, source=sprites.source("musica_on.png"))
 
         # Bind pos and size to update the Rectangle's position and size
         self.bind(pos=self.update_graphics_pos, size=self.update_graphics_pos)
@@ -338,13 +416,13 @@ class Music_button(Button):
         if self.song and not self.music_state:
             self.song.play()
             self.song.loop = True
-            self.musicbutton.source = './img/musica_on.png'
+            self.musicbutton.source = sprites.source('musica_on.png')
             self.music_state = True
     
     def stop_music(self):
         if self.song and self.music_state:
             self.song.stop()
-            self.musicbutton.source = './img/musica_off.png'
+            self.musicbutton.source = sprites.source('musica_off.png')
             self.music_state = False
             self.song.stop()
             self.music_state = False
@@ -353,14 +431,19 @@ class Music_button(Button):
         if self.music_state:
             self.song.stop()
             # changes icon based on the music state
-            self.musicbutton.source = './img/musica_off.png'
+            self.musicbutton.source = sprites.source('musica_off.png')
         else:
             self.song.play()
-            self.musicbutton.source = './img/musica_on.png'
+            self.musicbutton.source = sprites.source('musica_on.png')
         self.music_state = not self.music_state
+        # the icon flashes as it changes
+        animator.remove(self.pulse)
+        self.musicbutton.opacity = 0.3
+        self.pulse = animator.add(Tween.attribute(self.musicbutton, 'opacity', 1, 0.3, easing=ease_out))
 
 
-class ScoreDisplay(Label):
+class ScoreDisplay(GlyphLabel):
+    # drawn from the font's glyph atlas, so a new score only moves quads around
     def __init__(self, score, **kwargs):
         super(ScoreDisplay, self).__init__(**kwargs)
         self.text = f"Score: {score}"
@@ -378,7 +461,27 @@ class ScoreDisplay(Label):
         self.pos = (10, Window.height - 30)
 
 
-class ScoreBanner(Label):
+class ProfileOverlay(Label):
+    # frame time percentiles per phase, shown to the right of the score while profiling
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.font_size = '13sp'
+        self.font_name = 'RobotoMono-Regular'
+        self.color = (1, 1, 0.6, 1)
+        self.size_hint = (None, None)
+        self.bind(texture_size=self.adjust_position)
+        with self.canvas.before:
+            Color(0, 0, 0, 0.6)
+            self.background = Rectangle()
+
+    def adjust_position(self, *args):
+        self.size = self.texture_size
+        self.pos = (Window.width / 4, Window.height - 10 - self.height)
+        self.background.pos = self.pos
+        self.background.size = self.size
+
+
+class ScoreBanner(GlyphLabel):
     def __init__(self, score, **kwargs):
         super(ScoreBanner, self).__init__(**kwargs)
         self.text = f"Final Score: {score}"
@@ -387,1281 +490,481 @@ class ScoreBanner(Label):
         self.color = (1, 1, 1, 1)
         self.size_hint = (None, None)
         self.pos_hint = {'center_x': 0.494, 'center_y': 0.47}
-
-
-class Level1GameWidget(RelativeLayout):
-    def __init__(self, **kwargs):
+        # fades in when the screen shows up
+        self.opacity = 0
+        animator.add(Tween.attribute(self, 'opacity', 1, 0.6, easing=ease_out))
+
+
+class LevelGameWidget(RelativeLayout):
+    # Shared renderer for the three levels. All the game rules live in simulation.World,
+    # this widget only draws the world, forwards keyboard input and plays sounds.
+    level = 1
+    background_source = ''
+    enemy_source = ''
+    # name of the global holding the score we start from (None means a fresh 10000)
+    previous_score = None
+    # name of the global where the final score of this level is stored
+    final_score = ''
+    next_screen = ''
+    # simulation steps per second, the screen is redrawn at its own rate (see maxfps)
+    tick_rate = TICK_RATE
+    # what every level draws and plays besides its background and enemy
+    images = ("block.JPEG", "perpetio.jpg", "bullet.png", "cupcake.png", "tank.png", "cannon_new.png")
+    hit_sound = './music/explosion.mp3'
+    sounds = (hit_sound,)
+    # shows and hides the frame time overlay
+    profile_key = 'f3'
+    # frames between two refreshes of the overlay
+    profile_refresh = 15
+    # replays only: key -> seconds to jump by
+    seek_keys = {'left': -5, 'right': 5}
+
+    @classmethod
+    def preload(cls):
+        # start decoding this level's assets in the background
+        preloader.preload(images=(cls.background_source, cls.enemy_source) + cls.images, sounds=cls.sounds)
+
+    # Lifecycle: load() builds the world and its drawing, start() runs the game loop and takes the
+    # keyboard, pause() freezes both, stop() also ends the music, dispose() drops everything.
+    # A disposed widget can be loaded again, so every level screen reuses a single instance.
+    # Every session is recorded to replays/; given a Recording instead, the widget plays it back.
+    def __init__(self, replay=None, **kwargs):
         super().__init__(**kwargs)
-        # Set the initial score to 10000 and create a global variable to store the final score
-        global final_score_1
-        self.score = 10000
-        # After 20 seconds, we call the function to start deducing points
-        Clock.schedule_once(self.start_deducing_points, 20)
-        # Handle keyboard input
-        self._keyboard = Window.request_keyboard(self._on_keyboard_closed, self)
-        self._keyboard.bind(on_key_down=self._on_key_down)
-        self._keyboard.bind(on_key_up=self._on_key_up)
-        # Initialize the collision variables as False
-        self.is_colliding = False
-        self.collision_left = False
-        self.collision_right = False
-        self.bullet_colliding = False
-        self.laser_colliding = False
-        self.cupcake_colliding = False
-
-        # Load the sound file for the hit sound
-        self.hit_sound = SoundLoader.load('./music/explosion.mp3')
-    
-        # initialize an empty list to keep track of all different rocks
-        self.rocks = []
-        # Call the functions to create the horizontal and vertical rock walls
-        self.create_horizontal_wall()
-        self.create_rock_wall(Window.width * 0.5)
-        self.create_rock_wall(Window.width * 0.55)
-
-        # Background image, the one that must come on before all the rest
-        with self.canvas.before:
-            self.background = Rectangle(source="./img/back_1.jpeg", pos=(0, 0), size=(Window.width, Window.height))
+        # Clock events and keyboard, only held while the level is running
+        self.events = []
+        self._keyboard = None
+        # True until start() and after pause(), the level's animations hold still meanwhile
+        self.paused = True
+        self.world = None
+        self.replay = replay
+        self.playback = None
+        self.recorder = None
+        # a FrameProfiler while the overlay is shown, the game isn't timed otherwise
+        self.profiler = None
+        self.profile_overlay = None
+        # see sleep()
+        self.asleep = False
+        self.asleep_since = 0.0
+        self.sleep_timed = False
+        self.load()
+
+    def load(self):
+        if self.replay is not None:
+            # the player owns the world and feeds it the recorded keys
+            if self.playback is None:
+                self.playback = Player(self.replay)
+            self.world = self.playback.world
+            seed = self.replay.seed
+            tick_rate = self.replay.tick_rate
+        else:
+            score = globals().get(self.previous_score, 10000) if self.previous_score else 10000
+            # the world also owns every game timer (the 20 seconds before points start going down,
+            # mirror cooldowns...), they all run on its timer wheel as it steps
+            self.world = LEVELS[self.level](Window.width, Window.height, score)
+            seed = random.getrandbits(32)
+            tick_rate = self.tick_rate
+            self.recorder = Recorder(self.level, seed, score, tick_rate)
+
+        # Load the hit sound, usually the preloader already did
+        audio.load(self.hit_sound)
+
+        # Background image, the one that must come on before all the rest. It has a group of its own in
+        # canvas.before, which also holds the RelativeLayout's PushMatrix and Translate, so dispose() can take it out alone
+        self.background = Rectangle(texture=preloader.texture(self.background_source), pos=(0, 0), size=(Window.width, Window.height))
+        self.background_group = InstructionGroup()
+        self.background_group.add(self.background)
+        self.canvas.before.add(self.background_group)
+
+        # one mesh per block texture instead of a widget per block
+        vertices = self.world.vertices
+        self.walls = [WallRenderer("block.JPEG", self.world.rocks, vertices.get('rocks')),
+                      WallRenderer("perpetio.jpg", self.world.perpetios, vertices.get('perpetios'))]
+        for wall in self.walls:
+            self.add_widget(wall)
 
         # Create the enemy
         with self.canvas:
-            self.enemy = Rectangle(source="./img/winnie.png", pos=(Window.width/1.5, Window.height/18), size=(100, 200))
+            enemy = self.world.enemy
+            self.enemy = Rectangle(texture=preloader.texture(self.enemy_source), pos=enemy.pos, size=enemy.size)
 
-        # create a vertical mirror in a specific position of the screen
-        self.second_mirror_pos = (Window.width/2.5, Window.height/9.4)
-        self.second_vertical_mirror = VerticalMirror(pos=self.second_mirror_pos)
-        self.add_widget(self.second_vertical_mirror)
+        for mirror in self.world.mirrors:
+            if mirror.vertical:
+                self.add_widget(VerticalMirror(pos=mirror.body.pos))
 
-        # Create the vertical mirror
-        self.verticalmirror = VerticalMirror()
-        self.add_widget(self.verticalmirror)
+        if self.world.wormhole is not None:
+            wormhole = self.world.wormhole
+            self.wormhole = Wormhole(front_pos=wormhole.front.pos, front_size=wormhole.front.size, front_image=sprites.source('rear.png'),
+                                     rear_pos=wormhole.rear.pos, rear_size=wormhole.rear.size, rear_image=sprites.source('front.png'))
+            self.add_widget(self.wormhole)
 
         # Add the music button
         self.music_button = Music_button()
         self.add_widget(self.music_button)
 
         with self.canvas:
-
-            # the player rectangle
-            sizex = Window.width / 15
-            sizey = Window.height/15
-            posx = Window.width / 30
-            posy = Window.height / 15
+            player = self.world.player
             Color(1, 1, 1, 1)
 
             # creation of the rotating cannon
             PushMatrix()  # avoids player's rotation
-            cannon_base_x = posx + sizex / 2
-            cannon_base_y = posy + sizey / 2
-            self.cannon_size = ((sizex/1.35)/4.5, sizey)
-            self.cannon_translation = Translate(cannon_base_x, cannon_base_y)
+            self.cannon_size = self.world.cannon_size
+            self.cannon_translation = Translate(player.x + player.w / 2, player.y + player.h / 2)
             self.cannon_rotation = Rotate(origin=(0, self.cannon_size[1] / 4))
 
-            self.cannon = Rectangle(source="./img/cannon_new.png", pos=(-self.cannon_size[0] / 2, self.cannon_size[1] / 4), size=self.cannon_size)
+            self.cannon = Rectangle(texture=preloader.texture("cannon_new.png"), pos=(-self.cannon_size[0] / 2, self.cannon_size[1] / 4), size=self.cannon_size)
             PopMatrix()
 
-            self.player = Rectangle(source="./img/tank.png", pos=(posx, posy), size=(sizex, sizey))
+            self.player = Rectangle(texture=preloader.texture("tank.png"), pos=player.pos, size=player.size)
 
         # Add widgets for all other game elements
-        self.bullet = Bullet()
-        self.add_widget(self.bullet)
-        
-        self.cupcake = Cupcake()
-        self.add_widget(self.cupcake)
+        for mirror in self.world.mirrors:
+            if not mirror.vertical:
+                self.add_widget(Mirror(pos=mirror.body.pos))
 
-        self.mirror = Mirror()
-        self.add_widget(self.mirror)
-
-        self.score_display = ScoreDisplay(self.score)
+        self.score_display = ScoreDisplay(self.world.score)
         self.add_widget(self.score_display)
+        self.shown_score = self.world.score
 
         self.powerbar = PowerBar()
         self.add_widget(self.powerbar)
 
-        self.laser = Laser()
-        self.add_widget(self.laser)
-
-        self.keyPressed = set()
-        Clock.schedule_interval(self.update, 0)
-        Clock.schedule_interval(self.laser.update_color, 0)
-
-        # Initialize the variables for the bullet, laser and cupcake
-        self.bullet_active = False
-        self.laser_active = False
-        self.cupcake_active = False
-
-    def start_deducing_points(self, dt):
-        # Display warning message
-        self.warning_label = Label(text="HURRY UP! From now on, you'll lose 10 points per second.",
-                                    font_name = './Minecraft.ttf', font_size='20sp', color = (1, 0, 0, 1),
-                                    size_hint=(None, None), size=(400, 100),
-                                    pos=(Window.width / 2 - 200, Window.height - 300))
-        self.add_widget(self.warning_label)
-
-        # Schedule the removal of the warning message after 4 seconds
-        Clock.schedule_once(self.remove_warning_message, 4)
-        Clock.schedule_interval(self.deduce_points, 1)
-
-    # define a function to remove the warning message, as the callback function for Clock schedule must
-    # accept at least one argument (dt, delta time), so passing the function direcly would execute it
-    # immediately
-    def remove_warning_message(self, dt):
-        self.remove_widget(self.warning_label)
-
-    def deduce_points(self, dt):
-        # Deduct 10 points from the score every second
-        if self.score > 0:
-            self.score -= 10
-            self.update_score(self.score)
-        else:
-            # once we reach <=0 points, we stop deducing
-            Clock.unschedule(self.deduce_points)
-
-    def update_score(self, new_score):
-        # Update the score and the score display, needs to be called every time the score changes
-        self.score = new_score
-        self.score_display.update_score(new_score)
-
-    def create_rock_wall(self, x_position):
-        num_rocks = 10  # Number of rocks in the wall
-        rock_height = Window.height / 20 
-        starting_y = (Window.height - num_rocks * rock_height) / 2  # Starting y position of the first rock
-        rock_x = x_position
-
-        # Moves the rocks down a little bit, as to align them to the floor's surface
-        starting_y -= 3.3 * rock_height
-
-        # Generate positions for all rocks: x is fixed, y is calculated based on the rock height
-        rock_positions = [(rock_x, starting_y + i * rock_height) for i in range(num_rocks)]
-
-        # for each position, create a rock and add it to the list of rocks (needed for further management)
-        for position in rock_positions:
-            rock = Rock(pos=position)
-            self.add_widget(rock)
-            self.rocks.append(rock)
-
-    def create_horizontal_wall(self):
-        num_rocks = 10  # Number of rocks in the wall
-        rock_width = Window.width / num_rocks  # Calculate each rock's width based on the screen width
-        rock_y = Window.height * 0.5  # Fixed y position for the horizontal wall
-
-        # Generate positions for all rocks in the horizontal wall, and the rest is the same as the vertical wall
-        rock_positions = [(i * rock_width, rock_y) for i in range(num_rocks)]
-
-        for position in rock_positions:
-            rock = Rock(pos=position)
-            self.add_widget(rock)
-            self.rocks.append(rock)
-
-    def activate_bullet(self):
-        # if the bullet isn't active, we can activate it
-        if not self.bullet_active:
-            self.bullet_active = True
-            # each time the bullet is active, we deduct 100 points and update the score
-            self.score -= 100
-            self.update_score(self.score)
-            # define mass, velocity
-            self.bullet_mass = 1.5
-            self.bullet_velocity = math.sqrt(400*2*self.powerbar.powerbar.size[0]/self.bullet_mass)
-            # the starting time will be needed later to calculate the bullet's trajectory
-            self.bullet_start_time = Clock.get_boottime()
-            # calculate the cannon tip position
-            cannon_tip_x = self.player.pos[0] + self.player.size[0]/2 
-            cannon_tip_y = self.player.pos[1] + self.player.size[1]/2 + self.cannon.size[0]/2
-            # establishing bullet starting position, based on the cannon tip position, rotation angle and size
-            self.bullet.set_pos(-self.cannon.size[0]/2 + cannon_tip_x + self.cannon.size[1]* math.cos(math.radians((self.cannon_rotation.angle)+90)), 
-                                cannon_tip_y+ self.cannon.size[1]* math.sin(math.radians((self.cannon_rotation.angle)+90)))
-
-            # calculate velocity components based on bullet velocity and cannon angle
-            self.bullet_velocity_x = self.bullet_velocity * math.cos(math.radians((self.cannon_rotation.angle)+90))
-            self.bullet_velocity_y = self.bullet_velocity * math.sin(math.radians((self.cannon_rotation.angle)+90))
-
-    def activate_laser(self):
-        # if the laser isn't already active, we activate it
-        if not self.laser_active:
-            self.laser_active = True
-            # score deducted and updated
-            self.score -= 100
-            self.update_score(self.score)
-            # start time for the laser, needed for trajectory calculation
-            self.laser_start_time = Clock.get_boottime()
-            # define cannon tip position
-            cannon_tip_x = self.player.pos[0] + self.player.size[0]/2 
-            cannon_tip_y = self.player.pos[1] + self.player.size[1]/2 + self.cannon.size[0]/2
-            # set laser position based on cannon tip position, size and rotation angle
-            self.laser.set_pos_laser(0,0)
-            self.laser.set_trans_laser(cannon_tip_x + self.cannon.size[1]* math.cos(math.radians((self.cannon_rotation.angle)+90)), 
-                                       cannon_tip_y+ self.cannon.size[1]* math.sin(math.radians((self.cannon_rotation.angle)+90)))
-            self.laser.set_rotation(self.cannon_rotation.angle + 90)
-            self.laser_velocity_x = 1500 * math.cos(math.radians((self.cannon_rotation.angle)+90))
-            self.laser_velocity_y = 1500 * math.sin(math.radians((self.cannon_rotation.angle)+90))
-
-    def activate_cupcake(self):
-        # very similar, if not pretty much the same as the bullet activation
-        if not self.cupcake_active:
-            self.score -= 200
-            self.update_score(self.score)
-            self.cupcake_active = True
-            self.cupcake_mass = 3
-            self.cupcake_velocity = math.sqrt(400*2*self.powerbar.powerbar.size[0]/self.cupcake_mass)
-            self.cupcake_start_time = Clock.get_boottime()
-            cannon_tip_x = self.player.pos[0] + self.player.size[0]/2 
-            cannon_tip_y = self.player.pos[1] + self.player.size[1]/2 + self.cannon.size[0]/2
-            self.cupcake.set_pos(-self.cannon.size[0]/2 + cannon_tip_x + self.cannon.size[1]* math.cos(math.radians((self.cannon_rotation.angle)+90)), 
-                              cannon_tip_y+ self.cannon.size[1]* math.sin(math.radians((self.cannon_rotation.angle)+90)))
-            self.cupcake_velocity_x  = self.cupcake_velocity * math.cos(math.radians((self.cannon_rotation.angle)+90))
-            self.cupcake_velocity_y = self.cupcake_velocity * math.sin(math.radians((self.cannon_rotation.angle)+90))
-
-    def _on_keyboard_closed(self):
-        # Unbind keyboard events when the keyboard is closed
-        self._keyboard.unbind(on_key_down=self._on_key_down)
-        self._keyboard.unbind(on_key_up=self._on_key_up)
-        self._keyboard = None
-
-    def _on_key_down(self, keyboard, keycode, text, modifiers):
-        # handle key press events
-        self.keyPressed.add(text)
-        # pressing space will result in bullet activation
-        if keycode[1] == 'spacebar' and not self.bullet_active:
-            self.activate_bullet()
-        # l laser activation
-        if keycode[1] == "l" and not self.laser_active:
-            self.activate_laser()
-        # k cupcake activation
-        if keycode[1] == "k" and not self.cupcake_active:
-            self.activate_cupcake()
-
-    def _on_key_up(self, keyboard, keycode):
-        # handle key release events, by removing released key from the set
-        text = keycode[1]
-        if text in self.keyPressed:
-            self.keyPressed.remove(text)
-
-    def hide_enemy(self):
-        # used when the enemy is hit by a bullet, laser or cupcake
-        self.music_button.stop_music() # Stop the music
-        self.enemy.pos = (-1000, -1000)  # Move the enemy off-screen
-        Clock.schedule_once(self.transition_to_intermediate, 1)
-        global final_score_1 # Set the final score to the current score
-        final_score_1 = self.score 
-
-    def transition_to_intermediate(self, dt):
-        # Transition to the intermediate screen, this function is needed because 
-        # we can't change screens directly 
-        screen_manager = self.parent.manager
-        screen_manager.current = 'intermediate' 
-
-    def reflect_laser(self, vertical):
-        # Calculate reflection based on the mirror's orientation
-        if vertical:
-            # Reflect the laser's x velocity
-            self.laser_velocity_x *= -1
-        else:
-            # Reflect the laser's y velocity
-            self.laser_velocity_y *= -1
-
-        # Adjust laser rotation based on new velocity vector
-        new_angle = math.atan2(self.laser_velocity_y, self.laser_velocity_x)
-        self.laser.set_rotation(math.degrees(new_angle))
-
-        # Optionally, move the laser slightly off the mirror to prevent immediate recollision
-        offset_distance = 5
-        self.laser.laser_translation.x += offset_distance if vertical else 0
-        self.laser.laser_translation.y += offset_distance if not vertical else 0
-
-    # Update function to handle game logic
-    def update(self, dt):
-
-        # Check for collision with rocks
-        for rock in self.rocks:
-            if collides((self.bullet.ellipse.pos, self.bullet.ellipse.size), (rock.rect.pos, rock.rect.size)):
-                self.bullet_colliding = True
-                self.rocks.remove(rock)
-                self.remove_widget(rock)
-                if self.hit_sound:
-                    # make sure that the previous sound has stopped before playing a new one
-                    self.hit_sound.stop()
-                    self.hit_sound.play()
-                break 
-            
-        for rock in self.rocks:  # Iterate over a copy of the rocks list
-            if collides((self.cupcake.ellipse.pos, self.cupcake.ellipse.size), (rock.rect.pos, rock.rect.size)):
-                self.cupcake_colliding = True
-                affected_rocks = [rock]  # Start with the initially collided rock
-
-                # Find other rocks within the specified radius
-                for other_rock in self.rocks:
-                    # i had to use a higher radius for the cupcake to work properly, using 1000/50 didn't affect any other rocks 
-                    # so it became pretty much useless
-                    if other_rock is not rock and distance(rock.rect.pos, other_rock.rect.pos) <= 1000 / 25:
-                        affected_rocks.append(other_rock)
-
-                # Apply effects to all affected rocks
-                for affected_rock in affected_rocks:
-                    if affected_rock in self.rocks:  # Double-check to avoid errors
-                        self.rocks.remove(affected_rock)
-                        self.remove_widget(affected_rock)
-
-                if self.hit_sound:
-                    self.hit_sound.stop()
-                    self.hit_sound.play()
-                break  # Break after handling the cupcake collision
-
-        # Check for collision with the mirror
-        if collides(((self.laser.laser_translation.x, self.laser.laser_translation.y), self.laser.laser.size), (self.enemy.pos, self.enemy.size)):
-            self.laser_colliding = True
-            self.hide_enemy()  # Hides the enemy
-
-        # Check for bullet collision with the enemy
-        if collides((self.bullet.ellipse.pos, self.bullet.ellipse.size), (self.enemy.pos, self.enemy.size)):
-            self.bullet_colliding = True
-            self.hide_enemy()  # Hides remove the enemy
-
-        if collides((self.cupcake.ellipse.pos, self.cupcake.ellipse.size), (self.enemy.pos, self.enemy.size)):
-            self.cupcake_colliding = True
-            self.hide_enemy()  # Hides remove the enemy
-        
-        # Check for collision with vertical mirror
-        if not self.verticalmirror.cooldown and collides(((self.laser.laser_translation.x, self.laser.laser_translation.y), self.laser.laser.size), (self.verticalmirror.verticalmirror.pos, self.verticalmirror.verticalmirror.size)):
-            # if the mirror isn't on cooldown, we reflect the laser and start the cooldown
-            self.reflect_laser(vertical=True)
-            self.verticalmirror.start_cooldown()  # Start cooldown for vertical mirror
-        
-        if not self.second_vertical_mirror.cooldown and collides(((self.laser.laser_translation.x, self.laser.laser_translation.y), self.laser.laser.size), (self.second_vertical_mirror.verticalmirror.pos, self.second_vertical_mirror.verticalmirror.size)):
-            self.reflect_laser(vertical=True)
-            self.second_vertical_mirror.start_cooldown()  # Start cooldown for vertical mirror
-
-        # Check for collision with horizontal mirror
-        if not self.mirror.cooldown and collides(((self.laser.laser_translation.x, self.laser.laser_translation.y), self.laser.laser.size), (self.mirror.mirror.pos, self.mirror.mirror.size)):
-            self.reflect_laser(vertical=False)
-            self.mirror.start_cooldown()  # Start cooldown for horizontal mirror
-
-        # Check for collision with the player, and set the collision variables accordingly
-        if collides(((self.laser.laser_translation.x, self.laser.laser_translation.y) ,self.laser.laser.size),(self.enemy.pos,self.enemy.size)):
-            self.laser_colliding = True 
-
-        if collides((self.bullet.ellipse.pos, self.bullet.ellipse.size),(self.enemy.pos, self.enemy.size)):
-            self.bullet_colliding = True
-        
-        if collides((self.cupcake.ellipse.pos, self.cupcake.ellipse.size),(self.enemy.pos, self.enemy.size)):
-            self.bomb_colliding = True
-
-        if collides((self.player.pos, self.player.size), (self.enemy.pos, self.enemy.size)):
-            self.is_colliding = True
-        else:
-            self.is_colliding = False         
-        
-        # Check for collision with the walls
-        if not self.is_colliding:
-            self.collision_left = False
-            self.collision_right = False
-
-        if self.is_colliding and (self.player.pos[0]<self.enemy.pos[0]):
-            self.collision_right = True
-
-        if self.is_colliding and (self.player.pos[0]>self.enemy.pos[0]):
-            self.collision_left = True
-
-        step_size = Window.width/8 * dt  # Movement speed
-        rotation_speed = 45 * dt  # Rotation speed
-
-        # Player movement and updating of cannon rotation
-        if "a" in self.keyPressed and not self.collision_left:
-            # Not allowed to go off-screen (on the left)
-            new_x = max(self.player.pos[0] - step_size, 0)
-            self.player.pos = (new_x, self.player.pos[1])
-
-        if "d" in self.keyPressed and not self.collision_right:
-            max_x = (Window.width/3) - self.player.size[0]
-            # Not allowed to go off-screen (on the right)
-            new_x = min(self.player.pos[0] + step_size, max_x)
-            self.player.pos = (new_x, self.player.pos[1])
-
-        # Updating cannon's position
-        self.cannon_translation.x = self.player.pos[0] + self.player.size[0] / 2 
-        self.cannon_translation.y = self.player.pos[1] + self.player.size[1] / 2
-
-        # Cannon rotation
-        if "w" in self.keyPressed:
-            if self.cannon_rotation.angle + rotation_speed <= 90:  # Limit to more than +90 degrees
-                self.cannon_rotation.angle += rotation_speed
-        if "s" in self.keyPressed:
-            if self.cannon_rotation.angle - rotation_speed >= -90:  # Limit to less than 90 degrees
-                self.cannon_rotation.angle -= rotation_speed
-
-        # Powerbar logic
-        if "p" in self.keyPressed and not self.bullet_active:
-            if self.powerbar.powerbar.size[0] <= 600:
-                self.powerbar.powerbar.size = (self.powerbar.powerbar.size[0] + 5, self.powerbar.powerbar.size[1])
-        
-        if "o" in self.keyPressed and not self.bullet_active:
-            if self.powerbar.powerbar.size[0] >= 100:
-                self.powerbar.powerbar.size = (self.powerbar.powerbar.size[0] - 5, self.powerbar.powerbar.size[1])
-
-        if self.bullet_active:
-            # Calculate the bullet's trajectory based on the time since it has been activated
-            time_elapsed = Clock.get_boottime() - self.bullet_start_time
-            x = self.bullet.ellipse.pos[0] + self.bullet_velocity_x * dt
-            # y = x0 + v0y * t - 0.5 * g * t^2
-            y = self.bullet.ellipse.pos[1] + self.bullet_velocity_y * dt - (0.5 * 9.8 * time_elapsed ** 2)
-            self.bullet.set_pos(x, y)
-
-            # Deactivate the bullet if it goes out of the window
-            if x > Window.width or y < Window.height/15 or x < 0 or self.bullet_colliding:
-                self.bullet_active = False
-                self.bullet.set_pos(x, 3000)
-                self.bullet_colliding = False
-
-        if self.laser_active:
-            # Calculate the laser's trajectory
-            x = self.laser.laser_translation.x + self.laser_velocity_x * dt
-            y = self.laser.laser_translation.y + self.laser_velocity_y * dt
-            # Update the laser's position and rotation
-            self.laser.set_trans_laser(x, y)
-            self.laser.laser_rotation = self.laser.laser_rotation
-
-            # Deactivate the laser if it goes out of the window
-            if x > Window.width or y < Window.height/15 or y> Window.height or x < 0 or self.laser_colliding:
-                self.laser_active = False
-                self.laser.set_trans_laser(0, 3000)
-                self.laser_colliding = False
-
-        if self.cupcake_active:
-            # Calculate the cupcake's trajectory (very similar to the bullet)
-            time_elapsed = Clock.get_boottime() - self.cupcake_start_time
-            x = self.cupcake.ellipse.pos[0] + self.cupcake_velocity_x * dt
-            y = self.cupcake.ellipse.pos[1] + self.cupcake_velocity_y * dt - (0.5 * 9.8 * time_elapsed ** 2)
-            self.cupcake.set_pos(x, y)
-
-            # DEACTIVATE BOMB if it goes out of the window
-            if x > Window.width or y < Window.height/15 or x < 0 or self.cupcake_colliding:
-                self.cupcake_active = False
-                self.cupcake.set_pos(x, 3000)
-                self.cupcake_colliding = False
-
-
-class Level2GameWidget(RelativeLayout):
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        global final_score_1
-        self.score = final_score_1
-        # define a second global variable to store the final score of this level
-        global final_score_2
-        # same premises as level 1
-        Clock.schedule_once(self.start_deducing_points, 20)
+        # every projectile in flight is drawn by this one widget
+        self.projectile_renderer = ProjectileRenderer(self.world.projectiles, random.Random(seed),
+                                                      active=lambda: not self.paused)
+        self.add_widget(self.projectile_renderer)
+
+        # the world is stepped at a fixed rate, frames draw in between two steps
+        self.loop = FixedStepLoop(self.step, tick_rate)
+        # timers of this widget (warning label, screen change), kept apart from the world's so
+        # that the world can be copied for replay keyframes without dragging the widget along
+        self.ui_timers = TimerWheel()
+        if self.playback is not None:
+            self.loop.ticks = self.playback.tick
+        self.previous_player_x = self.world.player.x
+        self.previous_cannon_angle = self.world.cannon_angle
+        self.sync()
+
+    def start(self):
+        # also resumes after pause()
+        if self.events or self.asleep:
+            return
+        # Handle keyboard input
         self._keyboard = Window.request_keyboard(self._on_keyboard_closed, self)
         self._keyboard.bind(on_key_down=self._on_key_down)
         self._keyboard.bind(on_key_up=self._on_key_up)
-        self.is_colliding = False
-        self.collision_left = False
-        self.collision_right = False
-        self.bullet_colliding = False
-        self.laser_colliding = False
-        self.cupcake_colliding = False
-        
-        # Load the sound file for the hit sound
-        self.hit_sound = SoundLoader.load('./music/explosion.mp3')
-    
-        # initialize an empty list to keep track of all different rocks
-        self.rocks = []
-        self.create_rock_wall()
-        self.create_second_rock_wall()
-        self.create_horizontal_wall(Window.height * 0.5, Window.width * 0.6, Window.width * 0.8)
-        
-        self.music_button = Music_button()
-        self.add_widget(self.music_button)
-
-        # Background image, the one that must come on before all the rest
-        with self.canvas.before:
-            self.background = Rectangle(source="./img/back_2.jpeg", pos=(0, 0), size=(Window.width, Window.height))
-
-        with self.canvas:
-            # define the enemy
-            self.enemy = Rectangle(source="./img/ihoh.png", pos=(Window.width/1.5, Window.height/18), size=(120, 200))
-
-        with self.canvas:
-            sizex = Window.width / 15
-            sizey = Window.height/15
-            posx = Window.width / 30
-            posy = Window.height / 15
-            Color(1, 1, 1, 1)
-
-            PushMatrix() 
-            cannon_base_x = posx + sizex / 2
-            cannon_base_y = posy + sizey / 2
-            self.cannon_size = ((sizex/1.35)/4.5, sizey)
-            self.cannon_translation = Translate(cannon_base_x, cannon_base_y)
-            self.cannon_rotation = Rotate(origin=(0, self.cannon_size[1] / 4))
-
-            self.cannon = Rectangle(source="./img/cannon_new.png", pos=(-self.cannon_size[0] / 2, self.cannon_size[1] / 4), size=self.cannon_size)
-            PopMatrix()
-
-            self.player = Rectangle(source="./img/tank.png", pos=(posx, posy), size=(sizex, sizey))
-
-        self.bullet = Bullet()
-        self.add_widget(self.bullet)
-
-        self.second_mirror_pos = (Window.width/2.3, Window.height/9.4)
-        self.second_vertical_mirror = VerticalMirror(pos=self.second_mirror_pos)
-        self.add_widget(self.second_vertical_mirror)
-
-        self.cupcake = Cupcake()
-        self.add_widget(self.cupcake)
-
-        self.powerbar = PowerBar()
-        self.add_widget(self.powerbar)   # spostare sopra per carro rgb
-
-        self.laser = Laser()
-        self.add_widget(self.laser)
-
-        self.score_display = ScoreDisplay(self.score)
-        self.add_widget(self.score_display)
-
-        # The wormhole is created here, with the front and rear parts being defined directly
-        self.wormhole = Wormhole(front_pos=(Window.width/2, Window.height/2), front_size=(100, 200), front_image='./img/rear.png',
-                    rear_pos=(Window.width/3, Window.height/4), rear_size=(100, 200), rear_image='./img/front.png')
-        self.add_widget(self.wormhole)
-
-        self.keyPressed = set()
-        Clock.schedule_interval(self.update, 0)
-        Clock.schedule_interval(self.laser.update_color, 0)
-
-        self.bullet_active = False
-        self.laser_active = False
-        self.cupcake_active = False
-
-    def create_rock_wall(self):
-        num_rocks = 10  # Number of rocks in the wall
-        rock_height = Window.height / 20 
-        starting_y = (Window.height - num_rocks * rock_height) / 2  # Starting y position of the first rock
-        rock_x = Window.width * 0.5
-
-        # Moves the rocks down a little bit, as to align them to the floor's surface
-        starting_y -= 3.3 * rock_height
-
-        # Generate positions for all rocks: x is fixed, y is calculated based on the rock height
-        rock_positions = [(rock_x, starting_y + i * rock_height) for i in range(num_rocks)]
-
-        # for each position, create a rock and add it to the list of rocks (needed for further management)
-        for position in rock_positions:
-            rock = Rock(pos=position)
-            self.add_widget(rock)
-            self.rocks.append(rock)
-    
-    def create_horizontal_wall(self, y_position, x_start, x_end):
-        rock_width = Window.width / 20  # Calculate each rock's width based on the screen width
-        rock_y = y_position  # Use the passed y_position for the wall's vertical position
-
-        # Calculate the number of rocks based on the specified start and end points
-        num_rocks = int((x_end - x_start) / rock_width)
-
-        # Generate positions for all rocks in the horizontal wall, starting from x_start
-        rock_positions = [(x_start + i * rock_width, rock_y) for i in range(num_rocks)]
-
-        # Use map to apply add_rock to each position
-        for position in rock_positions:
-            rock = Rock(pos=position, size=(rock_width, rock_width))  # Assuming square rocks for simplicity
-            self.add_widget(rock)
-            self.rocks.append(rock)
-
-    def create_second_rock_wall(self):
-        num_rocks = 13  # Number of rocks in the wall
-        rock_height = Window.height / 20 
-        starting_y = (Window.height - num_rocks * rock_height) / 2  # Starting y position of the first rock
-        rock_x = Window.width * 0.3
-        starting_y -= 1.8 * rock_height
-
-        # Generate positions for all rocks
-        rock_positions = [(rock_x, starting_y + i * rock_height) for i in range(num_rocks)]
-
-        for position in rock_positions:
-            rock = Rock(pos=position)
-            self.add_widget(rock)
-            self.rocks.append(rock)
-
-    def teleport_bullet(self, bullet, wormhole_part, wormhole):
-        # Calculate the difference between the bullet and the wormhole part
-        diff_x = bullet.ellipse.pos[0] - wormhole_part.pos[0]
-        diff_y = bullet.ellipse.pos[1] - wormhole_part.pos[1]
-
-        # Determine the exit part of the wormhole
-        exit_part = wormhole.front if wormhole_part == wormhole.rear else wormhole.rear
-
-        # Teleport the bullet to the other wormhole part
-        bullet.ellipse.pos = (exit_part.pos[0] + diff_x, exit_part.pos[1] + diff_y)     
-
-    def start_deducing_points(self, dt):
-        # Display warning message
-        self.warning_label = Label(text="HURRY UP! From now on, you'll lose 10 points per second.",
-                                    font_name = './Minecraft.ttf', font_size='20sp', color = (1, 0, 0, 1),
-                                    size_hint=(None, None), size=(400, 100),
-                                    pos=(Window.width / 2 - 200, Window.height - 300))
-        self.add_widget(self.warning_label)
-
-        # Schedule the removal of the warning message after 4 seconds
-        Clock.schedule_once(self.remove_warning_message, 4)
-        Clock.schedule_interval(self.deduce_points, 1)
-
-    def remove_warning_message(self, dt):
-        self.remove_widget(self.warning_label)
-
-    def deduce_points(self, dt):
-        if self.score > 0:
-            self.score -= 10
-            self.update_score(self.score)
-        else:
-            Clock.unschedule(self.deduce_points)
-
-    def update_score(self, new_score):
-        self.score = new_score
-        self.score_display.update_score(new_score)
-
-    def reflect_laser(self, vertical):
-        # Calculate reflection based on the mirror's orientation
-        if vertical:
-            self.laser_velocity_x *= -1
-        else:
-            self.laser_velocity_y *= -1
-
-        # Adjust laser rotation based on new velocity vector
-        new_angle = math.atan2(self.laser_velocity_y, self.laser_velocity_x)
-        self.laser.set_rotation(math.degrees(new_angle))
-
-        # Optionally, move the laser slightly off the mirror to prevent immediate recollision
-        offset_distance = 5 
-        self.laser.laser_translation.x += offset_distance if vertical else 0
-        self.laser.laser_translation.y += offset_distance if not vertical else 0
-
-    def activate_bullet(self):
-        if not self.bullet_active:
-            self.bullet_active = True
-            self.bullet_mass = 1.5
-            self.score -= 100
-            self.update_score(self.score)
-            self.bullet_velocity = math.sqrt(400*2*self.powerbar.powerbar.size[0]/self.bullet_mass)
-            self.bullet_start_time = Clock.get_boottime()
-            cannon_tip_x = self.player.pos[0] + self.player.size[0]/2 
-            cannon_tip_y = self.player.pos[1] + self.player.size[1]/2 + self.cannon.size[0]/2
-            self.bullet.set_pos(-self.cannon.size[0]/2 + cannon_tip_x + self.cannon.size[1]* math.cos(math.radians((self.cannon_rotation.angle)+90)), 
-                                cannon_tip_y+ self.cannon.size[1]* math.sin(math.radians((self.cannon_rotation.angle)+90)))
-            self.bullet_velocity_x = self.bullet_velocity * math.cos(math.radians((self.cannon_rotation.angle)+90))
-            self.bullet_velocity_y = self.bullet_velocity * math.sin(math.radians((self.cannon_rotation.angle)+90))
-
-    def activate_laser(self):
-        if not self.laser_active:
-            self.laser_active = True
-            self.score -= 100
-            self.update_score(self.score)
-            self.laser_start_time = Clock.get_boottime()
-            cannon_tip_x = self.player.pos[0] + self.player.size[0]/2 
-            cannon_tip_y = self.player.pos[1] + self.player.size[1]/2 + self.cannon.size[0]/2
-            self.laser.set_pos_laser(0,0)
-            self.laser.set_trans_laser(cannon_tip_x + self.cannon.size[1]* math.cos(math.radians((self.cannon_rotation.angle)+90)), cannon_tip_y+ self.cannon.size[1]* math.sin(math.radians((self.cannon_rotation.angle)+90)))
-            self.laser.set_rotation(self.cannon_rotation.angle + 90)
-            self.laser_velocity_x = 1500 * math.cos(math.radians((self.cannon_rotation.angle)+90))
-            self.laser_velocity_y = 1500 * math.sin(math.radians((self.cannon_rotation.angle)+90))
-
-    def activate_cupcake(self):
-        if not self.cupcake_active:
-            self.score -= 200
-            self.update_score(self.score)
-            self.cupcake_active = True
-            self.cupcake_mass = 3
-            self.cupcake_velocity = math.sqrt(400*2*self.powerbar.powerbar.size[0]/self.cupcake_mass)
-            self.cupcake_start_time = Clock.get_boottime()
-            cannon_tip_x = self.player.pos[0] + self.player.size[0]/2 
-            cannon_tip_y = self.player.pos[1] + self.player.size[1]/2 + self.cannon.size[0]/2
-            self.cupcake.set_pos(-self.cannon.size[0]/2 + cannon_tip_x + self.cannon.size[1]* math.cos(math.radians((self.cannon_rotation.angle)+90)), 
-                              cannon_tip_y+ self.cannon.size[1]* math.sin(math.radians((self.cannon_rotation.angle)+90)))
-
-            # Calcola le componenti della velocità iniziale basate sull'angolo di inclinazione del cannone
-            self.cupcake_velocity_x  = self.cupcake_velocity * math.cos(math.radians((self.cannon_rotation.angle)+90))
-            self.cupcake_velocity_y = self.cupcake_velocity * math.sin(math.radians((self.cannon_rotation.angle)+90))
-
-    def _on_keyboard_closed(self):
-        self._keyboard.unbind(on_key_down=self._on_key_down)
-        self._keyboard.unbind(on_key_up=self._on_key_up)
-        self._keyboard = None
-
-    def _on_key_down(self, keyboard, keycode, text, modifiers):
-        self.keyPressed.add(text)
-        if keycode[1] == 'spacebar' and not self.laser_active:
-            self.activate_bullet()
-        if keycode[1] == "l" and not self.bullet_active:
-            self.activate_laser()
-        if keycode[1] == "k" and not self.cupcake_active:
-            self.activate_cupcake()
-
-    def _on_key_up(self, keyboard, keycode):
-        text = keycode[1]
-        if text in self.keyPressed:
-            self.keyPressed.remove(text)
-
-    def hide_enemy(self):
+        self.loop.accumulator = 0.0
+        self.paused = False
+        self.schedule_frames()
+
+    def schedule_frames(self):
+        self.events = [Clock.schedule_interval(self.update, 0)]
+
+    def sleep(self):
+        # Nothing moves and no key is held: drop the frame callbacks until a key is pressed
+        # or the next timer (the world's or ours) is due, nothing is stepped or drawn meanwhile
+        for event in self.events:
+            event.cancel()
+        delays = [delay for delay in (self.world.timers.next_delay(), self.ui_timers.next_delay())
+                  if delay is not None]
+        # with no timer pending nothing can happen before a key comes, so that time is just dropped
+        self.sleep_timed = bool(delays)
+        self.events = [Clock.schedule_once(self.wake, min(delays))] if delays else []
+        self.asleep = True
+        self.asleep_since = time.monotonic()
+
+    def wake(self, *args):
+        if not self.asleep:
+            return
+        self.asleep = False
+        for event in self.events:
+            event.cancel()
+        if self.sleep_timed:
+            # the game time went on while we slept: run its steps now, all at once. With nothing
+            # moving they are cheap, and the timers fire on the same steps as if we never slept
+            self.loop.advance(time.monotonic() - self.asleep_since, max_steps=math.inf)
+            self.sync(self.loop.alpha)
+        self.schedule_frames()
+
+    def pause(self):
+        # the world only moves (timers included) when update() runs, so this freezes everything
+        self.wake()
+        for event in self.events:
+            event.cancel()
+        self.events = []
+        self.paused = True
+        if self._keyboard is not None:
+            # calls _on_keyboard_closed, which unbinds our handlers
+            self._keyboard.release()
+        # keys released while we were paused will never send a key up
+        if self.recorder is not None:
+            for key in self.world.keys:
+                self.recorder.key(self.loop.ticks, key, False)
+        if self.playback is None:
+            self.world.keys.clear()
+
+    def stop(self):
+        self.pause()
         self.music_button.stop_music()
-        self.enemy.pos = (-1000, -1000)  # Move the enemy off-screen
-        Clock.schedule_once(self.transition_to_intermediate, 1)
-        global final_score_2
-        final_score_2 = self.score
 
-    def transition_to_intermediate(self, dt):
-        # we adapt this for level 2 as we create a second intermediate screen with the updated score
-        screen_manager = self.parent.manager
-        screen_manager.current = 'intermediate2' 
-
-    # Update function to handle game logic
-    def update(self, dt):
-
-        # In this level, the only mirror we have to check is the vertical one, 
-        # so it's useless to handle collision for the horizontal mirror
-        if not self.second_vertical_mirror.cooldown and collides(((self.laser.laser_translation.x, self.laser.laser_translation.y), self.laser.laser.size), (self.second_vertical_mirror.verticalmirror.pos, self.second_vertical_mirror.verticalmirror.size)):
-            self.reflect_laser(vertical=True)
-            self.second_vertical_mirror.start_cooldown()  # Start cooldown for vertical mirror
-
-        # Check for collision with the front and rear part of the wormhole with the bullet
-        if collides((self.bullet.ellipse.pos, self.bullet.ellipse.size), (self.wormhole.front.pos, self.wormhole.front.size)):
-            self.teleport_bullet(self.bullet, self.wormhole.front, self.wormhole)
-        if collides((self.bullet.ellipse.pos, self.bullet.ellipse.size), (self.wormhole.rear.pos, self.wormhole.rear.size)):
-            self.teleport_bullet(self.bullet, self.wormhole.rear, self.wormhole)
-
-        # The same for the cupcake
-        if collides((self.cupcake.ellipse.pos, self.cupcake.ellipse.size), (self.wormhole.front.pos, self.wormhole.front.size)):
-            self.teleport_bullet(self.cupcake, self.wormhole.front, self.wormhole)
-        if collides((self.cupcake.ellipse.pos, self.cupcake.ellipse.size), (self.wormhole.rear.pos, self.wormhole.rear.size)):
-            self.teleport_bullet(self.cupcake, self.wormhole.rear, self.wormhole)
-
-        # Check for collision with rocks
-        for rock in self.rocks[:]:
-            if collides((self.bullet.ellipse.pos, self.bullet.ellipse.size), (rock.rect.pos, rock.rect.size)):
-                self.bullet_colliding = True
-                self.rocks.remove(rock)
-                self.remove_widget(rock)
-                if self.hit_sound:
-                    # make sure that the previous sound has stopped before playing a new one
-                    self.hit_sound.stop()
-                    self.hit_sound.play()
-                break
-
-        for rock in self.rocks[:]:  # Iterate over a copy of the rocks list
-            if collides((self.cupcake.ellipse.pos, self.cupcake.ellipse.size), (rock.rect.pos, rock.rect.size)):
-                self.cupcake_colliding = True
-                affected_rocks = [rock]  # Start with the initially collided rock
-
-                # Find other rocks within the specified radius
-                for other_rock in self.rocks[:]:  # Use a copy of the list for safe removal
-                    # i had to use a higher radius for the cupcake to work properly, using 1000/50 didn't affect any other rocks 
-                    # so it became pretty much useless
-                    if other_rock is not rock and distance(rock.rect.pos, other_rock.rect.pos) <= 1000 / 25:
-                        affected_rocks.append(other_rock)
-
-                # Apply effects to all affected rocks
-                for affected_rock in affected_rocks:
-                    if affected_rock in self.rocks:  # Double-check to avoid errors
-                        self.rocks.remove(affected_rock)
-                        self.remove_widget(affected_rock)
-
-                if self.hit_sound:
-                    self.hit_sound.stop()
-                    self.hit_sound.play()
-                break  # Break after handling the cupcake collision
-
-        # Check for collision with the enemy
-        if collides(((self.laser.laser_translation.x, self.laser.laser_translation.y), self.laser.laser.size), (self.enemy.pos, self.enemy.size)):
-            self.laser_colliding = True
-            self.hide_enemy()  # Hides the enemy
-
-        # Check for bullet collision with the enemy
-        if collides((self.bullet.ellipse.pos, self.bullet.ellipse.size), (self.enemy.pos, self.enemy.size)):
-            self.bullet_colliding = True
-            self.hide_enemy()  # Hides remove the enemy
-
-        if collides((self.cupcake.ellipse.pos, self.cupcake.ellipse.size), (self.enemy.pos, self.enemy.size)):
-            self.cupcake_colliding = True
-            self.hide_enemy()  # Hides remove the enemy
-
-        # Same as level 1
-        if collides(((self.laser.laser_translation.x, self.laser.laser_translation.y) ,self.laser.laser.size),(self.enemy.pos,self.enemy.size)):
-            self.laser_colliding = True 
-
-        if collides((self.cupcake.ellipse.pos, self.cupcake.ellipse.size),(self.enemy.pos, self.enemy.size)):
-            self.bomb_colliding = True
-
-        if collides((self.bullet.ellipse.pos, self.bullet.ellipse.size),(self.enemy.pos, self.enemy.size)):
-            self.bullet_colliding = True
-
-        if collides((self.player.pos, self.player.size), (self.enemy.pos, self.enemy.size)):
-            self.is_colliding = True
+    def dispose(self):
+        # drop the world, the widgets and the canvas instructions (and so their textures),
+        # load() builds them again
+        if self.world is None:
+            return
+        self.stop()
+        self.save_recording()
+        self.save_profile()
+        animator.remove_owned(self)
+        animator.remove_owned(self.projectile_renderer)
+        self.clear_widgets()
+        self.canvas.clear()
+        self.canvas.before.remove(self.background_group)
+        self.walls = []
+        self.projectile_renderer = None
+        self.world = None
+
+    def reset(self):
+        # start the level over with the same widget
+        self.dispose()
+        self.playback = None
+        self.load()
+
+    def seek(self, seconds):
+        # replays only: jump to that time of the session, from the player's closest keyframe
+        running = bool(self.events)
+        self.playback.seek(seconds)
+        self.dispose()
+        self.load()
+        if running:
+            self.start()
+
+    def save_recording(self):
+        if self.recorder is None:
+            return
+        recording = self.recorder.finish(self.loop.ticks)
+        self.recorder = None
+        if recording.ticks:
+            os.makedirs('replays', exist_ok=True)
+            stamp = time.strftime('%Y%m%d-%H%M%S')
+            recording.save(os.path.join('replays', f'level{self.level}-{stamp}.swr'))
+
+    def toggle_profiler(self):
+        if self.profiler is None:
+            self.profiler = FrameProfiler()
+            self.profile_overlay = ProfileOverlay()
+            self.add_widget(self.profile_overlay)
+            # bound callbacks run before the window's own: on_draw comes right before it draws, on_flip right after
+            Window.bind(on_draw=self.profile_draw, on_flip=self.profile_flip)
         else:
-            self.is_colliding = False         
-
-        if not self.is_colliding:
-            self.collision_left = False
-            self.collision_right = False
-
-        if self.is_colliding and (self.player.pos[0]<self.enemy.pos[0]):
-            self.collision_right = True
-
-        if self.is_colliding and (self.player.pos[0]>self.enemy.pos[0]):
-            self.collision_left = True
-
-        step_size = Window.width/8 * dt  
-        rotation_speed = 45 * dt  
-
-        # Movimento del 'player' e aggiornamento della posizione del 'cannon'
-        if "a" in self.keyPressed and not self.collision_left  :
-            new_x = max(self.player.pos[0] - step_size, 0)  # Non oltrepassare il bordo sinistro
-            self.player.pos = (new_x, self.player.pos[1])
-
-        if "d" in self.keyPressed and not self.collision_right:
-            max_x = (Window.width/3) - self.player.size[0]
-            new_x = min(self.player.pos[0] + step_size, max_x)  # Non oltrepassare il bordo destro
-            self.player.pos = (new_x, self.player.pos[1])
-
-        self.cannon_translation.x = self.player.pos[0] + self.player.size[0] / 2 
-        self.cannon_translation.y = self.player.pos[1] + self.player.size[1] / 2
-
-        if "w" in self.keyPressed:
-            if self.cannon_rotation.angle + rotation_speed <= 90:  # limite superiore a +90 gradi
-                self.cannon_rotation.angle += rotation_speed
-        if "s" in self.keyPressed:
-            if self.cannon_rotation.angle - rotation_speed >= -90:  # limite inferiore a -90 gradi
-                self.cannon_rotation.angle -= rotation_speed
-
-        if "p" in self.keyPressed and not self.bullet_active:
-            if self.powerbar.powerbar.size[0] <= 600:
-                self.powerbar.powerbar.size = (self.powerbar.powerbar.size[0] + 5, self.powerbar.powerbar.size[1])
-
-        if "o" in self.keyPressed and not self.bullet_active:
-            if self.powerbar.powerbar.size[0] >= 100:
-                self.powerbar.powerbar.size = (self.powerbar.powerbar.size[0] - 5, self.powerbar.powerbar.size[1])
-
-        if self.bullet_active:
-            time_elapsed = Clock.get_boottime() - self.bullet_start_time
-            x = self.bullet.ellipse.pos[0] + self.bullet_velocity_x * dt
-            y = self.bullet.ellipse.pos[1] + self.bullet_velocity_y * dt - (0.5 * 9.8 * time_elapsed ** 2)
-            self.bullet.set_pos(x, y)
-
-            # Deactivate the bullet if it goes out of the window
-            if x > Window.width or y < Window.height/15 or x < 0 or self.bullet_colliding:
-                self.bullet_active = False
-                self.bullet.set_pos(x, 3000)
-                self.bullet_colliding = False
-
-        if self.laser_active:
-
-            x = self.laser.laser_translation.x + self.laser_velocity_x * dt
-            y = self.laser.laser_translation.y + self.laser_velocity_y * dt
-            self.laser.set_trans_laser(x, y)
-            self.laser.laser_rotation = self.laser.laser_rotation
-
-            if x > Window.width or y < Window.height/15 or y> Window.height or x < 0 or self.laser_colliding:
-                self.laser_active = False
-                self.laser.set_trans_laser(0, 3000)
-                self.laser_colliding = False
-
-        if self.cupcake_active:
-
-            time_elapsed = Clock.get_boottime() - self.cupcake_start_time
-            x = self.cupcake.ellipse.pos[0] + self.cupcake_velocity_x * dt
-            y = self.cupcake.ellipse.pos[1] + self.cupcake_velocity_y * dt - (0.5 * 9.8 * time_elapsed ** 2)
-            self.cupcake.set_pos(x, y)
-
-            # DEACTIVATE BOMB if it goes out of the window
-            if x > Window.width or y < Window.height/15 or x < 0 or self.cupcake_colliding:
-                self.cupcake_active = False
-                self.cupcake.set_pos(x, 3000)
-                self.cupcake_colliding = False
-
-
-class Level3GameWidget(RelativeLayout):
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        global final_score_2
-        self.score = final_score_2
-        global final_score_3
-        Clock.schedule_once(self.start_deducing_points, 20)
-        self._keyboard = Window.request_keyboard(self._on_keyboard_closed, self)
-        self._keyboard.bind(on_key_down=self._on_key_down)
-        self._keyboard.bind(on_key_up=self._on_key_up)
-        self.is_colliding = False
-        self.collision_left = False
-        self.collision_right = False
-        self.bullet_colliding = False
-        self.laser_colliding = False
-        self.cupcake_colliding = False
-
-        # Load the sound file for the hit sound
-        self.hit_sound = SoundLoader.load('./music/explosion.mp3')
-
-        self.music_button = Music_button()
-        self.add_widget(self.music_button)
-
-        self.second_mirror_pos = (Window.width - 60, Window.height/4)
-        self.second_vertical_mirror = VerticalMirror(pos=self.second_mirror_pos)
-        self.add_widget(self.second_vertical_mirror)
-
-        # Background image, the one that must come on before all the rest
-        with self.canvas.before:
-            self.background = Rectangle(source="./img/back_3.jpeg", pos=(0, 0), size=(Window.width, Window.height))
-
-        with self.canvas:
-            self.enemy = Rectangle(source="./img/tigro.png", pos=(Window.width/1.5, Window.height/18), size=(120, 200))
-
-        with self.canvas:
-
-            sizex = Window.width / 15
-            sizey = Window.height/15
-            posx = Window.width / 30
-            posy = Window.height / 15
-            Color(1, 1, 1, 1)
-
-            PushMatrix()
-            cannon_base_x = posx + sizex / 2
-            cannon_base_y = posy + sizey / 2
-            self.cannon_size = ((sizex/1.35)/4.5, sizey)
-            self.cannon_translation = Translate(cannon_base_x, cannon_base_y)
-            self.cannon_rotation = Rotate(origin=(0, self.cannon_size[1] / 4))
-
-            self.cannon = Rectangle(source="./img/cannon_new.png", pos=(-self.cannon_size[0] / 2, self.cannon_size[1] / 4), size=self.cannon_size)
-            PopMatrix()
-
-            self.player = Rectangle(source="./img/tank.png", pos=(posx, posy), size=(sizex, sizey))
-
-        self.bullet = Bullet()
-        self.add_widget(self.bullet)
-
-        self.cupcake = Cupcake()
-        self.add_widget(self.cupcake)
-
-        # Initialize the vertical and horizontal wall of perpetios
-        self.perpetio = Perpetio()
-        self.perpetios = []
-        self.create_perpetio_wall()
-        self.create_horizontal_wall(Window.height * 0.5, Window.width * 0.5, Window.width * 0.8)
-
-        self.mirror = Mirror()
-        self.add_widget(self.mirror)
-
-        self.powerbar = PowerBar()
-        self.add_widget(self.powerbar)   # spostare sopra per carro rgb
-
-        self.laser = Laser()
-        self.add_widget(self.laser)
-
-        self.score_display = ScoreDisplay(self.score)
-        self.add_widget(self.score_display)
-
-        self.keyPressed = set()
-        Clock.schedule_interval(self.update, 0)
-        Clock.schedule_interval(self.laser.update_color, 0)
-
-        self.bullet_active = False
-        self.laser_active = False
-        self.cupcake_active = False
-
-    # I adapted the method we used for rocks before for the perpetios
-    def create_perpetio_wall(self):
-        num_perpetios = 9  
-        perpetio_height = Window.height / 20 
-        starting_y = (Window.height - num_perpetios * perpetio_height) / 2 
-        perpetio_x = Window.width * 0.5
-
-        starting_y -= 3.3 * perpetio_height
-
-        # Generate positions for all perpetios: x is fixed, y is calculated based on the perpetio height
-        perpetio_positions = [(perpetio_x, starting_y + i * perpetio_height) for i in range(num_perpetios)]
-
-        # for each position, create a perpetio and add it to the list of perpetios (needed for further management)
-        for position in perpetio_positions:
-            perpetio = Perpetio(pos=position)
-            self.add_widget(perpetio)
-            self.perpetios.append(perpetio)
-
-    def create_horizontal_wall(self, y_position, x_start, x_end):
-        perpetio_width = Window.width / 20  # Calculate each rock's width based on the screen width
-        perpetio_y = y_position  # Use the passed y_position for the wall's vertical position
-
-        # Calculate the number of rocks based on the specified start and end points
-        num_perpetios = int((x_end - x_start) / perpetio_width)
-
-        # Generate positions for all rocks in the horizontal wall, starting from x_start
-        perpetio_positions = [(x_start + i * perpetio_width, perpetio_y) for i in range(num_perpetios)]
-
-        # Use map to apply add_rock to each position
-        for position in perpetio_positions:
-            perpetio = Perpetio(pos=position, size=(perpetio_width, perpetio_width))
-            self.add_widget(perpetio)
-            self.perpetios.append(perpetio)
-
-    def start_deducing_points(self, dt):
-        # Display warning message
-        self.warning_label = Label(text="HURRY UP! From now on, you'll lose 10 points per second.",
+            self.remove_widget(self.profile_overlay)
+            Window.unbind(on_draw=self.profile_draw, on_flip=self.profile_flip)
+            self.profiler = self.profile_overlay = None
+
+    def profile_draw(self, *args):
+        # input and the Clock triggers ran since the update, they aren't part of any phase
+        if self.profiler is not None and self.profiler.in_frame:
+            self.profiler.skip()
+
+    def profile_flip(self, *args):
+        # the frame ends once it's drawn, waiting for the screen to flip isn't counted
+        profiler = self.profiler
+        if profiler is None or not profiler.in_frame:
+            return
+        profiler.lap('draw')
+        profiler.end_frame()
+        if profiler.frames % self.profile_refresh == 0:
+            self.profile_overlay.text = profiler.report()
+
+    def save_profile(self):
+        # the frame times of a profiled session go to profiles/ when the level is left
+        if self.profiler is None:
+            return
+        profiler = self.profiler
+        Window.unbind(on_draw=self.profile_draw, on_flip=self.profile_flip)
+        self.profiler = self.profile_overlay = None
+        if profiler.frames:
+            os.makedirs('profiles', exist_ok=True)
+            stamp = time.strftime('%Y%m%d-%H%M%S')
+            profiler.dump(os.path.join('profiles', f'level{self.level}-{stamp}.json'),
+                          level=self.level, tick_rate=round(1 / self.loop.dt))
+
+    def remove_block(self, body):
+        for wall in self.walls:
+            if body in wall:
+                wall.remove_block(body)
+
+    def show_warning_message(self):
+        # Display warning message, the world has just started deducing points
+        self.warning_label = GlyphLabel(text="HURRY UP! From now on, you'll lose 10 points per second.",
                                     font_name = './Minecraft.ttf', font_size='20sp', color = (1, 0, 0, 1),
                                     size_hint=(None, None), size=(400, 100),
                                     pos=(Window.width / 2 - 200, Window.height - 300))
         self.add_widget(self.warning_label)
-        # Schedule the removal of the warning message after 4 seconds
-        Clock.schedule_once(self.remove_warning_message, 4)
-        Clock.schedule_interval(self.deduce_points, 1)
 
-    def remove_warning_message(self, dt):
-        self.remove_widget(self.warning_label)
+        # Schedule the removal of the warning message after 4 seconds, its last one fading out
+        self.ui_timers.schedule(3, self.fade_warning_message)
 
-    def deduce_points(self, dt):
-        if self.score > 0:
-            self.score -= 10
-            self.update_score(self.score)
-        else:
-            Clock.unschedule(self.deduce_points)
+    # the timer callbacks must accept at least one argument (dt, delta time)
+    def fade_warning_message(self, dt):
+        animator.add(Tween.attribute(self.warning_label, 'opacity', 0, 1, active=lambda: not self.paused,
+                                     on_complete=self.remove_warning_message), owner=self)
 
-    def update_score(self, new_score):
-        self.score = new_score
-        self.score_display.update_score(new_score)
-
-    def activate_bullet(self):
-        if not self.bullet_active:
-            self.bullet_active = True
-            self.bullet_mass = 1.5
-            self.score -= 100
-            self.update_score(self.score)
-            self.bullet_velocity = math.sqrt(400*2*self.powerbar.powerbar.size[0]/self.bullet_mass)
-            self.bullet_start_time = Clock.get_boottime()
-            cannon_tip_x = self.player.pos[0] + self.player.size[0]/2 
-            cannon_tip_y = self.player.pos[1] + self.player.size[1]/2 + self.cannon.size[0]/2
-            self.bullet.set_pos(-self.cannon.size[0]/2 + cannon_tip_x + self.cannon.size[1]* math.cos(math.radians((self.cannon_rotation.angle)+90)), cannon_tip_y+ self.cannon.size[1]* math.sin(math.radians((self.cannon_rotation.angle)+90)))
-
-            # Calcola le componenti della velocità iniziale basate sull'angolo di inclinazione del cannone
-            self.bullet_velocity_x = self.bullet_velocity * math.cos(math.radians((self.cannon_rotation.angle)+90))
-            self.bullet_velocity_y = self.bullet_velocity * math.sin(math.radians((self.cannon_rotation.angle)+90))
-            print(cannon_tip_y)
-            print(cannon_tip_x)
-            print(self.player.pos[0])
-            print(self.player.pos[1])
-
-    def activate_laser(self):
-        if not self.laser_active:
-            self.laser_active = True
-            self.score -= 100
-            self.update_score(self.score)
-            self.laser_start_time = Clock.get_boottime()
-            cannon_tip_x = self.player.pos[0] + self.player.size[0]/2 
-            cannon_tip_y = self.player.pos[1] + self.player.size[1]/2 + self.cannon.size[0]/2
-            self.laser.set_pos_laser(0,0)
-            self.laser.set_trans_laser(cannon_tip_x + self.cannon.size[1]* math.cos(math.radians((self.cannon_rotation.angle)+90)), cannon_tip_y+ self.cannon.size[1]* math.sin(math.radians((self.cannon_rotation.angle)+90)))
-            self.laser.set_rotation(self.cannon_rotation.angle + 90)
-            self.laser_velocity_x = 1500 * math.cos(math.radians((self.cannon_rotation.angle)+90))
-            self.laser_velocity_y = 1500 * math.sin(math.radians((self.cannon_rotation.angle)+90))
-
-    def activate_cupcake(self):
-        if not self.cupcake_active:
-            self.score -= 200
-            self.update_score(self.score)
-            self.cupcake_active = True
-            self.cupcake_mass = 3
-            self.cupcake_velocity = math.sqrt(400*2*self.powerbar.powerbar.size[0]/self.cupcake_mass)
-            self.cupcake_start_time = Clock.get_boottime()
-            cannon_tip_x = self.player.pos[0] + self.player.size[0]/2 
-            cannon_tip_y = self.player.pos[1] + self.player.size[1]/2 + self.cannon.size[0]/2
-            self.cupcake.set_pos(-self.cannon.size[0]/2 + cannon_tip_x + self.cannon.size[1]* math.cos(math.radians((self.cannon_rotation.angle)+90)), 
-                              cannon_tip_y+ self.cannon.size[1]* math.sin(math.radians((self.cannon_rotation.angle)+90)))
-            self.cupcake_velocity_x  = self.cupcake_velocity * math.cos(math.radians((self.cannon_rotation.angle)+90))
-            self.cupcake_velocity_y = self.cupcake_velocity * math.sin(math.radians((self.cannon_rotation.angle)+90))
+    def remove_warning_message(self):
+        self.remove_widget(self.warning_label)
 
     def _on_keyboard_closed(self):
-        self._keyboard.unbind(on_key_down=self._on_key_down)
-        self._keyboard.unbind(on_key_up=self._on_key_up)
-        self._keyboard = None
+        # Unbind keyboard events when the keyboard is closed
+        if self._keyboard is not None:
+            self._keyboard.unbind(on_key_down=self._on_key_down)
+            self._keyboard.unbind(on_key_up=self._on_key_up)
+            self._keyboard = None
 
     def _on_key_down(self, keyboard, keycode, text, modifiers):
-        self.keyPressed.add(text)
-        if keycode[1] == 'spacebar' and not self.laser_active:
-            self.activate_bullet()
-        if keycode[1] == "l" and not self.bullet_active:
-            self.activate_laser()
-        if keycode[1] == "k" and not self.cupcake_active:
-            self.activate_cupcake()
+        # before anything else, so the key lands on the right step
+        self.wake()
+        if keycode[1] == self.profile_key:
+            self.toggle_profiler()
+            return
+        # while replaying, the keys come from the recording only, ours move through it
+        if self.playback is not None:
+            if keycode[1] in self.seek_keys:
+                self.seek(self.playback.time + self.seek_keys[keycode[1]])
+            elif keycode[1] == 'home':
+                self.reset()
+                self.start()
+            return
+        # tagged with the steps done so far: the replay presses it right before the next one
+        self.recorder.key(self.loop.ticks, keycode[1], True)
+        # the world decides what a key does: moving, aiming or shooting
+        self.world.key_down(keycode[1])
 
     def _on_key_up(self, keyboard, keycode):
-        text = keycode[1]
-        if text in self.keyPressed:
-            self.keyPressed.remove(text)
-
-    def hide_enemy(self):
-        self.music_button.stop_music()
-        self.enemy.pos = (-1000, -1000)  # Move the enemy off-screen
-        Clock.schedule_once(self.transition_to_leaderboard, 1)
-        global final_score_3
-        final_score_3 = self.score
+        if self.playback is not None:
+            return
+        self.recorder.key(self.loop.ticks, keycode[1], False)
+        self.world.key_up(keycode[1])
+
+    def hide_enemy(self, score):
+        # used when the enemy is hit by a bullet, laser or cupcake. A replay only shows it:
+        # it must not touch the player's progress nor leave the replay screen
+        if self.playback is not None:
+            return
+        self.music_button.stop_music() # Stop the music
+        self.ui_timers.schedule(1, self.transition_to_next)
+        globals()[self.final_score] = score
 
-    def transition_to_leaderboard(self, dt):
+    def transition_to_next(self, dt):
+        # Transition to the next screen, this function is needed because
+        # we can't change screens directly
         screen_manager = self.parent.manager
-        screen_manager.current = 'leaderboard' 
-
-    def reflect_laser(self, vertical):
-        # Calculate reflection based on the mirror's orientation
-        if vertical:
-            self.laser_velocity_x *= -1
-        else:
-            self.laser_velocity_y *= -1
-
-        # Adjust laser rotation based on new velocity vector
-        new_angle = math.atan2(self.laser_velocity_y, self.laser_velocity_x)
-        self.laser.set_rotation(math.degrees(new_angle))
-        
-        # Optionally, move the laser slightly off the mirror to prevent immediate recollision
-        offset_distance = 5  # Adjust as needed
-        self.laser.laser_translation.x += offset_distance if vertical else 0
-        self.laser.laser_translation.y += offset_distance if not vertical else 0
-
-
-    # Update function to handle game logic
+        screen_manager.current = self.next_screen
+
+    def sync(self, alpha=1.0):
+        # copy the world state onto the canvas instructions, alpha of the way from the
+        # state before the last step to the current one
+        world = self.world
+        player_x = lerp(self.previous_player_x, world.player.x, alpha)
+        self.player.pos = (player_x, world.player.y)
+        self.enemy.pos = world.enemy.pos
+        self.cannon_translation.x = player_x + world.player.w / 2
+        self.cannon_translation.y = world.player.y + world.player.h / 2
+        self.cannon_rotation.angle = lerp(self.previous_cannon_angle, world.cannon_angle, alpha)
+        self.powerbar.powerbar.size = (world.power, self.powerbar.powerbar.size[1])
+        self.projectile_renderer.sync(alpha)
+        if world.score != self.shown_score:
+            self.shown_score = world.score
+            self.score_display.update_score(world.score)
+
+    # Update function, called once per rendered frame
     def update(self, dt):
-
-        # same as before, we only have to check for the vertical and horizontal mirror
-        if not self.mirror.cooldown and collides(((self.laser.laser_translation.x, self.laser.laser_translation.y), self.laser.laser.size), (self.mirror.mirror.pos, self.mirror.mirror.size)):
-            self.reflect_laser(vertical=False)
-            self.mirror.start_cooldown()  # Start cooldown for horizontal mirror
-
-        if not self.second_vertical_mirror.cooldown and collides(((self.laser.laser_translation.x, self.laser.laser_translation.y), self.laser.laser.size), (self.second_vertical_mirror.verticalmirror.pos, self.second_vertical_mirror.verticalmirror.size)):
-            self.reflect_laser(vertical=True)
-            self.second_vertical_mirror.start_cooldown()  # Start cooldown for vertical mirror
-
-        # check for collisions with the perpetios stacked in the walls, the same way we used to do for the rocks
-        for perpetio in self.perpetios:
-            if collides((self.bullet.ellipse.pos, self.bullet.ellipse.size), (perpetio.rect.pos, perpetio.rect.size)):
-                # now perpetios aren't removed, but bullet is
-                self.bullet_active = False
-                self.bullet_colliding = True
-                self.bullet.set_pos(self.bullet.ellipse.pos[0], 3000)
-
-            # same for lasers and cupcakes as well
-            if collides(((self.laser.laser_translation.x, self.laser.laser_translation.y), self.laser.laser.size) ,(perpetio.rect.pos, perpetio.rect.size)):
-                self.laser_active = False
-                self.laser_colliding = True
-                self.laser.laser_translation.x = 0
-                self.laser.laser_translation.y = 3000
-
-            if collides((self.cupcake.ellipse.pos, self.cupcake.ellipse.size), (perpetio.rect.pos, perpetio.rect.size)):
-                self.cupcake_active = False
-                self.cupcake_colliding = True
-                self.cupcake.set_pos(self.cupcake.ellipse.pos[0], 3000)
-
-        # Check for collision with the mirror
-        if collides(((self.laser.laser_translation.x, self.laser.laser_translation.y), self.laser.laser.size), (self.enemy.pos, self.enemy.size)):
-            print('laser colliding with enemy')
-            self.laser_colliding = True
-            self.hide_enemy()  # Hides the enemy
-
-        # Check for bullet collision with the enemy
-        if collides((self.bullet.ellipse.pos, self.bullet.ellipse.size), (self.enemy.pos, self.enemy.size)):
-            print('bullet colliding with enemy')
-            self.bullet_colliding = True
-            self.hide_enemy()  # Hides remove the enemy
-
-        if collides((self.cupcake.ellipse.pos, self.cupcake.ellipse.size), (self.enemy.pos, self.enemy.size)):
-            self.cupcake_colliding = True
-            self.hide_enemy()  # Hides remove the enemy
-
-        if collides(((self.laser.laser_translation.x, self.laser.laser_translation.y) ,self.laser.laser.size),(self.enemy.pos,self.enemy.size)):
-            self.laser_colliding = True 
-
-        if collides((self.bullet.ellipse.pos, self.bullet.ellipse.size),(self.enemy.pos, self.enemy.size)):
-            self.bullet_colliding = True
-
-        if collides((self.cupcake.ellipse.pos, self.cupcake.ellipse.size),(self.enemy.pos, self.enemy.size)):
-            self.cupcake_colliding = True
-
-        if collides((self.player.pos, self.player.size), (self.enemy.pos, self.enemy.size)):
-            self.is_colliding = True
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.start_frame()
+        self.loop.advance(dt)
+        self.sync(self.loop.alpha)
+        if profiler is not None:
+            # the frame goes on until the window has drawn it, see profile_flip
+            profiler.lap('sync')
+        # replays are never idle, their keys come from the recording
+        if self.playback is None and self.world.idle():
+            self.sleep()
+
+    def step(self, dt):
+        # one fixed step of the game logic
+        profiler = self.profiler
+        self.previous_player_x = self.world.player.x
+        self.previous_cannon_angle = self.world.cannon_angle
+        self.projectile_renderer.capture()
+        if profiler is not None:
+            profiler.lap('sync')
+        if self.playback is not None:
+            events = self.playback.step(profiler)
         else:
-            self.is_colliding = False         
-
-        if not self.is_colliding:
-            self.collision_left = False
-            self.collision_right = False
-
-        if self.is_colliding and (self.player.pos[0]<self.enemy.pos[0]):
-            self.collision_right = True
-
-        if self.is_colliding and (self.player.pos[0]>self.enemy.pos[0]):
-            self.collision_left = True
-
-        step_size = Window.width/8 * dt
-        rotation_speed = 45 * dt
-
-        if "a" in self.keyPressed and not self.collision_left:
-            new_x = max(self.player.pos[0] - step_size, 0)
-            self.player.pos = (new_x, self.player.pos[1])
-
-        if "d" in self.keyPressed and not self.collision_right:
-            max_x = (Window.width/3) - self.player.size[0]
-            new_x = min(self.player.pos[0] + step_size, max_x)
-            self.player.pos = (new_x, self.player.pos[1])
-
-        self.cannon_translation.x = self.player.pos[0] + self.player.size[0] / 2 
-        self.cannon_translation.y = self.player.pos[1] + self.player.size[1] / 2
-
-        if "w" in self.keyPressed:
-            if self.cannon_rotation.angle + rotation_speed <= 90:
-                self.cannon_rotation.angle += rotation_speed
-        if "s" in self.keyPressed:
-            if self.cannon_rotation.angle - rotation_speed >= -90:
-                self.cannon_rotation.angle -= rotation_speed
-
-        if "p" in self.keyPressed and not self.bullet_active:
-            if self.powerbar.powerbar.size[0] <= 600:
-                self.powerbar.powerbar.size = (self.powerbar.powerbar.size[0] + 5, self.powerbar.powerbar.size[1])
-
-        if "o" in self.keyPressed and not self.bullet_active:
-            if self.powerbar.powerbar.size[0] >= 100:
-                self.powerbar.powerbar.size = (self.powerbar.powerbar.size[0] - 5, self.powerbar.powerbar.size[1])
-
-        if self.bullet_active:
-
-            time_elapsed = Clock.get_boottime() - self.bullet_start_time
-            x = self.bullet.ellipse.pos[0] + self.bullet_velocity_x * dt
-            y = self.bullet.ellipse.pos[1] + self.bullet_velocity_y * dt - (0.5 * 9.8 * time_elapsed ** 2)
-            self.bullet.set_pos(x, y)
-
-            # Deactivate the bullet if it goes out of the window
-            if x > Window.width or y < Window.height/15 or x < 0 or self.bullet_colliding:
-                self.bullet_active = False
-                self.bullet.set_pos(x, 3000)
-                self.bullet_colliding = False
-
-        if self.laser_active:
-
-            x = self.laser.laser_translation.x + self.laser_velocity_x * dt
-            y = self.laser.laser_translation.y + self.laser_velocity_y * dt
-            self.laser.set_trans_laser(x, y)
-            self.laser.laser_rotation = self.laser.laser_rotation
-
-            if x > Window.width or y < Window.height/15 or y> Window.height or x < 0 or self.laser_colliding:
-                self.laser_active = False
-                self.laser.set_trans_laser(0, 3000)
-                self.laser_colliding = False
-
-        if self.cupcake_active:
-
-            time_elapsed = Clock.get_boottime() - self.cupcake_start_time
-            x = self.cupcake.ellipse.pos[0] + self.cupcake_velocity_x * dt
-            y = self.cupcake.ellipse.pos[1] + self.cupcake_velocity_y * dt - (0.5 * 9.8 * time_elapsed ** 2)
-            self.cupcake.set_pos(x, y)
-
-            # DEACTIVATE BOMB if it goes out of the window
-            if x > Window.width or y < Window.height/15 or x < 0 or self.cupcake_colliding:
-                self.cupcake_active = False
-                self.cupcake.set_pos(x, 3000)
-                self.cupcake_colliding = False
+            events = self.world.step(dt, profiler)
+        self.ui_timers.advance(dt)
+        for kind, payload in events:
+            if kind == 'rock_destroyed':
+                self.remove_block(payload)
+            elif kind == 'hit':
+                # several hits in a row overlap on separate voices
+                audio.play(self.hit_sound)
+            elif kind == 'enemy_hit':
+                self.hide_enemy(payload)
+            elif kind == 'hurry_up':
+                self.show_warning_message()
+        if profiler is not None:
+            profiler.lap('events')
+
+
+class Level1GameWidget(LevelGameWidget):
+    level = 1
+    background_source = "back_1.JPEG"
+    enemy_source = "winnie.png"
+    final_score = 'final_score_1'
+    next_screen = 'intermediate'
+
+
+class Level2GameWidget(LevelGameWidget):
+    level = 2
+    background_source = "back_2.JPEG"
+    enemy_source = "ihoh.png"
+    previous_score = 'final_score_1'
+    final_score = 'final_score_2'
+    # we adapt this for level 2 as we create a second intermediate screen with the updated score
+    next_screen = 'intermediate2'
+
+
+class Level3GameWidget(LevelGameWidget):
+    level = 3
+    background_source = "back_3.JPEG"
+    enemy_source = "tigro.png"
+    previous_score = 'final_score_2'
+    final_score = 'final_score_3'
+    next_screen = 'leaderboard'
+
+
+LEVEL_WIDGETS = {1: Level1GameWidget, 2: Level2GameWidget, 3: Level3GameWidget}
 
 
 class StoryScreen(Screen):
     # Displayer for the two story images. The user can go to the next image by clicking on the 'Next' button
     def on_enter(self, *args):
-        self.story_images = ['./img/story1.jpg', './img/story2.jpg']
+        self.story_images = [sprites.source('story1.jpg'), sprites.source('story2.jpg')]
         self.current_image = 0
+        # level 1 comes right after the story, load it while the player reads
+        Level1GameWidget.preload()
+        self.loading_label = Label(font_name='./Minecraft.ttf', font_size='16sp', size_hint=(None, None),
+                                   size=(200, 40), pos=(10, 10))
+        self.loading_event = Clock.schedule_interval(self.show_progress, 0.1)
         self.display_story()
 
+    def on_leave(self, *args):
+        self.loading_event.cancel()
+
+    def show_progress(self, dt):
+        progress = preloader.progress
+        self.loading_label.text = f"Loading {int(progress * 100)}%" if progress < 1 else ""
+
     def display_story(self):
         self.clear_widgets()  # Clear the screen for the new image and button
         if self.current_image < len(self.story_images):
@@ -1669,9 +972,10 @@ class StoryScreen(Screen):
             self.add_widget(img)  # Display the current image
 
             # Create a 'Next' button to go to the next image
-            next_button = ImageButton(source='./img/next.jpeg', size_hint=(0.1, 0.1), pos_hint={'center_x': 0.9, 'bottom': 0.4})
+            next_button = ImageButton(source=sprites.source('next.JPEG'), size_hint=(0.1, 0.1), pos_hint={'center_x': 0.9, 'bottom': 0.4})
             next_button.bind(on_press=self.next_image)
             self.add_widget(next_button)  # Add the button to the screen
+            self.add_widget(self.loading_label)
         else:
             self.manager.current = 'levelspage'  # Go to level1 if it's the last image
 
@@ -1683,13 +987,14 @@ class StoryScreen(Screen):
 class HomePage(Screen):
     # Home page with a 'Start' button to go to the levels page
     def on_enter(self, *args):
-        self.add_widget(Image(source='./img/home_back.jpeg', allow_stretch=True, keep_ratio=False))
-        start_img = './img/start.png'
+        self.add_widget(Image(source=sprites.source('home_back.JPEG'), allow_stretch=True, keep_ratio=False))
+        start_img = sprites.source('start.png')
         start_button = ImageButton(source=start_img, size_hint=(0.3, 0.18), pos_hint={'center_x': 0.5, 'center_y': 0.1})
         start_button.bind(on_press=self.goto_levels)
         self.add_widget(start_button)
         self.options_button = OptionsButton()
         self.add_widget(self.options_button)
+        Level1GameWidget.preload()
 
     def goto_levels(self, instance):
         self.manager.current = 'story'
@@ -1700,56 +1005,71 @@ class ImageButton(ButtonBehavior, Image):
     pass
 
 
-class Level1(Screen):
+class LevelScreen(Screen):
+    # Shows the game widget of one level and the options button. The widget is made on the
+    # first visit, disposed when we leave and loaded again on the next visit, so old levels
+    # never keep running in the background.
+    game_class = None
+    game_widget = None
+
     def on_enter(self, *args):
-        # Here I call the game widget for the first level
-        super(Level1, self).on_enter(*args)
-        self.game_widget = Level1GameWidget()
-        self.add_widget(self.game_widget)
+        super(LevelScreen, self).on_enter(*args)
+        if self.game_widget is None:
+            self.game_widget = self.make_game()
+            self.add_widget(self.game_widget)
+            self.options_button = OptionsButton()
+            self.add_widget(self.options_button)
+        elif self.game_widget.world is None:
+            self.game_widget.load()
+        self.game_widget.start()
 
-        # add options button
-        self.options_button = OptionsButton()
-        self.add_widget(self.options_button)
+    def make_game(self):
+        return self.game_class()
 
+    def on_leave(self, *args):
+        self.game_widget.dispose()
 
-class Level2(Screen):
-    def on_enter(self, *args):
-        # Here I call the game widget for level 2 and the options button
-        super(Level2, self).on_enter(*args)
-        self.game_widget = Level2GameWidget()
-        self.add_widget(self.game_widget)
-        self.options_button = OptionsButton()
-        self.add_widget(self.options_button)   
 
+class ReplayScreen(LevelScreen):
+    # Plays a recorded session back, see replay.py. The arrows jump 5 seconds back and
+    # forth, home starts it over.
+    replay = None
 
-class Level3(Screen):
-    def on_enter(self, *args):
-        # Here I call the game widget for lev. 3 and the options button
-        super(Level3, self).on_enter(*args)
-        self.game_widget = Level3GameWidget()
-        self.add_widget(self.game_widget)
-        self.options_button = OptionsButton()
-        self.add_widget(self.options_button)
+    def make_game(self):
+        return LEVEL_WIDGETS[self.replay.level](replay=self.replay)
+
+
+class Level1(LevelScreen):
+    game_class = Level1GameWidget
+
+
+class Level2(LevelScreen):
+    game_class = Level2GameWidget
+
+
+class Level3(LevelScreen):
+    game_class = Level3GameWidget
 
 
 class IntermediateScreen1(Screen):
     def on_enter(self, *args):
         global final_score_1
-        self.add_widget(Image(source='./img/lvclear.png', allow_stretch=True, keep_ratio=False))
+        self.add_widget(Image(source=sprites.source('lvclear.PNG'), allow_stretch=True, keep_ratio=False))
 
         # Display the final score of the player
         self.score_display = ScoreBanner(score=final_score_1)
         self.add_widget(self.score_display)
 
         # Create a 'Next' button to go to the next level
-        next_level_btn = ImageButton(source='./img/next.jpeg', size_hint=(0.5, 0.1), pos_hint={'center_x': 0.5, 'center_y': 0.1})
+        next_level_btn = ImageButton(source=sprites.source('next.JPEG'), size_hint=(0.5, 0.1), pos_hint={'center_x': 0.5, 'center_y': 0.1})
         next_level_btn.bind(on_press=self.go_to_next_level)
         self.add_widget(next_level_btn)
 
         # Create a 'Back' button to go back to the levels page
-        back_btn = ImageButton(source='./img/backtolev.png', size_hint=(0.6, 0.3), pos_hint={'center_x': 0.5, 'center_y': 0.25})
+        back_btn = ImageButton(source=sprites.source('backtolev.png'), size_hint=(0.6, 0.3), pos_hint={'center_x': 0.5, 'center_y': 0.25})
         back_btn.bind(on_press=self.go_back_to_levels)
         self.add_widget(back_btn)
+        Level2GameWidget.preload()
 
     def go_back_to_levels(self, instance):
         # move to the levels page
@@ -1764,18 +1084,19 @@ class IntermediateScreen2(Screen):
     # same as before, but for the second level to move to the third
     def on_enter(self, *args):
         global final_score_2
-        self.add_widget(Image(source='./img/lvclear.png', allow_stretch=True, keep_ratio=False))
+        self.add_widget(Image(source=sprites.source('lvclear.PNG'), allow_stretch=True, keep_ratio=False))
 
         self.score_display = ScoreBanner(score=final_score_2)
         self.add_widget(self.score_display)
 
-        next_level_btn = ImageButton(source='./img/next.jpeg', size_hint=(0.5, 0.1), pos_hint={'center_x': 0.5, 'center_y': 0.1})
+        next_level_btn = ImageButton(source=sprites.source('next.JPEG'), size_hint=(0.5, 0.1), pos_hint={'center_x': 0.5, 'center_y': 0.1})
         next_level_btn.bind(on_press=self.go_to_next_level)
         self.add_widget(next_level_btn)
         
-        back_btn = ImageButton(source='./img/backtolev.png', size_hint=(0.6, 0.3), pos_hint={'center_x': 0.5, 'center_y': 0.25})
+        back_btn = ImageButton(source=sprites.source('backtolev.png'), size_hint=(0.6, 0.3), pos_hint={'center_x': 0.5, 'center_y': 0.25})
         back_btn.bind(on_press=self.go_back_to_levels)
         self.add_widget(back_btn)
+        Level3GameWidget.preload()
 
     def go_back_to_levels(self, instance):
         self.manager.current = 'levelspage'
@@ -1791,13 +1112,13 @@ class LevelsPage(Screen):
         super(LevelsPage, self).on_enter(*args)
         self.clear_widgets()  # Clear existing widgets
 
-        bg_image = Image(source='./img/background_levela.jpg', allow_stretch=True, keep_ratio=False)
+        bg_image = Image(source=sprites.source('background_levela.jpg'), allow_stretch=True, keep_ratio=False)
         self.add_widget(bg_image)
 
         self.options_button = OptionsButton()
         self.add_widget(self.options_button)
 
-        level_images = ['./img/icon_1.png', './img/icon_2.png', './img/icon_3.png']
+        level_images = [sprites.source('icon_1.png'), sprites.source('icon_2.png'), sprites.source('icon_3.png')]
         positions = [(0.15, 0.75), (0.5, 0.75), (0.85, 0.15)]  # Positions of the level images
 
         # Create a image button for each level, with a fixed size and the positions we defined above
@@ -1806,6 +1127,12 @@ class LevelsPage(Screen):
             level_button.bind(on_press=self.goto_level)
             self.add_widget(level_button)
 
+        # get the levels the player can open ready, the first one is already cached after the story
+        for level_class, unlocked in ((Level1GameWidget, True), (Level2GameWidget, 'final_score_1' in globals()),
+                                      (Level3GameWidget, 'final_score_2' in globals())):
+            if unlocked:
+                level_class.preload()
+
     def goto_level(self, instance):
         # Extract the level number from the filename (e.g., 'icon_1.png')
         level_number = instance.source.split('_')[-1].split('.')[0]
@@ -1862,7 +1189,103 @@ class LevelsPage(Screen):
         warning_popup.open()
 
 
+class LeaderboardRow(GlyphLabel):
+    # one line of the leaderboard, the RecycleView moves the few of them it creates from entry to entry
+    score = NumericProperty(0)
+
+
+class LeaderboardView(RecycleView):
+    # Shows the leaderboard with only as many rows as fit on screen. Entries are fetched
+    # from the store a page at a time, the next page when the list is scrolled near its end.
+    # Submissions not saved yet are shown right away, where they will be once saved.
+    page_size = 100
+
+    def __init__(self, pending=(), **kwargs):
+        super().__init__(**kwargs)
+        self.viewclass = LeaderboardRow
+        self.bar_width = 10
+        self.scroll_type = ['bars', 'content']
+
+        names_layout = RecycleBoxLayout(orientation='vertical', spacing=10, size_hint_y=None,
+                                        default_size=(None, 50), default_size_hint=(1, None))
+        with names_layout.canvas.before:
+            Color(0.95686, 0.76863, 0.84706)
+            self.rect = Rectangle(size=names_layout.size, pos=names_layout.pos)
+        # Update the rectangle size and position when the layout changes
+        names_layout.bind(minimum_height=names_layout.setter('height'))
+        names_layout.bind(size=self._update_rect, pos=self._update_rect)
+        self.add_widget(names_layout)
+
+        self.bind(scroll_y=self.on_scrolled)
+        # shown but not in the store yet, and submission -> its row
+        self.unsaved = []
+        self.unsaved_rows = {}
+        # (score, id) of the last entry read from the store, the next page starts after it
+        self.cursor = None
+        self.load_page()
+        for submission in pending:
+            self.show_unsaved(submission)
+
+    def _update_rect(self, instance, value):
+        self.rect.size = instance.size
+        self.rect.pos = instance.pos
+
+    @staticmethod
+    def row(name, score, note=''):
+        return {'text': f'{name}: {score}{note}', 'score': score, 'font_name': './Minecraft.ttf'}
+
+    def load_page(self):
+        entries = DataHandler.read_leaderboard(self.cursor, self.page_size)
+        self.exhausted = len(entries) < self.page_size
+        if entries:
+            self.cursor = entries[-1][1:]
+        self.data.extend(self.row(name, score) for name, score, _ in entries)
+
+    def show_unsaved(self, submission):
+        if submission.saved:
+            # it got written while the first page was read, so it may or may not be in it
+            self.data = []
+            self.unsaved = []
+            self.unsaved_rows = {}
+            self.cursor = None
+            self.load_page()
+            return
+        # ties go after the entries already there, like in the store
+        index = sum(1 for row in self.data if row['score'] >= submission.score)
+        if index < len(self.data) or self.exhausted:
+            row = self.row(submission.name, submission.score)
+            self.data.insert(index, row)
+            self.unsaved.append(submission)
+            self.unsaved_rows[submission] = row
+
+    def saved(self, batch):
+        for submission in batch:
+            if submission in self.unsaved:
+                self.unsaved.remove(submission)
+                self.mark(submission, '')
+                del self.unsaved_rows[submission]
+
+    def failed(self, batch):
+        # the writer keeps these and tries again, the player still has to know
+        for submission in batch:
+            self.mark(submission, ' (not saved yet)')
+
+    def mark(self, submission, note):
+        row = self.unsaved_rows.get(submission)
+        if row is not None:
+            row.update(self.row(submission.name, submission.score, note))
+            self.refresh_from_data()
+
+    def on_scrolled(self, instance, scroll_y):
+        # scroll_y goes down to 0 at the bottom of the list
+        if not self.exhausted and scroll_y < 0.1:
+            self.load_page()
+
+
 class Leaderboard(Screen):
+    # the score we just sent to the writer
+    submission = None
+
     def on_enter(self, *args):
         # when the screen is entered, we're shown the popup. after we do what it's asking us, we update and display the leaderboard
         self.show_name_popup()
@@ -1879,7 +1302,7 @@ class Leaderboard(Screen):
         # Create a TextInput for the player to enter their name, and a button to confirm it
         self.name_input = TextInput(hint_text='Enter your name', font_name='./Minecraft.ttf', size_hint_y=None, height=30)
         content.add_widget(self.name_input)
-        confirm_btn = ImageButton(source='./img/confirm.png', on_press=self.on_name_confirm, size_hint_y=None, height=40)
+        confirm_btn = ImageButton(source=sprites.source('confirm.png'), on_press=self.on_name_confirm, size_hint_y=None, height=40)
         content.add_widget(confirm_btn)
 
         # Create a popup with the content
@@ -1894,45 +1317,24 @@ class Leaderboard(Screen):
         self.popup.dismiss()
         player_name = self.name_input.text.strip() # Get the player's name
         final_score_3 = globals().get('final_score_3', 0)  # Assuming final_score_3 is a global variable
-        DataHandler.update_leaderboard(player_name, final_score_3) # update the leaderboard at name confirmation
+        self.submission = DataHandler.update_leaderboard(player_name, final_score_3) # update the leaderboard at name confirmation
         self.display_leaderboard()  # Refresh the leaderboard display
 
     def display_leaderboard(self):
         self.clear_widgets()  # Clear existing widgets on the leaderboard screen
-        title_image = Image(source='./img/titolo.jpeg', pos=(0, Window.height - 460), size=(Window.width, 80))
+        title_image = Image(source=sprites.source('titolo.JPEG'), pos=(0, Window.height - 460), size=(Window.width, 80))
         self.add_widget(title_image)
 
-        # Create a ScrollView, the size respects the presence of a title image
-        scroll_view = ScrollView(size_hint=(1, None), size=(Window.width, Window.height - 150))
-        scroll_view.bar_width = 10
-        scroll_view.scroll_type = ['bars', 'content']
-        
-        # Create a BoxLayout for the names
-        names_layout = BoxLayout(orientation='vertical', spacing=10, size_hint_y=None)
-        with names_layout.canvas.before:
-            Color(0.95686, 0.76863, 0.84706)
-            self.rect = Rectangle(size=names_layout.size, pos=names_layout.pos)
-        
-        # Update the rectangle size and position when the layout changes
-        names_layout.bind(minimum_height=names_layout.setter('height'))
-        names_layout.bind(size=self._update_rect, pos=self._update_rect)
-
-        leaderboard = DataHandler.read_leaderboard()
-        leaderboard = [(name, int(score)) for name, score in leaderboard]  # Convert score to int
-        leaderboard.sort(key=lambda x: x[1], reverse=True)  # Sort by score in DESCENDING order (higher the score, higher the position)
-        for name, score in leaderboard:
-            # Create a label for each name and score and add them as widgets to the BoxLayout
-            name_label = Label(text=f'{name}: {score}', font_name='./Minecraft.ttf', size_hint_y=None, height=50)
-            names_layout.add_widget(name_label)
-        
-        # Add the BoxLayout to the ScrollView
-        scroll_view.add_widget(names_layout)
-        
-        # Add the ScrollView to the screen
-        self.add_widget(scroll_view)
+        # The list of names, the size respects the presence of a title image.
+        # Entries come in DESCENDING order of score (higher the score, higher the position)
+        pending = [self.submission] if self.submission is not None else []
+        view = LeaderboardView(pending=pending, size_hint=(1, None), size=(Window.width, Window.height - 150))
+        DataHandler.on_saved = view.saved
+        DataHandler.on_failed = view.failed
+        self.add_widget(view)
         
         # Add the back button, that will take the player back to the homepage
-        back_btn = ImageButton(source='./img/home.png', size_hint=(None, None), size=(100, 50), pos_hint={'right': 0.9, 'y': 0.1}, on_press=self.go_back)
+        back_btn = ImageButton(source=sprites.source('home.png'), size_hint=(None, None), size=(100, 50), pos_hint={'right': 0.9, 'y': 0.1}, on_press=self.go_back)
         self.add_widget(back_btn)
 
     def go_back(self, instance):
@@ -1941,9 +1343,17 @@ class Leaderboard(Screen):
 
 
 class SugarWarsApp(App):
+    # a Recording to show instead of the game
+    replay = None
+
     def build(self):
         # Create the screen manager and add the screens
         sm = ScreenManager()
+        if self.replay is not None:
+            screen = ReplayScreen(name='replay')
+            screen.replay = self.replay
+            sm.add_widget(screen)
+            return sm
         sm.add_widget(HomePage(name='homepage'))
         sm.add_widget(LevelsPage(name='levelspage'))
         sm.add_widget(StoryScreen(name='story'))
@@ -1955,7 +1365,18 @@ class SugarWarsApp(App):
         sm.add_widget(Leaderboard(name='leaderboard'))
         return sm
 
+    def on_stop(self):
+        DataHandler.close(DataHandler.close_timeout)
+
 
 if __name__ == "__main__":
+    # Kivy keeps its own options, ours go after a --, e.g. python Main.py -- --replay replays/level1-....swr
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--replay', help='play a recorded session back instead of the game')
+    parser.add_argument('--dev', action='store_true', help='notice every change to the level files')
+    options, _ = parser.parse_known_args(sys.argv[1:])
+    levelfile.CHECK_SOURCES = options.dev
     app = SugarWarsApp()
+    if options.replay:
+        app.replay = Recording.load(options.replay)
     app.run()
@@ -0,0 +1,96 @@
+from kivy.clock import Clock
+
+
+""" Cosmetic animations (laser colors, fading labels, banners, button pulses) all
+    run from one Animator: a single Clock callback steps every animation in one
+    pass, and it's only scheduled while there is something to animate. An animation
+    whose active() says no (its target is hidden, its level paused) is skipped
+    without being dropped, and a finished one is dropped on its own.
+
+"""
+
+
+def linear(t):
+    return t
+
+
+def ease_out(t):
+    return 1 - (1 - t) * (1 - t)
+
+
+class Animation:
+    # update(dt) every frame while active() is true, until update returns False (None keeps
+    # it going) or the animation is removed; on_complete() is called when it ends by itself
+    def __init__(self, update=None, active=None, on_complete=None):
+        if update is not None:
+            self.update = update
+        self.active = active
+        self.on_complete = on_complete
+        self.owner = None
+        self.done = False
+
+    def update(self, dt):
+        return False
+
+
+class Tween(Animation):
+    # apply() a value going from start to end in duration seconds
+    def __init__(self, apply, start, end, duration, easing=linear, active=None, on_complete=None):
+        super().__init__(active=active, on_complete=on_complete)
+        self.apply = apply
+        self.start = start
+        self.end = end
+        self.duration = duration
+        self.easing = easing
+        self.elapsed = 0.0
+
+    @classmethod
+    def attribute(cls, target, name, end, duration, **kwargs):
+        # tween an attribute of target (opacity, font_size...) from its current value
+        return cls(lambda value: setattr(target, name, value), getattr(target, name), end, duration, **kwargs)
+
+    def update(self, dt):
+        self.elapsed = min(self.elapsed + dt, self.duration)
+        t = self.elapsed / self.duration if self.duration else 1.0
+        self.apply(self.start + (self.end - self.start) * self.easing(t))
+        return self.elapsed < self.duration
+
+
+class Animator:
+    def __init__(self):
+        self.animations = []
+        self.event = None
+
+    def __len__(self):
+        return len(self.animations)
+
+    def add(self, animation, owner=None):
+        # owner is anything remove_owned() will be called with later, e.g. a level being disposed
+        animation.owner = owner
+        animation.done = False
+        self.animations.append(animation)
+        if self.event is None:
+            self.event = Clock.schedule_interval(self.tick, 0)
+        return animation
+
+    def remove(self, animation):
+        if animation is not None and not animation.done:
+            animation.done = True
+            self.animations.remove(animation)
+
+    def remove_owned(self, owner):
+        for animation in [animation for animation in self.animations if animation.owner is owner]:
+            self.remove(animation)
+
+    def tick(self, dt):
+        # a snapshot, callbacks may add or remove animations
+        for animation in list(self.animations):
+            if animation.done or (animation.active is not None and not animation.active()):
+                continue
+            if animation.update(dt) is False:
+                self.remove(animation)
+                if animation.on_complete is not None:
+                    animation.on_complete()
+        if not self.animations:
+            self.event.cancel()
+            self.event = None
@@ -0,0 +1,188 @@
+import os
+import json
+import queue
+import threading
+from collections import OrderedDict
+from kivy.atlas import Atlas
+from kivy.cache import Cache
+from kivy.clock import Clock
+from kivy.core.image import Image as CoreImage, ImageLoader
+
+import sprites
+
+
+""" Loads the images and sounds of the next screen in the background, so entering
+    a level finds everything already decoded. Files are decoded on a worker thread,
+    the textures are then made on the main (GL) thread and kept in an LRU cache
+    that drops the least recently used ones once it goes over budget. Atlas pages
+    are decoded on the worker too, the main thread only turns them into textures
+    and hands the atlas to Kivy's own atlas cache. Sounds are
+    only read on the worker, so the file is in the OS cache, and then loaded by
+    the audio manager on the main thread: Kivy's audio providers aren't thread
+    safe. The audio manager keeps its clips for the whole run.
+
+"""
+
+# decoded textures the cache may keep around, in bytes
+MEMORY_BUDGET = 192 * 1024 * 1024
+
+
+class AssetCache:
+    # key -> (asset, size in bytes), oldest use first. Evicting only forgets the asset,
+    # whatever is already drawing it keeps its own reference.
+    def __init__(self, budget=MEMORY_BUDGET):
+        self.budget = budget
+        self.entries = OrderedDict()
+        self.used = 0
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, asset, size):
+        if key in self.entries:
+            self.used -= self.entries.pop(key)[1]
+        self.entries[key] = (asset, size)
+        self.used += size
+        # always keep the newest one, even if it's bigger than the whole budget
+        while self.used > self.budget and len(self.entries) > 1:
+            _, (_, old_size) = self.entries.popitem(last=False)
+            self.used -= old_size
+
+
+class DecodedAtlas(Atlas):
+    # An Atlas whose pages were already decoded (pages: page file name -> what ImageLoader.load()
+    # returned), so building it only makes the textures, like Kivy's Atlas but without the file reading
+    def __init__(self, filename, meta, pages):
+        self.meta = meta
+        self.pages = pages
+        super().__init__(filename)
+
+    def _load(self):
+        textures = {}
+        for page, ids in self.meta.items():
+            texture = self.pages[page].texture
+            self.original_textures.append(texture)
+            for uid, coords in ids.items():
+                textures[uid] = texture.get_region(*coords)
+        self.textures = textures
+        self.meta = self.pages = None
+
+
+def decode_atlas(name):
+    # worker side of an atlas (name as in its urls, e.g. 'img/game'): its index and its decoded pages
+    filename = name + '.atlas'
+    with open(filename) as file:
+        meta = json.load(file)
+    folder = os.path.dirname(filename)
+    return filename, meta, {page: ImageLoader.load(os.path.join(folder, page)) for page in meta}
+
+
+def install_atlas(name, filename, meta, pages):
+    # main thread: make the textures of a decoded atlas and register it where CoreImage looks for
+    # atlas:// urls, so loading any of its images from now on is only a lookup
+    atlas = DecodedAtlas(filename, meta, pages)
+    Cache.append('kv.atlas', name, atlas)
+    for uid, texture in atlas.textures.items():
+        Cache.append('kv.texture', f'atlas://{name}/{uid}|0|0', texture)
+
+
+class Preloader:
+    # Images are named like for sprites.source() (e.g. 'tank.png'), sounds by their path.
+    def __init__(self, audio, cache=None):
+        self.audio = audio
+        self.cache = cache if cache is not None else AssetCache()
+        self.jobs = queue.Queue()
+        # keys queued but not in the cache yet
+        self.pending = set()
+        # atlases the worker decoded or found already loaded, only the worker uses it
+        self.atlases = set()
+        self.requested = 0
+        self.finished = 0
+        self.thread = None
+
+    @property
+    def progress(self):
+        # fraction of everything asked so far that is ready, 1 when idle
+        if self.requested == 0:
+            return 1.0
+        return self.finished / self.requested
+
+    def preload(self, images=(), sounds=()):
+        # queue the assets that aren't cached or on their way yet, returns right away
+        for kind, keys in (('image', images), ('sound', sounds)):
+            for key in keys:
+                if key in self.cache or key in self.audio.clips or key in self.pending:
+                    continue
+                self.pending.add(key)
+                self.requested += 1
+                self.jobs.put((kind, key))
+        if self.thread is None and self.pending:
+            self.thread = threading.Thread(target=self._work, daemon=True)
+            self.thread.start()
+
+    def _work(self):
+        # worker thread: only file reading and decoding, no GL or audio calls in here
+        while True:
+            kind, key = self.jobs.get()
+            try:
+                if kind == 'sound':
+                    # read once so the main thread's load doesn't wait on the disk
+                    with open(key, 'rb') as file:
+                        while file.read(1 << 20):
+                            pass
+                    data = None
+                else:
+                    path = sprites.source(key)
+                    data = self._decode_atlas(path) if path.startswith('atlas://') else ImageLoader.load(path)
+            except Exception:
+                data = None
+            Clock.schedule_once(lambda dt, kind=kind, key=key, data=data: self._finish(kind, key, data))
+
+    def _decode_atlas(self, url):
+        # worker thread: the atlas of an atlas:// url, decoded the first time one of its images comes up
+        name = url[len('atlas://'):].rsplit('/', 1)[0]
+        if name in self.atlases:
+            return None
+        self.atlases.add(name)
+        if Cache.get('kv.atlas', name) is not None:
+            return None
+        return (name,) + decode_atlas(name)
+
+    def _finish(self, kind, key, data):
+        # main thread: load the sound or upload the decoded image, and hand the asset to its cache
+        if key in self.pending:
+            self.pending.discard(key)
+            self.finished += 1
+        if kind == 'sound':
+            self.audio.load(key)
+            return
+        if isinstance(data, tuple):
+            # the first image of an atlas brings the whole atlas
+            if Cache.get('kv.atlas', data[0]) is None:
+                install_atlas(*data)
+            data = None
+        if key in self.cache:
+            return
+        if data is not None:
+            self._store_texture(key, data.texture)
+        else:
+            self.texture(key)
+
+    def _store_texture(self, key, texture):
+        width, height = texture.size
+        self.cache.put(key, texture, width * height * 4)
+        return texture
+
+    def texture(self, image):
+        # the cached texture, or loaded right now if the preload didn't get to it
+        texture = self.cache.get(image)
+        if texture is None:
+            texture = self._store_texture(image, CoreImage(sprites.source(image)).texture)
+        return texture
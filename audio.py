@@ -0,0 +1,76 @@
+from collections import deque
+from kivy.clock import Clock
+from kivy.core.audio import SoundLoader
+
+
+""" One audio engine for the whole game. Every clip is loaded once per run, as a
+    few voices so quick hits can overlap instead of cutting each other off. A voice
+    is one loaded copy of the clip, decoded on its own, so they are all loaded
+    together when the clip is preloaded and playing never loads anything. Cues
+    asked for during the game step are only started at the next frame, so the
+    step never waits on the audio backend. Everything here runs on the main
+    thread, like the rest of Kivy's audio.
+
+"""
+
+# voices loaded for each sound effect, i.e. how many copies of it can overlap
+VOICES_PER_CLIP = 4
+# sound effects playing at the same time, all clips together (music not included)
+MAX_VOICES = 8
+
+
+class AudioManager:
+    def __init__(self, voices_per_clip=VOICES_PER_CLIP, max_voices=MAX_VOICES):
+        self.voices_per_clip = voices_per_clip
+        self.max_voices = max_voices
+        # path -> the voices of a sound effect, and path -> a music track
+        self.clips = {}
+        self.tracks = {}
+        # voices we started, oldest first
+        self.playing = deque()
+        self.cues = []
+        self._flush_trigger = Clock.create_trigger(self.flush)
+
+    def load(self, path):
+        # the voices of a sound effect, all loaded the first time it's asked for
+        voices = self.clips.get(path)
+        if voices is None:
+            voices = [SoundLoader.load(path) for _ in range(self.voices_per_clip)]
+            voices = self.clips[path] = [voice for voice in voices if voice is not None]
+        return voices
+
+    def track(self, path):
+        # a music track is a single looping sound, shared by whoever plays it
+        if path not in self.tracks:
+            self.tracks[path] = SoundLoader.load(path)
+        return self.tracks[path]
+
+    def play(self, path):
+        # queue a sound effect, it starts on the next frame
+        self.cues.append(path)
+        self._flush_trigger()
+
+    def flush(self, dt=None):
+        cues, self.cues = self.cues, []
+        # a clip cued several times in the same frame is only started once
+        for path in dict.fromkeys(cues):
+            self._start(path)
+
+    def _start(self, path):
+        voices = self.load(path)
+        if not voices:
+            return
+        # forget the voices that finished on their own
+        self.playing = deque(voice for voice in self.playing if voice.state == 'play')
+        voice = next((voice for voice in voices if voice.state != 'play'), None)
+        if voice is None:
+            # every voice of this clip is busy: restart the one playing for the longest
+            voice = next((playing for playing in self.playing if playing in voices), voices[0])
+            if voice in self.playing:
+                self.playing.remove(voice)
+            voice.stop()
+        elif len(self.playing) >= self.max_voices:
+            # too many sounds at once, the oldest one makes room
+            self.playing.popleft().stop()
+        voice.play()
+        self.playing.append(voice)
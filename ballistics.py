@@ -0,0 +1,30 @@
+import math
+
+
+""" Closed-form motion for the bullet and the cupcake. The position is computed
+    straight from the launch parameters for any time t, so the trajectory is the
+    same whatever the frame rate and we can look ahead without stepping.
+
+"""
+
+GRAVITY = 9.8
+# The widgets used to do y += vy * dt - 0.5 * g * t^2 on every frame, and the game was
+# tuned like that at 60 FPS. Summed over the frames that gives the drop below, which
+# we now evaluate exactly for any t instead of accumulating it frame by frame.
+REFERENCE_DT = 1 / 60
+
+
+def launch_speed(power, mass):
+    # the power bar width turned into a muzzle speed, same formula as always
+    return math.sqrt(400 * 2 * power / mass)
+
+
+def drop(t, g=GRAVITY, h=REFERENCE_DT):
+    # sum of 0.5 * g * (k * h)^2 for k = 1 .. t / h, written as a polynomial in t
+    return g * t * (t + h) * (2 * t + h) / (12 * h)
+
+
+def position(x0, y0, vx, vy, t):
+    # where a shell launched from (x0, y0) with velocity (vx, vy) is after t seconds
+    return (x0 + vx * t, y0 + vy * t - drop(t))
+
@@ -0,0 +1,203 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+
+from collision import collides
+from leaderboard import LeaderboardStore
+from simulation import Body, MirrorState, World
+
+
+""" Headless benchmarks for the hot paths of the game: the world tick on synthetic
+    levels of growing size, the collision test, the cupcake blast, the leaderboard
+    store and cold start. Nothing here opens a window.
+
+        python benchmark.py            # run and compare with benchmark_baseline.json
+        python benchmark.py --save     # run and make the results the new baseline
+        python benchmark.py --quick    # smaller sizes, for a fast check
+
+    Every result is seconds per operation. A result slower than its baseline by more
+    than the tolerance is a regression, reported on stderr, and the exit code is 1.
+    So is a missing baseline, unless --save is given.
+
+"""
+
+BASELINE_PATH = 'benchmark_baseline.json'
+TOLERANCE = 0.3
+
+OBSTACLES = (10, 100, 1000, 10000)
+PROJECTILES = (1, 10, 100, 500)
+ROWS = (1000, 10000, 100000, 1000000)
+QUICK_OBSTACLES = (10, 100, 1000)
+QUICK_PROJECTILES = (1, 10, 100)
+QUICK_ROWS = (1000, 10000)
+
+# simulation steps timed per synthetic level
+TICKS = 120
+TICK_DT = 1 / 120
+
+
+def best_time(function, repeat=5, number=1):
+    # the fastest of `repeat` runs, per call; the minimum is the least noisy estimate
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def synthetic_world(obstacles, projectiles, seed=0):
+    # a level with `obstacles` rocks scattered over the right two thirds of the window,
+    # a few mirrors and room for `projectiles` of each kind in flight
+    rng = random.Random(seed)
+    world = World(score=10 ** 9, max_in_flight=projectiles, pool_size=3 * projectiles)
+    width, height = world.width, world.height
+    world.add_rocks([Body(rng.uniform(width / 3, width - width / 20), rng.uniform(height / 15, height - height / 20),
+                          width / 20, height / 20) for _ in range(obstacles)])
+    world.add_mirrors([MirrorState(Body(width / 1.2, height / 4, 30, 270), vertical=True),
+                       MirrorState(Body(width / 2, height / 1.2, 300, 30), vertical=False)])
+    world.power = 400
+    return world
+
+
+def refill(world, projectiles, rng):
+    # keep `projectiles` shells and lasers in flight, fired at random angles
+    fire = (world.fire_bullet, world.fire_cupcake, world.fire_laser)
+    in_flight = world.projectiles.in_flight
+    for kind in range(3 * projectiles):
+        if sum(in_flight) >= projectiles:
+            break
+        world.cannon_angle = rng.uniform(-80, 0)
+        fire[kind % 3]()
+
+
+def bench_ticks(obstacles, projectiles):
+    # seconds per world step with that many obstacles and projectiles in flight
+    results = {}
+    for count in obstacles:
+        for flying in projectiles:
+            def run():
+                world = synthetic_world(count, flying)
+                rng = random.Random(1)
+                elapsed = 0.0
+                for _ in range(TICKS):
+                    refill(world, flying, rng)
+                    start = time.perf_counter()
+                    world.step(TICK_DT)
+                    elapsed += time.perf_counter() - start
+                return elapsed / TICKS
+            results[f'tick/obstacles={count}/projectiles={flying}'] = min(run() for _ in range(3))
+    return results
+
+
+def bench_collision(obstacles):
+    results = {}
+    a = ((10, 10), (50, 35))
+    b = ((40, 30), (50, 35))
+    results['collides'] = best_time(lambda: collides(a, b), number=100000)
+    for count in obstacles:
+        worlds = [synthetic_world(count, 1, seed) for seed in range(5)]
+        pending = iter(worlds)
+
+        def blast():
+            # a fresh world every time, the blast removes the rocks it reaches
+            world = next(pending)
+            world.blast(next(iter(world.rocks)))
+        results[f'blast/obstacles={count}'] = best_time(blast, repeat=len(worlds))
+    return results
+
+
+def bench_leaderboard(rows):
+    results = {}
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as folder:
+        for count in rows:
+            store = LeaderboardStore(os.path.join(folder, f'{count}.db'), csv_path=None, fsync='never')
+            entries = [(f'player{rng.randrange(count // 10 + 1)}', rng.randrange(10000)) for _ in range(count)]
+            start = time.perf_counter()
+            for first in range(0, count, 10000):
+                store.add_many(entries[first:first + 10000])
+            results[f'leaderboard/rows={count}/bulk_insert'] = (time.perf_counter() - start) / count
+            prefix = f'leaderboard/rows={count}'
+            results[f'{prefix}/insert'] = best_time(lambda: store.add('new', rng.randrange(10000)), number=20)
+            results[f'{prefix}/top100'] = best_time(lambda: store.top(100))
+            results[f'{prefix}/page_middle'] = best_time(lambda: store.page(count // 2, 100))
+            middle = store.page_after(None, count // 2)[-1][1:]
+            results[f'{prefix}/page_after_middle'] = best_time(lambda: store.page_after(middle, 100))
+            results[f'{prefix}/rank'] = best_time(lambda: store.rank(5000))
+            results[f'{prefix}/best_per_player'] = best_time(lambda: store.best_per_player(100), repeat=3)
+            store.close()
+    return results
+
+
+def bench_cold_start():
+    # a fresh interpreter each time, so nothing is warm in this process
+    scripts = {
+        'cold_start/level': 'import levelfile; levelfile.LEVELS[3]()',
+        'cold_start/leaderboard': 'import leaderboard',
+    }
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for name, script in scripts.items():
+        results[name] = best_time(lambda: subprocess.run([sys.executable, '-c', script], cwd=here, check=True),
+                                  repeat=3)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    # the names of the results slower than baseline * (1 + tolerance)
+    regressions = []
+    for name, value in results.items():
+        reference = baseline.get(name)
+        if reference and value > reference * (1 + tolerance):
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sugar Wars benchmarks')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--quick', action='store_true', help='skip the biggest sizes')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help='allowed slowdown, 0.3 is 30%%')
+    options = parser.parse_args()
+    if not options.save and not os.path.exists(options.baseline):
+        # nothing to compare with is a failed check, not a passed one
+        print(f'no baseline at {options.baseline}, run with --save to make one', file=sys.stderr)
+        return 1
+
+    obstacles = QUICK_OBSTACLES if options.quick else OBSTACLES
+    projectiles = QUICK_PROJECTILES if options.quick else PROJECTILES
+    rows = QUICK_ROWS if options.quick else ROWS
+    results = {}
+    for bench in (lambda: bench_ticks(obstacles, projectiles), lambda: bench_collision(obstacles),
+                  lambda: bench_leaderboard(rows), bench_cold_start):
+        for name, value in bench().items():
+            results[name] = value
+            print(f'{name:60} {value * 1e6:14.2f} us')
+
+    baseline = {}
+    if os.path.exists(options.baseline):
+        with open(options.baseline) as file:
+            baseline = json.load(file)['results']
+    regressions = compare(results, baseline, options.tolerance)
+    for name in regressions:
+        print(f'REGRESSION {name}: {results[name] * 1e6:.2f} us, baseline {baseline[name] * 1e6:.2f} us',
+              file=sys.stderr)
+
+    if options.save:
+        with open(options.baseline, 'w') as file:
+            json.dump({'machine': platform.platform(), 'python': platform.python_version(), 'results': results},
+                      file, indent=4, sort_keys=True)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,19 @@
+import os
+from kivy.atlas import Atlas
+
+from sprites import ATLASES, ATLAS_SIZE, IMG_DIR
+
+
+""" Packs the images listed in sprites.ATLASES into img/<name>.atlas (and its
+    png pages). Run it again whenever one of those images changes:
+
+        python build_atlas.py
+
+    Kivy needs Pillow to write the atlases, the game itself doesn't.
+
+"""
+
+if __name__ == '__main__':
+    for name, filenames in ATLASES.items():
+        paths = [os.path.join(IMG_DIR, filename) for filename in filenames]
+        Atlas.create(os.path.join(IMG_DIR, name), paths, ATLAS_SIZE)
@@ -0,0 +1,42 @@
+import os
+import sys
+import glob
+
+from levelfile import LEVEL_DIR, CompiledLevel, compile_file, stale
+
+
+""" Compiles every levels/*.json into the .bin the game loads, laid out for the
+    game window. Run it again whenever a level file changes, until then the game
+    compiles the level file every time it's loaded, once it notices the .bin is stale:
+
+        python build_levels.py            # compile every level
+        python build_levels.py --check    # list the stale .bin files, exit code 1 if any
+
+"""
+
+# the game window is fixed to this size (see the Config calls in Main.py)
+WIDTH = 1000
+HEIGHT = 700
+
+
+def check(path):
+    # whether the .bin of the level file at path is there and up to date
+    try:
+        with open(os.path.splitext(path)[0] + '.bin', 'rb') as file:
+            level = CompiledLevel.from_bytes(file.read())
+    except (OSError, ValueError):
+        return False
+    return not stale(level, path, check_hash=True)
+
+
+if __name__ == '__main__':
+    paths = sorted(glob.glob(os.path.join(LEVEL_DIR, '*.json')))
+    if '--check' in sys.argv[1:]:
+        outdated = [path for path in paths if not check(path)]
+        for path in outdated:
+            print(f'{path} changed since it was compiled')
+        sys.exit(1 if outdated else 0)
+    for path in paths:
+        level = compile_file(path, WIDTH, HEIGHT)
+        with open(os.path.splitext(path)[0] + '.bin', 'wb') as file:
+            file.write(level.to_bytes())
@@ -0,0 +1,287 @@
+""" Collision helpers shared by the game widgets and the headless simulation.
+    Nothing in here imports Kivy, so it can be used without opening a window.
+
+"""
+from itertools import chain
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy is optional: without it batch_sweeps() falls back to the scalar sweep()
+    np = None
+
+# Below this many (move, obstacle) pairs a plain loop is cheaper than building arrays
+BATCH_THRESHOLD = 32
+
+
+def collides(rect1, rect2):
+    # Extract the top-left corner and dimensions of rectangles using tuple unpacking
+    r1x, r1y, r1w, r1h = rect1[0][0], rect1[0][1], rect1[1][0], rect1[1][1]
+    r2x, r2y, r2w, r2h = rect2[0][0], rect2[0][1], rect2[1][0], rect2[1][1]
+
+    # Check if the rectangles are overlapping (either to the left/right or above/below)
+    if (r1x + r1w <= r2x) or (r2x + r2w <= r1x) or (r1y + r1h <= r2y) or (r2y + r2h <= r1y):
+        return False
+
+    else:
+        return True
+
+
+def distance(point1, point2):
+    return ((point1[0] - point2[0]) ** 2 + (point1[1] - point2[1]) ** 2) ** 0.5
+
+
+def sweep(rect, dx, dy, target):
+    # Swept version of collides(): rect moves by (dx, dy) during the tick. Returns the fraction
+    # of the move (0 to 1) at which it first overlaps target, or None if it never does.
+    # Boxes that already overlap at the start give 0, touching edges still don't count.
+    (x, y), (w, h) = rect
+    (tx, ty), (tw, th) = target
+    t_enter, t_exit = 0.0, 1.0
+    for start, size, delta, t_start, t_size in ((x, w, dx, tx, tw), (y, h, dy, ty, th)):
+        if delta == 0:
+            # not moving on this axis, so it has to overlap on it the whole time
+            if start + size <= t_start or t_start + t_size <= start:
+                return None
+            continue
+        t0 = (t_start - (start + size)) / delta
+        t1 = (t_start + t_size - start) / delta
+        if t0 > t1:
+            t0, t1 = t1, t0
+        t_enter = max(t_enter, t0)
+        t_exit = min(t_exit, t1)
+        if t_enter >= t_exit:
+            return None
+    return t_enter
+
+
+def swept_bounds(rect, dx, dy):
+    # the box covering rect at both ends of the move, used for the broadphase
+    (x, y), (w, h) = rect
+    return ((min(x, x + dx), min(y, y + dy)), (w + abs(dx), h + abs(dy)))
+
+
+class SpatialHash:
+    # Uniform grid over the level: every obstacle is stored in each cell its box overlaps,
+    # so a query only looks at the few cells around a projectile instead of every block.
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        # (column, row) -> {item: None}, dicts keep insertion order so results stay deterministic
+        self.cells = {}
+        # item -> (insertion order, rect, cells it was stored in)
+        self.items = {}
+        self._counter = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, item):
+        return item in self.items
+
+    def _cell_keys(self, rect):
+        (x, y), (w, h) = rect
+        size = self.cell_size
+        x0, x1 = int(x // size), int((x + w) // size)
+        y0, y1 = int(y // size), int((y + h) // size)
+        return [(cx, cy) for cx in range(x0, x1 + 1) for cy in range(y0, y1 + 1)]
+
+    def insert(self, item, rect, keys=None):
+        # keys are the cells of rect when they were worked out beforehand (see levelfile.py)
+        if item in self.items:
+            self.remove(item)
+        if keys is None:
+            keys = self._cell_keys(rect)
+        for key in keys:
+            self.cells.setdefault(key, {})[item] = None
+        self.items[item] = (self._counter, rect, keys)
+        self._counter += 1
+
+    def remove(self, item):
+        _, _, keys = self.items.pop(item)
+        for key in keys:
+            cell = self.cells[key]
+            del cell[item]
+            # drop empty cells so the grid doesn't keep growing with destroyed blocks
+            if not cell:
+                del self.cells[key]
+
+    def candidates(self, rect):
+        # broadphase only: everything stored in the cells the box overlaps
+        found = {}
+        cells = self.cells
+        for key in self._cell_keys(rect):
+            cell = cells.get(key)
+            if cell:
+                found.update(cell)
+        return found
+
+
+class AABBArray:
+    # Obstacle boxes stored as rows of (left, bottom, right, top) in one contiguous array.
+    # Slots are handed out in order and never reused, so slot order is insertion order.
+    def __init__(self, capacity=64):
+        self.count = 0
+        if np is not None:
+            self.data = np.zeros((capacity, 4))
+            self.alive = np.zeros(capacity, dtype=bool)
+        else:
+            self.data = []
+            self.alive = []
+
+    def __len__(self):
+        return self.count
+
+    def add(self, rect):
+        (x, y), (w, h) = rect
+        slot = self.count
+        if np is not None:
+            if slot == len(self.data):
+                # double the capacity, like a list would
+                self.data = np.concatenate([self.data, np.zeros_like(self.data)])
+                self.alive = np.concatenate([self.alive, np.zeros_like(self.alive)])
+            self.data[slot] = (x, y, x + w, y + h)
+            self.alive[slot] = True
+        else:
+            self.data.append((x, y, x + w, y + h))
+            self.alive.append(True)
+        self.count += 1
+        return slot
+
+    def remove(self, slot):
+        self.alive[slot] = False
+
+    def rect(self, slot):
+        left, bottom, right, top = (float(value) for value in self.data[slot])
+        return ((left, bottom), (right - left, top - bottom))
+
+    def live_slots(self):
+        return [slot for slot in range(self.count) if self.alive[slot]]
+
+
+def batch_sweep(rect, dx, dy, boxes, slots=None):
+    # Sweep one moving rect against many boxes of an AABBArray at once.
+    # Returns (slot, time of impact) of the earliest contact, or (None, None).
+    return batch_sweeps([(rect, dx, dy)], boxes, None if slots is None else [slots])[0]
+
+
+def batch_sweeps(moves, boxes, slots=None):
+    # Sweep many moving rects, given as (rect, dx, dy), against the boxes of an AABBArray in one call:
+    # every move against the slots listed for it in slots (one list per move, in any order), or against
+    # every live box. Returns one (slot, time of impact) per move, its earliest contact, or (None, None).
+    # Between boxes hit at the same time the lowest slot wins, like in the scalar loop.
+    if slots is None:
+        slots = [boxes.live_slots()] * len(moves)
+    pairs = sum(len(move_slots) for move_slots in slots)
+
+    if np is None or pairs < BATCH_THRESHOLD:
+        # sweep() stays the reference implementation, the numpy path must agree with it
+        results = []
+        for (rect, dx, dy), move_slots in zip(moves, slots):
+            best, best_toi = None, None
+            for slot in move_slots:
+                if not boxes.alive[slot]:
+                    continue
+                toi = sweep(rect, dx, dy, boxes.rect(slot))
+                if toi is not None and (best_toi is None or (toi, slot) < (best_toi, best)):
+                    best, best_toi = slot, toi
+            results.append((best, best_toi))
+        return results
+
+    # one row per (move, slot) pair, so a move is only tested against its own slots
+    counts = np.array([len(move_slots) for move_slots in slots])
+    rows = np.repeat(np.arange(len(moves)), counts)
+    columns = np.fromiter(chain.from_iterable(slots), dtype=np.intp, count=pairs)
+    # one row per value: left, bottom, right, top, dx, dy, and one column per move
+    rects = np.array([(x, y, x + w, y + h, dx, dy) for ((x, y), (w, h)), dx, dy in moves]).T.copy()
+    obstacles = boxes.data[columns].T
+    # same test as sweep()
+    t_enter = np.zeros(pairs)
+    t_exit = np.ones(pairs)
+    for column in (0, 1):
+        low, high, delta = rects[column][rows], rects[column + 2][rows], rects[column + 4][rows]
+        box_low, box_high = obstacles[column], obstacles[column + 2]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t0 = (box_low - high) / delta
+            t1 = (box_high - low) / delta
+        # a rect not moving on this axis has to overlap on it the whole time
+        apart = (high <= box_low) | (box_high <= low)
+        t_enter = np.maximum(t_enter, np.where(delta == 0, 0.0, np.minimum(t0, t1)))
+        t_exit = np.minimum(t_exit, np.where(delta == 0, np.where(apart, -np.inf, 1.0), np.maximum(t0, t1)))
+    toi = np.where((t_enter < t_exit) & boxes.alive[columns], t_enter, np.inf)
+    # earliest time of impact of every move, then the lowest slot hit at that time
+    filled = counts > 0
+    starts = (np.cumsum(counts) - counts)[filled]
+    best = np.full(len(moves), np.inf)
+    best[filled] = np.minimum.reduceat(toi, starts)
+    first = np.full(len(moves), -1, dtype=np.intp)
+    first[filled] = np.minimum.reduceat(np.where(toi == best[rows], columns, np.iinfo(np.intp).max), starts)
+    results = []
+    for slot, value in zip(first.tolist(), best.tolist()):
+        results.append((None, None) if value == np.inf else (slot, value))
+    return results
+
+
+class ObstacleSet:
+    # All the obstacles of one kind (rocks or perpetios): boxes live in an AABBArray,
+    # the grid finds the slots near each projectile and batch_sweeps() tests them all at once.
+    def __init__(self, cell_size):
+        self.boxes = AABBArray()
+        self.grid = SpatialHash(cell_size)
+        # item -> slot, and back; dicts keep the items in insertion order
+        self.slots = {}
+        self.items = {}
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __iter__(self):
+        return iter(list(self.slots))
+
+    def __contains__(self, item):
+        return item in self.slots
+
+    def add(self, item, rect, cells=None):
+        slot = self.boxes.add(rect)
+        self.slots[item] = slot
+        self.items[slot] = item
+        self.grid.insert(slot, rect, cells)
+
+    def cells(self, item):
+        # the grid cells the item is stored in
+        return self.grid.items[self.slots[item]][2]
+
+    def remove(self, item):
+        slot = self.slots.pop(item)
+        del self.items[slot]
+        self.boxes.remove(slot)
+        self.grid.remove(slot)
+
+    def within(self, point, radius):
+        # obstacles whose position (bottom-left corner) is at most radius away from point,
+        # in the order they were added; only the grid cells under the circle are looked at
+        px, py = point
+        square = ((px - radius, py - radius), (2 * radius, 2 * radius))
+        boxes = self.boxes
+        return [self.items[slot] for slot in sorted(self.grid.candidates(square))
+                if distance(point, boxes.rect(slot)[0]) <= radius]
+
+    def first_sweep(self, rect, dx, dy):
+        # the obstacle a box moving by (dx, dy) touches first, and the fraction of the move where it happens
+        if not self.slots:
+            return None, None
+        slots = list(self.grid.candidates(swept_bounds(rect, dx, dy)))
+        slot, toi = batch_sweep(rect, dx, dy, self.boxes, slots)
+        if slot is None:
+            return None, None
+        return self.items[slot], toi
+
+    def first_sweeps(self, moves):
+        # first_sweep() for many (rect, dx, dy) moves at once: every move and its own grid candidates
+        # are swept in a single batch, one (obstacle, fraction of the move) or (None, None) per move
+        if not self.slots:
+            return [(None, None)] * len(moves)
+        grid = self.grid
+        slots = [list(grid.candidates(swept_bounds(rect, dx, dy))) for rect, dx, dy in moves]
+        items = self.items
+        return [(items[slot], toi) if slot is not None else (None, None)
+                for slot, toi in batch_sweeps(moves, self.boxes, slots)]
@@ -0,0 +1,51 @@
+""" Fixed timestep loop. The time of each rendered frame goes into an accumulator
+    and the simulation is stepped in fixed dt slices, however long the frame was,
+    so the game plays the same at any frame rate. What's left in the accumulator
+    tells the renderer how far it is between the last two simulation states.
+
+"""
+
+# simulation steps per second
+TICK_RATE = 120
+# after a long stall (window dragged, debugger...) we drop time instead of catching up forever
+MAX_STEPS_PER_FRAME = 8
+
+
+class FixedStepLoop:
+    def __init__(self, step, rate=TICK_RATE, max_steps=MAX_STEPS_PER_FRAME):
+        # step(dt) advances the simulation by exactly dt
+        self.step = step
+        self.dt = 1 / rate
+        self.max_steps = max_steps
+        self.accumulator = 0.0
+        self.ticks = 0
+
+    @property
+    def alpha(self):
+        # 0 means draw the state before the last step, 1 the state after it
+        return self.accumulator / self.dt
+
+    def advance(self, frame_time, max_steps=None):
+        # feed the time of one rendered frame, returns how many steps ran. Time the game
+        # must not drop (e.g. a stretch it slept through) is fed with max_steps=math.inf
+        if max_steps is None:
+            max_steps = self.max_steps
+        self.accumulator += frame_time
+        steps = 0
+        while self.accumulator >= self.dt:
+            if steps == max_steps:
+                self.accumulator = 0.0
+                break
+            self.step(self.dt)
+            self.accumulator -= self.dt
+            self.ticks += 1
+            steps += 1
+        return steps
+
+    def reset(self):
+        self.accumulator = 0.0
+        self.ticks = 0
+
+
+def lerp(previous, current, alpha):
+    return previous + (current - previous) * alpha
@@ -0,0 +1,105 @@
+from kivy.clock import Clock
+from kivy.core.text import Label as CoreLabel
+from kivy.graphics import Color, Rectangle
+from kivy.properties import ListProperty, NumericProperty, StringProperty
+from kivy.uix.widget import Widget
+
+
+""" Text drawn from glyph atlases. The printable ASCII characters of a font, at a
+    given size, are rendered once into a few textures, and a GlyphLabel draws its
+    text as one quad per character showing that character's region. Changing the
+    text only moves quads around and swaps their regions: nothing is rasterized and
+    no texture is uploaded, unlike a Label which renders its whole string again.
+
+"""
+
+FONT = './Minecraft.ttf'
+CHARSET = ''.join(chr(code) for code in range(32, 127))
+# characters per atlas texture, so that big font sizes stay well within the GPU's texture size limit
+CHUNK = 32
+# rendered between two glyphs so that antialiasing never bleeds from one into the next
+GAP = ' '
+
+_atlases = {}
+
+
+def glyph_atlas(font_name=FONT, font_size=15):
+    # one atlas per font and size, built the first time it's asked for
+    key = (font_name, font_size)
+    atlas = _atlases.get(key)
+    if atlas is None:
+        atlas = _atlases[key] = GlyphAtlas(font_name, font_size)
+    return atlas
+
+
+class GlyphAtlas:
+    def __init__(self, font_name, font_size, charset=CHARSET):
+        self.font_name = font_name
+        self.font_size = font_size
+        self.glyphs = {}
+        self.height = 0
+        for start in range(0, len(charset), CHUNK):
+            self._render(charset[start:start + CHUNK])
+
+    def _render(self, chars):
+        # one texture for chars, every char gets the region where it was drawn
+        text = GAP.join(chars)
+        label = CoreLabel(text=text, font_name=self.font_name, font_size=self.font_size)
+        label.refresh()
+        texture = label.texture
+        self.height = max(self.height, texture.height)
+        for index, char in enumerate(chars):
+            x = label.get_extents(text[:index * (len(GAP) + 1)])[0] if index else 0
+            width = label.get_extents(char)[0]
+            self.glyphs[char] = texture.get_region(x, 0, width, texture.height)
+
+    def glyph(self, char):
+        # characters outside the charset (accents, other scripts...) are rendered on first use
+        texture = self.glyphs.get(char)
+        if texture is None:
+            self._render(char)
+            texture = self.glyphs[char]
+        return texture
+
+
+class GlyphLabel(Widget):
+    # Stands in for a single line Label whose text changes often or keeps coming back (scores,
+    # list rows, messages), with the same text, font_name, font_size and color properties.
+    # The text is centered in the widget, like a Label's.
+    text = StringProperty('')
+    font_name = StringProperty(FONT)
+    font_size = NumericProperty('15sp')
+    color = ListProperty([1, 1, 1, 1])
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        with self.canvas:
+            self.tint = Color(*self.color)
+        # the quads only ever grow in number, the ones not needed by the text are left empty
+        self.quads = []
+        # laid out once per frame at most, like a Label is rendered, and after its properties are all set
+        self.trigger_layout = Clock.create_trigger(self.layout, -1)
+        self.bind(text=self.trigger_layout, font_name=self.trigger_layout, font_size=self.trigger_layout,
+                  pos=self.trigger_layout, size=self.trigger_layout, color=self.update_color)
+        self.trigger_layout()
+
+    def update_color(self, instance, color):
+        self.tint.rgba = color
+
+    def layout(self, *args):
+        atlas = glyph_atlas(self.font_name, self.font_size)
+        glyphs = [atlas.glyph(char) for char in self.text]
+        while len(self.quads) < len(glyphs):
+            quad = Rectangle(size=(0, 0))
+            self.canvas.add(quad)
+            self.quads.append(quad)
+        # whole pixels, or the pixel font gets blurry
+        x = int(self.center_x - sum(texture.width for texture in glyphs) / 2)
+        y = int(self.center_y - atlas.height / 2)
+        for quad, texture in zip(self.quads, glyphs):
+            quad.texture = texture
+            quad.pos = (x, y)
+            quad.size = texture.size
+            x += texture.width
+        for quad in self.quads[len(glyphs):]:
+            quad.size = (0, 0)
@@ -0,0 +1,297 @@
+import io
+import os
+import csv
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+""" The leaderboard as an SQLite file. Entries are indexed by score, and every insert
+    also updates a few summaries: each player's best score, the number of entries
+    per score and the total number of entries. The top K, pages (read from where the
+    previous one ended), ranks, the entry count and each player's best are then all
+    index lookups, none of them reads the whole table. The old leaderboard.csv is
+    imported when the store is opened, and only the lines added since the last
+    import are read.
+
+    Scores are written by LeaderboardWriter on its own thread, in batches. Every
+    write is one transaction, and SQLite's file locks keep several game processes
+    sharing the file from mixing their writes.
+
+"""
+
+DB_PATH = 'leaderboard.db'
+CSV_PATH = 'leaderboard.csv'
+# how long a write waits for another process holding the file, in seconds
+LOCK_TIMEOUT = 30
+# the writer waits less at a time: a batch it can't write is tried again anyway, and closing
+# the writer must not be stuck behind a long wait
+WRITER_LOCK_TIMEOUT = 2
+# seconds before the writer tries a failed batch again when nothing new comes in
+RETRY_DELAY = 60
+# fsync policy -> SQLite synchronous mode: 'always' syncs every commit, 'batch' only
+# at checkpoints (a crash may lose the last commits, never corrupt the file), 'never' leaves it to the OS
+FSYNC_POLICIES = {'always': 'FULL', 'batch': 'NORMAL', 'never': 'OFF'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scores (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    score INTEGER NOT NULL
+);
+-- ties keep the order the scores were submitted in
+CREATE INDEX IF NOT EXISTS scores_by_score ON scores (score DESC, id);
+-- replaced by the best table
+DROP INDEX IF EXISTS scores_by_name;
+-- the best score of every player
+CREATE TABLE IF NOT EXISTS best (
+    name TEXT PRIMARY KEY,
+    score INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS best_by_score ON best (score DESC);
+-- how many entries have each score, a rank adds up the counts above it instead of counting entries
+CREATE TABLE IF NOT EXISTS score_counts (
+    score INTEGER PRIMARY KEY,
+    count INTEGER NOT NULL
+);
+-- a single row, the number of entries
+CREATE TABLE IF NOT EXISTS totals (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    entries INTEGER NOT NULL
+);
+-- how many bytes of each csv file were already imported
+CREATE TABLE IF NOT EXISTS imports (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL
+);
+"""
+
+
+class LeaderboardStore:
+    # Entries are (name, score) tuples, best score first. Ranks start at 1.
+    # A store belongs to the thread that opened it, like its SQLite connection.
+    def __init__(self, path=DB_PATH, csv_path=CSV_PATH, fsync='always', lock_timeout=LOCK_TIMEOUT):
+        # autocommit mode, transactions are opened by _write()
+        self.connection = sqlite3.connect(path, timeout=lock_timeout, isolation_level=None)
+        # the write-ahead log lets the screen read while another thread or process writes
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous={}'.format(FSYNC_POLICIES[fsync]))
+        self.connection.executescript(SCHEMA)
+        self._summarize()
+        if csv_path is not None:
+            self.import_csv(csv_path)
+
+    def close(self):
+        self.connection.close()
+
+    @contextmanager
+    def _write(self):
+        # take the write lock right away, so two processes can't both read the same state and then write
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield self.connection
+        except BaseException:
+            self.connection.execute('ROLLBACK')
+            raise
+        self.connection.execute('COMMIT')
+
+    def _summarize(self):
+        # a file made before the summary tables existed gets them filled once, from its entries
+        if self.connection.execute('SELECT 1 FROM totals').fetchone() is not None:
+            return
+        with self._write() as connection:
+            # another process may have done it while we waited for the lock
+            if connection.execute('SELECT 1 FROM totals').fetchone() is not None:
+                return
+            connection.execute('INSERT OR REPLACE INTO best (name, score) SELECT name, MAX(score) FROM scores GROUP BY name')
+            connection.execute('INSERT OR REPLACE INTO score_counts (score, count) '
+                               'SELECT score, COUNT(*) FROM scores GROUP BY score')
+            connection.execute('INSERT INTO totals (id, entries) SELECT 0, COUNT(*) FROM scores')
+
+    @staticmethod
+    def _insert(connection, entries):
+        # the entries and their share of every summary, inside the caller's transaction
+        connection.executemany('INSERT INTO scores (name, score) VALUES (?, ?)', entries)
+        connection.executemany('INSERT INTO best (name, score) VALUES (?, ?) '
+                               'ON CONFLICT (name) DO UPDATE SET score = MAX(score, excluded.score)', entries)
+        connection.executemany('INSERT INTO score_counts (score, count) VALUES (?, 1) '
+                               'ON CONFLICT (score) DO UPDATE SET count = count + 1',
+                               [(score,) for _, score in entries])
+        connection.execute('UPDATE totals SET entries = entries + ?', (len(entries),))
+
+    def import_csv(self, csv_path):
+        # add the rows appended to the csv since the last import, returns how many were added
+        if not os.path.exists(csv_path):
+            return 0
+        key = os.path.abspath(csv_path)
+        with self._write() as connection:
+            row = connection.execute('SELECT size FROM imports WHERE path = ?', (key,)).fetchone()
+            done = row[0] if row else 0
+            with open(csv_path, 'rb') as file:
+                file.seek(done)
+                data = file.read()
+            # a line still being written has no newline yet, it will be imported next time
+            end = data.rfind(b'\n') + 1
+            entries = []
+            for line in csv.reader(io.StringIO(data[:end].decode('utf-8', errors='replace'))):
+                try:
+                    name, score = line
+                    entries.append((name, int(score)))
+                except ValueError:
+                    # This catches lines that don't correctly split into name and score
+                    print(f"Skipping malformed line: {','.join(line)}")
+            self._insert(connection, entries)
+            connection.execute('INSERT OR REPLACE INTO imports (path, size) VALUES (?, ?)', (key, done + end))
+        return len(entries)
+
+    def add(self, name, score):
+        self.add_many([(name, score)])
+
+    def add_many(self, entries):
+        # all or nothing, in a single transaction
+        with self._write() as connection:
+            self._insert(connection, [(name, int(score)) for name, score in entries])
+
+    def __len__(self):
+        return self.connection.execute('SELECT entries FROM totals').fetchone()[0]
+
+    def page(self, start, count):
+        # count entries from rank start + 1 on. The index is walked from the top, so deep
+        # pages cost as much as their start: to go through the list use page_after()
+        return self.connection.execute('SELECT name, score FROM scores ORDER BY score DESC, id LIMIT ? OFFSET ?',
+                                       (count, start)).fetchall()
+
+    def page_after(self, after, count):
+        # count entries as (name, score, id), from the top when after is None, else right
+        # after the entry whose (score, id) it is, however deep that is.
+        # Two index seeks: the rest of after's score, then the lower scores
+        if after is None:
+            return self.connection.execute('SELECT name, score, id FROM scores ORDER BY score DESC, id LIMIT ?',
+                                           (count,)).fetchall()
+        score, last_id = after
+        entries = self.connection.execute('SELECT name, score, id FROM scores WHERE score = ? AND id > ? '
+                                          'ORDER BY id LIMIT ?', (score, last_id, count)).fetchall()
+        if len(entries) < count:
+            entries += self.connection.execute('SELECT name, score, id FROM scores WHERE score < ? '
+                                               'ORDER BY score DESC, id LIMIT ?',
+                                               (score, count - len(entries))).fetchall()
+        return entries
+
+    def top(self, k):
+        return self.page(0, k)
+
+    def rank(self, score):
+        # the rank a new entry with this score would get, one row read per distinct score above it
+        return self.connection.execute('SELECT COALESCE(SUM(count), 0) FROM score_counts WHERE score >= ?',
+                                       (score,)).fetchone()[0] + 1
+
+    def best(self, name):
+        # the best score of a player, None if they never played
+        row = self.connection.execute('SELECT score FROM best WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else None
+
+    def best_per_player(self, k):
+        # the k players with the best scores, one entry each
+        return self.connection.execute('SELECT name, score FROM best ORDER BY score DESC LIMIT ?', (k,)).fetchall()
+
+
+class Submission:
+    # a score handed to the writer, saved turns True once it is committed
+    __slots__ = ('name', 'score', 'saved')
+
+    def __init__(self, name, score):
+        self.name = name
+        self.score = int(score)
+        self.saved = False
+
+
+class LeaderboardWriter:
+    # Saves submitted scores on a background thread with its own store, so submitting never
+    # waits on the disk. Whatever queued up while a batch was being written goes in the next
+    # one, as a single transaction. on_saved(batch) is called from the writer thread after
+    # every commit. A batch that can't be written is kept and written with the next one (or
+    # after RETRY_DELAY), on_failed(batch) being called each time; whatever is still unsaved
+    # when the writer closes is appended to the csv, which the next store imports. Once closing,
+    # a batch that fails isn't retried, it goes to the csv straight away.
+    def __init__(self, path=DB_PATH, fsync='always', batch_size=64, on_saved=None, retries=5, on_failed=None,
+                 csv_path=CSV_PATH):
+        self.path = path
+        self.csv_path = csv_path
+        self.on_failed = on_failed
+        self.fsync = fsync
+        self.batch_size = batch_size
+        self.on_saved = on_saved
+        self.retries = retries
+        self.queue = queue.Queue()
+        self.closing = threading.Event()
+        self.thread = threading.Thread(target=self._work, daemon=True)
+        self.thread.start()
+
+    def submit(self, name, score):
+        submission = Submission(name, score)
+        self.queue.put(submission)
+        return submission
+
+    def close(self, timeout=None):
+        # write what's left and stop the thread, waiting at most timeout seconds for it
+        self.closing.set()
+        self.queue.put(None)
+        self.thread.join(timeout)
+
+    def _work(self):
+        # the writer's own store, opened by the first _save() that manages to
+        self.store = None
+        # submissions of the batches that failed, tried again first
+        held = []
+        running = True
+        while running:
+            try:
+                batch = [self.queue.get(timeout=RETRY_DELAY if held else None)]
+            except queue.Empty:
+                batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            running = None not in batch
+            batch = held + [submission for submission in batch if submission is not None]
+            if not batch:
+                continue
+            if self._save(batch):
+                held = []
+                for submission in batch:
+                    submission.saved = True
+                if self.on_saved is not None:
+                    self.on_saved(batch)
+            else:
+                held = batch
+                if self.on_failed is not None:
+                    self.on_failed(batch)
+        if self.store is not None:
+            self.store.close()
+        if held and self.csv_path is not None:
+            self._keep(held)
+
+    def _keep(self, batch):
+        # last resort, the scores go where the store imports from when it's next opened
+        with open(self.csv_path, 'a', newline='', encoding='utf-8') as file:
+            csv.writer(file).writerows((submission.name, submission.score) for submission in batch)
+
+    def _save(self, batch):
+        for attempt in range(self.retries):
+            try:
+                if self.store is None:
+                    self.store = LeaderboardStore(self.path, csv_path=None, fsync=self.fsync,
+                                                  lock_timeout=WRITER_LOCK_TIMEOUT)
+                self.store.add_many([(submission.name, submission.score) for submission in batch])
+                return True
+            except sqlite3.DatabaseError as error:
+                # another process kept the file locked for longer than WRITER_LOCK_TIMEOUT, or the
+                # file can't be written at all (disk full, corrupt...): the batch is held either way
+                print(f"Leaderboard write failed ({error}), retrying")
+            # waiting stops as soon as the writer is closed
+            if self.closing.wait(2 ** attempt):
+                break
+        return False
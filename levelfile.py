@@ -0,0 +1,231 @@
+import os
+import sys
+import json
+import struct
+import hashlib
+from array import array
+
+from simulation import Body, MirrorState, Wormhole, World, rock_column, rock_row
+
+
+""" Levels as data. Each level is described in levels/levelN.json, with positions
+    given as fractions of the window (plus optional dx/dy in pixels) and sizes in
+    pixels. build_levels.py compiles them for the game window into levels/levelN.bin:
+    the block and mirror boxes, the grid cells of every block and the wall vertex
+    buffers, all stored as flat arrays, so loading a level is a single read and
+    nothing gets laid out or indexed again at runtime. The .bin keeps the size and a
+    hash of the level file it was compiled from. Loading only compares the size with
+    the level file's (a stat, the file isn't read); with CHECK_SOURCES on (python
+    Main.py -- --dev) the hash is checked too, and build_levels.py --check checks
+    every level. A stale .bin is ignored and the level file compiled at load time
+    until build_levels.py is run.
+
+"""
+
+LEVEL_DIR = 'levels'
+MAGIC = b'SWLV'
+VERSION = 3
+# magic, version, size and SHA-256 of the level file, window width and height, flags, enemy box
+HEADER = struct.Struct('<4sHQ32sddB4d')
+COUNT = struct.Struct('<I')
+# also hash the level file on every load, not just compare its size: for whoever edits levels
+CHECK_SOURCES = False
+
+# flags
+EXCLUSIVE_FIRE = 1
+CHAIN_REACTION = 2
+HAS_WORMHOLE = 4
+
+
+class CompiledLevel:
+    # A level laid out for one window size. Boxes are flat arrays of (x, y, w, h),
+    # mirrors add a fifth value (1 when vertical), cells are (block index, column, row)
+    # triples and vertices the 4 corners (x, y) of every block's quad.
+    SECTIONS = (('rocks', 'd'), ('perpetios', 'd'), ('mirrors', 'd'), ('wormhole', 'd'),
+                ('rock_cells', 'i'), ('perpetio_cells', 'i'),
+                ('rock_vertices', 'f'), ('perpetio_vertices', 'f'))
+
+    def __init__(self, width, height, flags=0, enemy=(0, 0, 0, 0), source=(0, bytes(32))):
+        self.width = width
+        self.height = height
+        self.flags = flags
+        self.enemy = enemy
+        # (size, digest()) of the level file this was compiled from
+        self.source = source
+        for name, typecode in self.SECTIONS:
+            setattr(self, name, array(typecode))
+
+    def to_bytes(self):
+        chunks = [HEADER.pack(MAGIC, VERSION, *self.source, self.width, self.height, self.flags, *self.enemy)]
+        for name, _ in self.SECTIONS:
+            values = getattr(self, name)
+            if sys.byteorder == 'big':
+                # the file is little endian whatever machine wrote it
+                values = array(values.typecode, values)
+                values.byteswap()
+            chunks.append(COUNT.pack(len(values)))
+            chunks.append(values.tobytes())
+        return b''.join(chunks)
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, version, size, source, width, height, flags, *enemy = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('not a compiled level, or compiled by another version')
+        level = cls(width, height, flags, tuple(enemy), (size, source))
+        offset = HEADER.size
+        for name, typecode in cls.SECTIONS:
+            (count,) = COUNT.unpack_from(data, offset)
+            offset += COUNT.size
+            values = getattr(level, name)
+            size = count * values.itemsize
+            values.frombytes(data[offset:offset + size])
+            if sys.byteorder == 'big':
+                values.byteswap()
+            offset += size
+        return level
+
+
+def place(box, width, height):
+    # a {x, y, w, h} box of the level file in window pixels
+    return Body(box['x'] * width + box.get('dx', 0), box['y'] * height + box.get('dy', 0), box['w'], box['h'])
+
+
+def lay_out(shapes, width, height):
+    # the blocks of a list of rows and columns, in the order they are listed
+    bodies = []
+    for shape in shapes:
+        if 'row' in shape:
+            row = shape['row']
+            bodies += rock_row(row['y'] * height, row['x'] * width, row['spacing'] * width, row['count'],
+                               width, height)
+        else:
+            column = shape['column']
+            bodies += rock_column(column['x'] * width, column['count'], column['lift'], width, height)
+    return bodies
+
+
+def describe(description, width, height):
+    # the World a level file describes, built the slow way: every block placed and indexed one by one
+    world = World(width, height, exclusive_fire=description.get('exclusive_fire', False),
+                  chain_reaction=description.get('chain_reaction', False))
+    world.enemy = place(description['enemy'], width, height)
+    world.add_rocks(lay_out(description.get('rocks', ()), width, height))
+    world.add_perpetios(lay_out(description.get('perpetios', ()), width, height))
+    world.add_mirrors([MirrorState(place(mirror, width, height), vertical=mirror['vertical'])
+                       for mirror in description.get('mirrors', ())])
+    if 'wormhole' in description:
+        wormhole = description['wormhole']
+        world.wormhole = Wormhole(front=place(wormhole['front'], width, height),
+                                  rear=place(wormhole['rear'], width, height))
+    return world
+
+
+def digest(data):
+    return hashlib.sha256(data).digest()
+
+
+def compile_level(description, width, height, source=(0, bytes(32))):
+    # lay the level out once and keep everything the runtime would otherwise recompute,
+    # source is the (size, digest()) of the level file the description was read from
+    world = describe(description, width, height)
+    flags = ((EXCLUSIVE_FIRE if world.exclusive_fire else 0) | (CHAIN_REACTION if world.chain_reaction else 0)
+             | (HAS_WORMHOLE if world.wormhole is not None else 0))
+    level = CompiledLevel(width, height, flags, (world.enemy.x, world.enemy.y, world.enemy.w, world.enemy.h),
+                          source)
+    for obstacles, boxes, cells, vertices in ((world.rocks, level.rocks, level.rock_cells, level.rock_vertices),
+                                              (world.perpetios, level.perpetios, level.perpetio_cells,
+                                               level.perpetio_vertices)):
+        for index, body in enumerate(obstacles):
+            x, y, w, h = body.x, body.y, body.w, body.h
+            boxes.extend((x, y, w, h))
+            for column, row in obstacles.cells(body):
+                cells.extend((index, column, row))
+            vertices.extend((x, y, x + w, y, x + w, y + h, x, y + h))
+    for mirror in world.mirrors:
+        body = mirror.body
+        level.mirrors.extend((body.x, body.y, body.w, body.h, 1 if mirror.vertical else 0))
+    if world.wormhole is not None:
+        for body in (world.wormhole.front, world.wormhole.rear):
+            level.wormhole.extend((body.x, body.y, body.w, body.h))
+    return level
+
+
+def bodies(boxes):
+    return [Body(*boxes[i:i + 4]) for i in range(0, len(boxes), 4)]
+
+
+def block_cells(triples, count):
+    # (index, column, row) triples back into one list of cells per block
+    cells = [[] for _ in range(count)]
+    for i in range(0, len(triples), 3):
+        cells[triples[i]].append((triples[i + 1], triples[i + 2]))
+    return cells
+
+
+def build_world(level, score=10000):
+    # the World of a compiled level, nothing is laid out or hashed again
+    world = World(level.width, level.height, score, exclusive_fire=bool(level.flags & EXCLUSIVE_FIRE),
+                  chain_reaction=bool(level.flags & CHAIN_REACTION))
+    world.enemy = Body(*level.enemy)
+    rocks = bodies(level.rocks)
+    world.add_rocks(rocks, block_cells(level.rock_cells, len(rocks)))
+    perpetios = bodies(level.perpetios)
+    world.add_perpetios(perpetios, block_cells(level.perpetio_cells, len(perpetios)))
+    mirrors = level.mirrors
+    world.add_mirrors([MirrorState(Body(*mirrors[i:i + 4]), vertical=bool(mirrors[i + 4]))
+                       for i in range(0, len(mirrors), 5)])
+    if level.flags & HAS_WORMHOLE:
+        front, rear = bodies(level.wormhole)
+        world.wormhole = Wormhole(front=front, rear=rear)
+    world.vertices = {'rocks': level.rock_vertices, 'perpetios': level.perpetio_vertices}
+    return world
+
+
+def source_path(number):
+    return os.path.join(LEVEL_DIR, 'level{}.json'.format(number))
+
+
+def compiled_path(number):
+    return os.path.join(LEVEL_DIR, 'level{}.bin'.format(number))
+
+
+def compile_file(path, width, height):
+    # compile a level file, the level remembers which version of the file it came from
+    with open(path, 'rb') as file:
+        data = file.read()
+    return compile_level(json.loads(data), width, height, (len(data), digest(data)))
+
+
+def stale(level, path, check_hash):
+    # whether the level file at path changed since level was compiled from it
+    size, source = level.source
+    if os.stat(path).st_size != size:
+        return True
+    if check_hash:
+        with open(path, 'rb') as file:
+            return digest(file.read()) != source
+    return False
+
+
+def load(number, width, height):
+    # the compiled level if there is an up to date one for this window size, else compile the level file now
+    try:
+        with open(compiled_path(number), 'rb') as file:
+            level = CompiledLevel.from_bytes(file.read())
+        if stale(level, source_path(number), CHECK_SOURCES):
+            print(f"{compiled_path(number)} was compiled from another version of {source_path(number)}, run build_levels.py")
+        elif (level.width, level.height) == (width, height):
+            return level
+    except (OSError, ValueError, struct.error):
+        pass
+    return compile_file(source_path(number), width, height)
+
+
+def level_builder(number):
+    def build(width=1000, height=700, score=10000):
+        return build_world(load(number, width, height), score)
+    return build
+
+
+LEVELS = {number: level_builder(number) for number in (1, 2, 3)}
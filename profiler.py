@@ -0,0 +1,103 @@
+import json
+from collections import deque
+from time import perf_counter
+
+
+""" Per-phase frame timing. A frame is cut into laps: every lap(phase) adds the time
+    since the previous lap to that phase, so a phase visited many times in a frame
+    (one lap per projectile, one per simulation step...) sums up. end_frame() files
+    the frame's totals into a rolling window per phase, and the percentiles are
+    computed from those windows when someone asks for them.
+
+    A frame runs from the game's update to the window's draw. Whatever happens in
+    between that isn't the game's (input, Clock triggers) is skip()ped, so it's in
+    the frame's total but in no phase, and the time spent waiting for the next
+    frame is in neither.
+
+    The game only creates a FrameProfiler while the overlay is shown. Everything it
+    instruments takes a profiler=None argument and skips the laps when it's None.
+
+"""
+
+# timers: the world's timer wheel, movement: tank and cannon, power: the power bar,
+# collision: shells swept against the rocks and perpetios, enemy: everything tested against
+# the enemy, shells: the rest of the bullets' and cupcakes' flight and their hits, mirrors:
+# lasers bouncing off mirrors, lasers: the rest of the lasers' flight, events: the widget
+# reacting to the step, sync: the widget moving its graphics, draw: the window drawing them
+PHASES = ('timers', 'movement', 'power', 'collision', 'enemy', 'shells', 'mirrors', 'lasers', 'events',
+          'sync', 'draw')
+# frames kept per phase, 10 seconds at 60 FPS
+WINDOW = 600
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(ordered, point):
+    # nearest rank percentile of an already sorted list
+    if not ordered:
+        return 0.0
+    rank = max(int(round(point / 100 * len(ordered))) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class FrameProfiler:
+    def __init__(self, phases=PHASES, window=WINDOW):
+        self.phases = phases
+        self.totals = dict.fromkeys(phases, 0.0)
+        # 'frame' is the whole frame, phases and whatever isn't covered by them
+        self.samples = {phase: deque(maxlen=window) for phase in phases + ('frame',)}
+        self.frame_start = self.last = perf_counter()
+        self.frames = 0
+        # between start_frame() and end_frame()
+        self.in_frame = False
+
+    def start_frame(self):
+        if self.in_frame:
+            # the last frame had nothing to draw, it ended with its last lap
+            self.end_frame(self.last)
+        self.frame_start = self.last = perf_counter()
+        self.in_frame = True
+
+    def lap(self, phase):
+        # the time since the last lap (or the start of the frame) goes to phase
+        now = perf_counter()
+        self.totals[phase] += now - self.last
+        self.last = now
+
+    def skip(self):
+        # the time since the last lap goes to no phase
+        self.last = perf_counter()
+
+    def end_frame(self, end=None):
+        totals = self.totals
+        for phase in self.phases:
+            self.samples[phase].append(totals[phase])
+            totals[phase] = 0.0
+        self.samples['frame'].append((perf_counter() if end is None else end) - self.frame_start)
+        self.frames += 1
+        self.in_frame = False
+
+    def percentiles(self, phase, points=PERCENTILES):
+        # seconds, one value per point
+        ordered = sorted(self.samples[phase])
+        return [percentile(ordered, point) for point in points]
+
+    def summary(self):
+        # phase -> {'p50': seconds, ...}
+        return {phase: dict(zip((f'p{point}' for point in PERCENTILES), self.percentiles(phase)))
+                for phase in self.samples}
+
+    def report(self):
+        # one line per phase in milliseconds, for the overlay
+        lines = ['{:9} {}'.format('ms', ' '.join(f'{"p" + str(point):>6}' for point in PERCENTILES))]
+        for phase in self.samples:
+            lines.append('{:9} {}'.format(phase, ' '.join(f'{value * 1000:6.2f}'
+                                                         for value in self.percentiles(phase))))
+        return '\n'.join(lines)
+
+    def dump(self, path, **info):
+        # percentiles and the raw frame samples (seconds) as JSON, info is stored alongside
+        with open(path, 'w') as file:
+            json.dump(dict(info, frames=self.frames, window=len(self.samples['frame']),
+                           percentiles=self.summary(),
+                           samples={phase: list(values) for phase, values in self.samples.items()}),
+                      file, indent=1)
@@ -0,0 +1,85 @@
+""" Pool of projectiles kept as a struct of arrays: one list per field, one index
+    (slot) per projectile. Everything is allocated up front, spawning just takes a
+    free slot, and only the live slots are ever looked at, so dead projectiles
+    cost nothing.
+
+"""
+
+BULLET = 0
+CUPCAKE = 1
+LASER = 2
+KINDS = (BULLET, CUPCAKE, LASER)
+
+
+class ProjectilePool:
+    def __init__(self, capacity=64):
+        self.capacity = capacity
+        self.kind = [BULLET] * capacity
+        # hit box
+        self.x = [0.0] * capacity
+        self.y = [0.0] * capacity
+        self.w = [0.0] * capacity
+        self.h = [0.0] * capacity
+        # launch state: shells follow the trajectory (x0, y0, vx, vy) from start_time,
+        # lasers slide along path, travelled pixels so far
+        self.x0 = [0.0] * capacity
+        self.y0 = [0.0] * capacity
+        self.vx = [0.0] * capacity
+        self.vy = [0.0] * capacity
+        self.start_time = [0.0] * capacity
+        self.angle = [0.0] * capacity
+        self.path = [None] * capacity
+        self.travelled = [0.0] * capacity
+        self.colliding = [False] * capacity
+
+        # free slots as a stack, live slots packed at the front of `live`
+        self.free = list(range(capacity - 1, -1, -1))
+        self.live = []
+        self.position = [-1] * capacity
+        self.in_flight = [0] * len(KINDS)
+
+    def __len__(self):
+        return len(self.live)
+
+    def spawn(self, kind, x, y, w, h):
+        # returns the slot, or None when every slot is taken
+        if not self.free:
+            return None
+        slot = self.free.pop()
+        self.kind[slot] = kind
+        self.x[slot] = x
+        self.y[slot] = y
+        self.w[slot] = w
+        self.h[slot] = h
+        self.colliding[slot] = False
+        self.position[slot] = len(self.live)
+        self.live.append(slot)
+        self.in_flight[kind] += 1
+        return slot
+
+    def kill(self, slot):
+        # swap the last live slot into the hole, so killing is O(1)
+        index = self.position[slot]
+        if index < 0:
+            return
+        last = self.live.pop()
+        if last != slot:
+            self.live[index] = last
+            self.position[last] = index
+        self.position[slot] = -1
+        self.path[slot] = None
+        self.in_flight[self.kind[slot]] -= 1
+        self.free.append(slot)
+
+    def alive(self, slot):
+        return self.position[slot] >= 0
+
+    def rect(self, slot):
+        return ((self.x[slot], self.y[slot]), (self.w[slot], self.h[slot]))
+
+    def live_of(self, kind):
+        return [slot for slot in self.live if self.kind[slot] == kind]
+
+    def clear(self):
+        for slot in list(self.live):
+            self.kill(slot)
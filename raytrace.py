@@ -0,0 +1,155 @@
+import math
+from bisect import bisect_right
+
+
+""" Ray tracing for the laser. The whole reflected path is computed in one go
+    when the laser is fired, then the laser just slides along it, so there is
+    no per-frame collision work for it anymore.
+
+    The laser's hit box is its 100 x 10 rectangle anchored at the translation
+    point (it is never rotated for collisions), so instead of moving a box we
+    trace that point against every target grown by the laser size. The hits
+    are the same ones the box would get.
+
+"""
+
+# a path can't bounce forever between two mirrors
+MAX_BOUNCES = 32
+# how far a reflected laser is pushed off the mirror, like reflect_laser always did
+MIRROR_NUDGE = 5
+
+
+def grow(rect, size):
+    # Minkowski sum of a target with the laser box: the point is inside the result
+    # exactly when the laser box overlaps the target
+    (x, y), (w, h) = rect
+    return ((x - size[0], y - size[1]), (w + size[0], h + size[1]))
+
+
+def ray_box(ox, oy, dx, dy, rect):
+    # Distance interval (enter, leave) along the ray (unit direction) spent strictly inside rect,
+    # or None if the ray misses it or it lies behind the origin
+    (x, y), (w, h) = rect
+    t_enter, t_exit = -math.inf, math.inf
+    for origin, delta, low, high in ((ox, dx, x, x + w), (oy, dy, y, y + h)):
+        if delta == 0:
+            if not low < origin < high:
+                return None
+            continue
+        t0 = (low - origin) / delta
+        t1 = (high - origin) / delta
+        if t0 > t1:
+            t0, t1 = t1, t0
+        t_enter = max(t_enter, t0)
+        t_exit = min(t_exit, t1)
+    if t_enter >= t_exit or t_exit <= 0:
+        return None
+    return max(t_enter, 0.0), t_exit
+
+
+def ray_exit(ox, oy, dx, dy, bounds):
+    # distance at which the point leaves the (left, bottom, right, top) area, 0 if already outside
+    left, bottom, right, top = bounds
+    if not (left <= ox <= right and bottom <= oy <= top):
+        return 0.0
+    t = math.inf
+    if dx > 0:
+        t = min(t, (right - ox) / dx)
+    elif dx < 0:
+        t = min(t, (left - ox) / dx)
+    if dy > 0:
+        t = min(t, (top - oy) / dy)
+    elif dy < 0:
+        t = min(t, (bottom - oy) / dy)
+    return t
+
+
+class LaserPath:
+    # A traced laser: straight segments between bounces, and what stops it at the end.
+    # end_kind is 'enemy', 'solid' or 'out' (left the window), end_target the thing it hit.
+    def __init__(self):
+        # (start x, start y, direction x, direction y, angle in degrees, distance at the start)
+        self.segments = []
+        self.starts = []
+        # (distance along the path, mirror) for every reflection
+        self.bounces = []
+        self.length = 0.0
+        self.end_kind = 'out'
+        self.end_target = None
+
+    def add_segment(self, x, y, dx, dy, start):
+        self.segments.append((x, y, dx, dy, math.degrees(math.atan2(dy, dx)), start))
+        self.starts.append(start)
+
+    def position(self, travelled):
+        # (x, y, angle) of the laser after it has travelled that many pixels along the path
+        travelled = min(travelled, self.length)
+        index = max(bisect_right(self.starts, travelled) - 1, 0)
+        x, y, dx, dy, angle, start = self.segments[index]
+        along = travelled - start
+        return x + dx * along, y + dy * along, angle
+
+    def points(self):
+        # the polyline, e.g. to draw an aiming guide
+        corners = [(x, y) for x, y, _, _, _, _ in self.segments]
+        corners.append(self.position(self.length)[:2])
+        return corners
+
+
+def trace(origin, angle, laser_size, mirrors, solids, enemy, bounds, cooldown_distance, initial_cooldowns=None):
+    # Follow the laser from origin (angle in degrees) until it hits the enemy or a solid
+    # block or leaves the bounds. mirrors are objects with .body and .vertical; a mirror that
+    # reflected the laser is ignored for the next cooldown_distance pixels, like the old
+    # per-mirror cooldown. initial_cooldowns maps mirrors to distances still on cooldown.
+    x, y = origin
+    radians = math.radians(angle)
+    dx, dy = math.cos(radians), math.sin(radians)
+    grown_mirrors = [(mirror, grow(mirror.body.rect(), laser_size)) for mirror in mirrors]
+    grown_solids = [(solid, grow(solid.rect(), laser_size)) for solid in solids]
+    grown_enemy = grow(enemy.rect(), laser_size) if enemy is not None else None
+    available = dict(initial_cooldowns or {})
+
+    path = LaserPath()
+    travelled = 0.0
+    path.add_segment(x, y, dx, dy, travelled)
+    for _ in range(MAX_BOUNCES + 1):
+        best, kind, target = ray_exit(x, y, dx, dy, bounds), 'out', None
+        for solid, rect in grown_solids:
+            span = ray_box(x, y, dx, dy, rect)
+            if span is not None and span[0] <= best:
+                best, kind, target = span[0], 'solid', solid
+        if grown_enemy is not None:
+            span = ray_box(x, y, dx, dy, grown_enemy)
+            if span is not None and (span[0] < best or (span[0] == best and kind == 'out')):
+                best, kind, target = span[0], 'enemy', enemy
+        for mirror, rect in grown_mirrors:
+            span = ray_box(x, y, dx, dy, rect)
+            if span is None:
+                continue
+            # still cooling down when we get there: it can only reflect once the cooldown is over
+            hit = max(span[0], available.get(mirror, 0.0) - travelled)
+            if hit < span[1] and hit < best:
+                best, kind, target = hit, 'mirror', mirror
+
+        travelled += best
+        if kind != 'mirror':
+            path.length = travelled
+            path.end_kind = kind
+            path.end_target = target
+            return path
+
+        # reflect and push the laser slightly off the mirror to prevent immediate recollision
+        x, y = x + dx * best, y + dy * best
+        if target.vertical:
+            dx = -dx
+            x += MIRROR_NUDGE
+        else:
+            dy = -dy
+            y += MIRROR_NUDGE
+        path.bounces.append((travelled, target))
+        available[target] = travelled + cooldown_distance
+        path.add_segment(x, y, dx, dy, travelled)
+
+    # gave up bouncing, the laser just fades out there
+    path.length = travelled
+    return path
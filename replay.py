@@ -0,0 +1,188 @@
+import copy
+import struct
+from bisect import bisect_right
+
+from gameloop import TICK_RATE
+from levelfile import LEVELS
+
+
+""" Input replays. A level session is fully decided by its level, its starting
+    score and the keys pressed at each simulation step, so that's all a recording
+    keeps (plus the seed of the cosmetic randomness): a small header and a couple
+    of bytes per key event. Recording is just appending those bytes.
+
+    Player steps a headless World through a recording, as fast as possible or a
+    step at a time, and can seek anywhere by restoring the closest keyframe (a copy
+    of the World saved every few seconds while playing) and stepping from there.
+
+"""
+
+MAGIC = b'SWRP'
+VERSION = 2
+# magic, version, level, seed, tick rate, starting score (scores are whole points)
+HEADER = struct.Struct('<4sBBIHi')
+# keys the game uses get a one byte code, anything else is stored by name
+KEYS = ('a', 'd', 'w', 's', 'p', 'o', 'spacebar', 'l', 'k')
+END = 0x7e
+LITERAL = 0x7f
+DOWN = 0x80
+# seconds of game time between two keyframes
+KEYFRAME_INTERVAL = 5
+
+
+def write_varint(buffer, value):
+    while value >= 0x80:
+        buffer.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def read_varint(data, offset):
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+class Recording:
+    # events are (tick, key, down) in the order they happened, tick being the number of
+    # simulation steps done before the key; ticks is the length of the whole session
+    def __init__(self, level, seed, score=10000, tick_rate=TICK_RATE, events=None, ticks=0):
+        self.level = level
+        self.seed = seed
+        self.score = int(score)
+        self.tick_rate = tick_rate
+        self.events = events if events is not None else []
+        self.ticks = ticks
+
+    def to_bytes(self):
+        buffer = bytearray(HEADER.pack(MAGIC, VERSION, self.level, self.seed, self.tick_rate, self.score))
+        last = 0
+        for tick, key, down in self.events:
+            write_varint(buffer, tick - last)
+            last = tick
+            code = KEYS.index(key) if key in KEYS else LITERAL
+            buffer.append(code | (DOWN if down else 0))
+            if code == LITERAL:
+                name = key.encode('utf-8')
+                buffer.append(len(name))
+                buffer += name
+        write_varint(buffer, self.ticks - last)
+        buffer.append(END)
+        return bytes(buffer)
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, version, level, seed, tick_rate, score = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('not a replay, or recorded by another version')
+        recording = cls(level, seed, score, tick_rate)
+        offset = HEADER.size
+        tick = 0
+        while True:
+            delta, offset = read_varint(data, offset)
+            tick += delta
+            code = data[offset]
+            offset += 1
+            if code == END:
+                recording.ticks = tick
+                return recording
+            key_code = code & ~DOWN
+            if key_code == LITERAL:
+                length = data[offset]
+                key = bytes(data[offset + 1:offset + 1 + length]).decode('utf-8')
+                offset += 1 + length
+            else:
+                key = KEYS[key_code]
+            recording.events.append((tick, key, bool(code & DOWN)))
+
+    def save(self, path):
+        with open(path, 'wb') as file:
+            file.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as file:
+            return cls.from_bytes(file.read())
+
+
+class Recorder:
+    # Fed by the live game; key() only appends to a list, the bytes are made at the end
+    def __init__(self, level, seed, score=10000, tick_rate=TICK_RATE):
+        self.recording = Recording(level, seed, score, tick_rate)
+
+    def key(self, tick, key, down):
+        self.recording.events.append((tick, key, down))
+
+    def finish(self, ticks):
+        self.recording.ticks = ticks
+        return self.recording
+
+
+class Player:
+    def __init__(self, recording, keyframe_interval=KEYFRAME_INTERVAL):
+        self.recording = recording
+        self.dt = 1 / recording.tick_rate
+        self.keyframe_ticks = max(int(keyframe_interval * recording.tick_rate), 1)
+        self.world = LEVELS[recording.level](score=recording.score)
+        self.tick = 0
+        # index of the next event to feed
+        self.cursor = 0
+        # ticks of the keyframes taken so far, and tick -> (world, cursor)
+        self.keyframe_list = [0]
+        self.keyframes = {0: (copy.deepcopy(self.world), 0)}
+
+    @property
+    def time(self):
+        return self.tick * self.dt
+
+    @property
+    def finished(self):
+        return self.tick >= self.recording.ticks
+
+    def feed(self, world, tick):
+        # press and release, on any world, the keys recorded right before step number tick
+        events = self.recording.events
+        while self.cursor < len(events) and events[self.cursor][0] <= tick:
+            _, key, down = events[self.cursor]
+            if down:
+                world.key_down(key)
+            else:
+                world.key_up(key)
+            self.cursor += 1
+
+    def step(self, profiler=None):
+        # one simulation step of the recording, returns the world's events
+        self.feed(self.world, self.tick)
+        events = self.world.step(self.dt, profiler)
+        self.tick += 1
+        if self.tick % self.keyframe_ticks == 0 and self.tick not in self.keyframes:
+            self.keyframe_list.append(self.tick)
+            self.keyframes[self.tick] = (copy.deepcopy(self.world), self.cursor)
+        return events
+
+    def run_to(self, tick):
+        tick = min(tick, self.recording.ticks)
+        while self.tick < tick:
+            self.step()
+
+    def run(self):
+        # as fast as possible to the end, e.g. to check a score
+        self.run_to(self.recording.ticks)
+        return self.world
+
+    def seek(self, time):
+        # jump to that many seconds into the session
+        tick = min(max(int(round(time / self.dt)), 0), self.recording.ticks)
+        if tick < self.tick or tick - self.tick > self.keyframe_ticks:
+            # restart from the last keyframe before the target, keyframes are never touched themselves
+            start = self.keyframe_list[bisect_right(self.keyframe_list, tick) - 1]
+            if start > self.tick or tick < self.tick:
+                world, self.cursor = self.keyframes[start]
+                self.world = copy.deepcopy(world)
+                self.tick = start
+        self.run_to(tick)
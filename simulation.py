@@ -0,0 +1,494 @@
+import math
+from collections import deque
+
+from ballistics import launch_speed, position
+from collision import ObstacleSet, collides, sweep
+from projectiles import BULLET, CUPCAKE, LASER, ProjectilePool
+from raytrace import trace
+from timers import TimerWheel
+
+
+""" Headless game rules for Sugar Wars. The World holds the whole level as plain
+    data (no canvas instructions, no Window, no SoundLoader) and step(dt) advances
+    it by one tick. The level widgets in Main.py only draw what is in here.
+
+"""
+
+# The same numbers the level widgets have always used
+LASER_SPEED = 1500
+LASER_LENGTH = 100
+BULLET_MASS = 1.5
+CUPCAKE_MASS = 3
+BULLET_COST = 100
+LASER_COST = 100
+CUPCAKE_COST = 200
+# i had to use a higher radius for the cupcake to work properly, using 1000/50 didn't affect any other rocks
+BLAST_RADIUS = 1000 / 25
+MIRROR_COOLDOWN = 0.5
+# after 20 seconds the player starts losing 10 points per second
+HURRY_UP_DELAY = 20
+DEDUCTION = 10
+MIN_POWER = 100
+MAX_POWER = 600
+POWER_STEP = 5
+# the bar used to grow by POWER_STEP on every frame at 60 FPS, now it grows by time
+POWER_SPEED = POWER_STEP * 60
+
+
+class Body:
+    # An axis aligned box in window coordinates, the plain data version of a canvas Rectangle
+    __slots__ = ('x', 'y', 'w', 'h')
+
+    def __init__(self, x, y, w, h):
+        self.x = x
+        self.y = y
+        self.w = w
+        self.h = h
+
+    @property
+    def pos(self):
+        return (self.x, self.y)
+
+    @property
+    def size(self):
+        return (self.w, self.h)
+
+    def rect(self):
+        # same shape collides() expects: ((x, y), (width, height))
+        return ((self.x, self.y), (self.w, self.h))
+
+
+class MirrorState:
+    def __init__(self, body, vertical):
+        self.body = body
+        self.vertical = vertical
+        # while this timer is pending the mirror doesn't reflect, used to avoid multiple collisions
+        self.cooldown_timer = None
+
+    @property
+    def cooling(self):
+        return self.cooldown_timer is not None and self.cooldown_timer.active
+
+
+class Wormhole:
+    def __init__(self, front, rear):
+        self.front = front
+        self.rear = rear
+
+
+class World:
+    def __init__(self, width=1000, height=700, score=10000, exclusive_fire=False, chain_reaction=False,
+                 max_in_flight=1, pool_size=64):
+        self.width = width
+        self.height = height
+        self.score = score
+        # in levels 2 and 3 the bullet and the laser can't be in flight together
+        self.exclusive_fire = exclusive_fire
+        # when True every rock destroyed by a cupcake blasts its own neighbours too
+        self.chain_reaction = chain_reaction
+        # how many projectiles of each kind may fly at once, 1 in the normal game,
+        # more for rapid fire and wave modes
+        self.max_in_flight = max_in_flight
+        self.time = 0.0
+        self.keys = set()
+        self.events = []
+        # the FrameProfiler of the step in progress, if any
+        self.profiler = None
+        # every game timer runs on this wheel, advanced by step()
+        self.timers = TimerWheel()
+        self.hurry_up_timer = self.timers.schedule(HURRY_UP_DELAY, self.start_deducing_points)
+        self.deduce_timer = None
+
+        # the player rectangle, sized and placed like the tank always was
+        sizex = width / 15
+        sizey = height / 15
+        self.player = Body(width / 30, height / 15, sizex, sizey)
+        self.cannon_size = ((sizex / 1.35) / 4.5, sizey)
+        self.cannon_angle = 0.0
+        self.power = MIN_POWER
+
+        self.enemy = Body(width / 1.5, height / 18, 100, 200)
+        self.enemy_hit = False
+        self.collision_left = False
+        self.collision_right = False
+
+        # rocks break when hit, perpetios don't but they stop every projectile.
+        # Both are kept in a grid so projectiles only test the blocks next to them
+        self.rocks = ObstacleSet(width / 10)
+        self.perpetios = ObstacleSet(width / 10)
+        self.mirrors = []
+        self.wormhole = None
+        # wall quads baked by the level compiler ('rocks'/'perpetios' -> 8 corner coordinates
+        # per block, in block order), the renderer builds them itself when they are missing
+        self.vertices = {}
+        # bumped whenever something the laser can hit changes, so the cached path is traced again
+        self.geometry_version = 0
+        self._laser_path_key = None
+        self._laser_path = None
+
+        # every bullet, cupcake and laser in flight lives in this pool
+        self.projectiles = ProjectilePool(pool_size)
+        self.sizes = {BULLET: (width / 100, width / 100), CUPCAKE: (width / 50, width / 50),
+                      LASER: (LASER_LENGTH, width / 100)}
+
+    def add_rocks(self, bodies, cells=None):
+        # cells: the grid cells of every body when the level compiler already worked them out
+        for index, body in enumerate(bodies):
+            self.rocks.add(body, body.rect(), cells[index] if cells else None)
+
+    def add_perpetios(self, bodies, cells=None):
+        for index, body in enumerate(bodies):
+            self.perpetios.add(body, body.rect(), cells[index] if cells else None)
+        self.geometry_version += 1
+
+    def add_mirrors(self, mirrors):
+        self.mirrors.extend(mirrors)
+        self.geometry_version += 1
+
+    # -- input --
+
+    def key_down(self, key):
+        self.keys.add(key)
+        in_flight = self.projectiles.in_flight
+        if key == 'spacebar' and not (self.exclusive_fire and in_flight[LASER]):
+            self.fire_bullet()
+        if key == 'l' and not (self.exclusive_fire and in_flight[BULLET]):
+            self.fire_laser()
+        if key == 'k':
+            self.fire_cupcake()
+
+    def key_up(self, key):
+        self.keys.discard(key)
+
+    # -- weapons --
+
+    def cannon_tip(self):
+        cannon_w, cannon_h = self.cannon_size
+        angle = math.radians(self.cannon_angle + 90)
+        tip_x = self.player.x + self.player.w / 2 + cannon_h * math.cos(angle)
+        tip_y = self.player.y + self.player.h / 2 + cannon_w / 2 + cannon_h * math.sin(angle)
+        return tip_x, tip_y, angle
+
+    def can_fire(self, kind):
+        return self.projectiles.in_flight[kind] < self.max_in_flight
+
+    def _launch(self, kind, mass, cost):
+        # the launch goes straight into the pool slot, nothing is allocated per shot
+        tip_x, tip_y, _ = self.cannon_tip()
+        x0 = tip_x - self.cannon_size[0] / 2
+        pool = self.projectiles
+        slot = pool.spawn(kind, x0, tip_y, *self.sizes[kind])
+        if slot is None:
+            return None
+        self.score -= cost
+        pool.x0[slot], pool.y0[slot] = x0, tip_y
+        # the cannon's angle is in degrees, 0 meaning straight up
+        speed = launch_speed(self.power, mass)
+        radians = math.radians(self.cannon_angle + 90)
+        pool.vx[slot] = speed * math.cos(radians)
+        pool.vy[slot] = speed * math.sin(radians)
+        pool.start_time[slot] = self.time
+        return slot
+
+    def fire_bullet(self):
+        if self.can_fire(BULLET):
+            return self._launch(BULLET, BULLET_MASS, BULLET_COST)
+
+    def fire_cupcake(self):
+        if self.can_fire(CUPCAKE):
+            return self._launch(CUPCAKE, CUPCAKE_MASS, CUPCAKE_COST)
+
+    def fire_laser(self):
+        if not self.can_fire(LASER):
+            return None
+        tip_x, tip_y, angle = self.cannon_tip()
+        pool = self.projectiles
+        slot = pool.spawn(LASER, tip_x, tip_y, *self.sizes[LASER])
+        if slot is None:
+            return None
+        self.score -= LASER_COST
+        pool.start_time[slot] = self.time
+        pool.angle[slot] = self.cannon_angle + 90
+        pool.vx[slot] = LASER_SPEED * math.cos(angle)
+        pool.vy[slot] = LASER_SPEED * math.sin(angle)
+        pool.path[slot] = self.laser_path()
+        pool.travelled[slot] = 0.0
+        return slot
+
+    def laser_path(self):
+        # The path a laser fired right now would take. It only depends on where the cannon
+        # points and on the level geometry, so it is traced once and reused until one changes
+        tip_x, tip_y, _ = self.cannon_tip()
+        cooling = {mirror: self.timers.remaining(mirror.cooldown_timer) * LASER_SPEED
+                   for mirror in self.mirrors if mirror.cooling}
+        key = (tip_x, tip_y, self.cannon_angle, self.geometry_version, self.enemy_hit)
+        if cooling or key != self._laser_path_key:
+            path = trace((tip_x, tip_y), self.cannon_angle + 90, self.sizes[LASER], self.mirrors, self.perpetios,
+                         None if self.enemy_hit else self.enemy, (0, self.height / 15, self.width, self.height),
+                         MIRROR_COOLDOWN * LASER_SPEED, cooling)
+            if cooling:
+                # depends on the cooldowns too, not worth caching
+                return path
+            self._laser_path_key, self._laser_path = key, path
+        return self._laser_path
+
+    # -- simulation --
+
+    def step(self, dt, profiler=None):
+        # Advance the world by dt seconds and return what happened during the tick.
+        # A profiler.FrameProfiler, when given, gets a lap after every phase; it's kept in
+        # self.profiler for the length of the step, for the phases deeper down
+        self.events = []
+        self.time += dt
+        self.profiler = profiler
+
+        self.timers.advance(dt)
+        if profiler is not None:
+            profiler.lap('timers')
+        self.move_player(dt)
+
+        # only live slots are visited; walking backwards keeps the loop valid when a slot dies
+        live = self.projectiles.live
+        kinds = self.projectiles.kind
+        # every shell is swept against the walls in one batch, the hits are then resolved shell by shell
+        contacts = self.sweep_shells([slot for slot in reversed(live) if kinds[slot] != LASER])
+        for index in range(len(live) - 1, -1, -1):
+            slot = live[index]
+            if kinds[slot] == LASER:
+                self.move_laser(slot, dt)
+                if profiler is not None:
+                    profiler.lap('lasers')
+            else:
+                self.move_shell(slot, contacts[slot])
+                if profiler is not None:
+                    profiler.lap('shells')
+        self.profiler = None
+        return self.events
+
+    def idle(self):
+        # nothing moves until a key is pressed or a timer fires
+        return not self.keys and not self.projectiles.live
+
+    def run(self, frames, dt=1 / 60):
+        # Step a fixed number of frames with a fixed dt, handy for batch runs without a window
+        for _ in range(frames):
+            self.step(dt)
+
+    def start_cooldown(self, mirror, delay=MIRROR_COOLDOWN):
+        # rescheduling reuses the mirror's timer, nothing is allocated per reflection
+        if mirror.cooldown_timer is None:
+            mirror.cooldown_timer = self.timers.schedule(delay, self.end_cooldown)
+        else:
+            self.timers.reschedule(mirror.cooldown_timer, delay)
+
+    def end_cooldown(self, dt):
+        # nothing to do, the mirror is usable again as soon as its timer is no longer pending
+        pass
+
+    def start_deducing_points(self, dt):
+        self.events.append(('hurry_up', None))
+        self.deduce_timer = self.timers.schedule_interval(1, self.deduce_points)
+
+    def deduce_points(self, dt):
+        # Deduct 10 points from the score every second
+        if self.score > 0:
+            self.score -= DEDUCTION
+        else:
+            # once we reach <=0 points, we stop deducing
+            self.timers.cancel(self.deduce_timer)
+
+    def teleport_shell(self, slot):
+        if self.wormhole is None:
+            return
+        pool = self.projectiles
+        # front is checked before rear, exactly like the level 2 widget did
+        for part in (self.wormhole.front, self.wormhole.rear):
+            if collides(pool.rect(slot), part.rect()):
+                exit_part = self.wormhole.front if part is self.wormhole.rear else self.wormhole.rear
+                shift_x, shift_y = exit_part.x - part.x, exit_part.y - part.y
+                pool.x[slot] += shift_x
+                pool.y[slot] += shift_y
+                # the rest of the flight is the same trajectory, just offset
+                pool.x0[slot] += shift_x
+                pool.y0[slot] += shift_y
+
+    def remove_rock(self, rock):
+        self.rocks.remove(rock)
+        self.events.append(('rock_destroyed', rock))
+
+    def blast(self, rock):
+        # the collided rock takes every other rock within the blast radius with it. In chain reaction
+        # mode the destroyed rocks blast as well, which spreads like a flood fill over the grid:
+        # every rock is removed (and queried around) at most once, so big walls resolve in one frame
+        self.remove_rock(rock)
+        pending = deque([rock])
+        while pending:
+            center = pending.popleft()
+            for other in self.rocks.within(center.pos, BLAST_RADIUS):
+                self.remove_rock(other)
+                if self.chain_reaction:
+                    pending.append(other)
+            if not self.chain_reaction:
+                break
+
+    def hit_enemy(self, slot):
+        self.projectiles.colliding[slot] = True
+        if not self.enemy_hit:
+            self.enemy_hit = True
+            # Move the enemy off-screen
+            self.enemy.x, self.enemy.y = -1000, -1000
+            self.events.append(('enemy_hit', self.score))
+
+    def sweep_shells(self, slots):
+        # Moves the shells through the wormhole and works out where their trajectory takes them this
+        # tick, then sweeps all of them against the rocks and the perpetios in one batch per kind.
+        # Returns slot -> (dx, dy, (rock, toi), (perpetio, toi)) for move_shell()
+        pool = self.projectiles
+        moves = []
+        for slot in slots:
+            self.teleport_shell(slot)
+            # the position is sampled from the trajectory, never accumulated, so it doesn't depend on dt
+            x, y = position(pool.x0[slot], pool.y0[slot], pool.vx[slot], pool.vy[slot],
+                            self.time - pool.start_time[slot])
+            moves.append((pool.rect(slot), x - pool.x[slot], y - pool.y[slot]))
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.lap('shells')
+        rock_hits = self.rocks.first_sweeps(moves)
+        perpetio_hits = self.perpetios.first_sweeps(moves)
+        if profiler is not None:
+            profiler.lap('collision')
+        return {slot: (dx, dy, rock_hit, perpetio_hit)
+                for slot, (_, dx, dy), rock_hit, perpetio_hit in zip(slots, moves, rock_hits, perpetio_hits)}
+
+    def first_contact(self, rect, dx, dy, rocks=True, rock_hit=None, perpetio_hit=None):
+        # What a box moving by (dx, dy) runs into first during this tick.
+        # Returns (time of impact, kind, target), with time 1.0 and kind None when the way is clear.
+        # rock_hit and perpetio_hit are what a batched sweep found, (block, toi), if there was one
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.lap('shells')
+        best_toi, best_kind, best_target = 1.0, None, None
+        if rocks:
+            if rock_hit is None or (rock_hit[0] is not None and rock_hit[0] not in self.rocks):
+                # not swept yet, or an earlier shell of this tick destroyed the rock: removing rocks
+                # can't make anything be hit sooner, so only then is it swept again
+                rock_hit = self.rocks.first_sweep(rect, dx, dy)
+            rock, toi = rock_hit
+            if rock is not None and toi < best_toi:
+                best_toi, best_kind, best_target = toi, 'rock', rock
+        perpetio, toi = perpetio_hit if perpetio_hit is not None else self.perpetios.first_sweep(rect, dx, dy)
+        if perpetio is not None and toi < best_toi:
+            best_toi, best_kind, best_target = toi, 'perpetio', perpetio
+        if profiler is not None:
+            profiler.lap('collision')
+        if not self.enemy_hit:
+            toi = sweep(rect, dx, dy, self.enemy.rect())
+            if toi is not None and toi < best_toi:
+                best_toi, best_kind, best_target = toi, 'enemy', self.enemy
+        if profiler is not None:
+            profiler.lap('enemy')
+        return best_toi, best_kind, best_target
+
+    def move_player(self, dt):
+        player = self.player
+        # the tank can't drive through the enemy
+        if collides(player.rect(), self.enemy.rect()):
+            self.collision_right = player.x < self.enemy.x
+            self.collision_left = player.x > self.enemy.x
+        else:
+            self.collision_left = False
+            self.collision_right = False
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.lap('enemy')
+
+        step_size = self.width / 8 * dt  # Movement speed
+        rotation_speed = 45 * dt  # Rotation speed
+
+        # Not allowed to go off-screen, nor past the first third of it
+        if 'a' in self.keys and not self.collision_left:
+            player.x = max(player.x - step_size, 0)
+        if 'd' in self.keys and not self.collision_right:
+            player.x = min(player.x + step_size, self.width / 3 - player.w)
+
+        # Cannon rotation, limited between -90 and +90 degrees
+        if 'w' in self.keys and self.cannon_angle + rotation_speed <= 90:
+            self.cannon_angle += rotation_speed
+        if 's' in self.keys and self.cannon_angle - rotation_speed >= -90:
+            self.cannon_angle -= rotation_speed
+        if profiler is not None:
+            profiler.lap('movement')
+
+        # Powerbar logic
+        bullet_active = self.projectiles.in_flight[BULLET] > 0
+        if 'p' in self.keys and not bullet_active and self.power <= MAX_POWER:
+            self.power += POWER_SPEED * dt
+        if 'o' in self.keys and not bullet_active and self.power >= MIN_POWER:
+            self.power -= POWER_SPEED * dt
+        if profiler is not None:
+            profiler.lap('power')
+
+    def move_shell(self, slot, contact):
+        # bullet and cupcake: the shell stops exactly where it first touches something. Shells are swept
+        # along their whole move (see sweep_shells), so a low tick rate can't make them tunnel
+        pool = self.projectiles
+        dx, dy, rock_hit, perpetio_hit = contact
+        toi, kind, target = self.first_contact(pool.rect(slot), dx, dy, rock_hit=rock_hit, perpetio_hit=perpetio_hit)
+        pool.x[slot] += dx * toi
+        pool.y[slot] += dy * toi
+
+        if kind == 'rock':
+            pool.colliding[slot] = True
+            if pool.kind[slot] == CUPCAKE:
+                self.blast(target)
+            else:
+                self.remove_rock(target)
+            self.events.append(('hit', target))
+        elif kind == 'perpetio':
+            # perpetios aren't removed, but the projectile is
+            pool.kill(slot)
+            return
+        elif kind == 'enemy':
+            self.hit_enemy(slot)
+
+        # Deactivate the projectile if it goes out of the window
+        x, y = pool.x[slot], pool.y[slot]
+        if x > self.width or y < self.height / 15 or x < 0 or pool.colliding[slot]:
+            pool.kill(slot)
+
+    def move_laser(self, slot, dt):
+        # no collision tests here: the laser just slides along the path traced when it was fired
+        pool = self.projectiles
+        path = pool.path[slot]
+        before = pool.travelled[slot]
+        travelled = pool.travelled[slot] = before + LASER_SPEED * dt
+        for distance_along, mirror in path.bounces:
+            if before < distance_along <= travelled:
+                self.start_cooldown(mirror, MIRROR_COOLDOWN - (travelled - distance_along) / LASER_SPEED)
+        if self.profiler is not None:
+            self.profiler.lap('mirrors')
+        pool.x[slot], pool.y[slot], angle = path.position(travelled)
+        if angle != pool.angle[slot]:
+            # the velocity keeps pointing the way the laser goes, like it used to
+            pool.angle[slot] = angle
+            pool.vx[slot] = LASER_SPEED * math.cos(math.radians(angle))
+            pool.vy[slot] = LASER_SPEED * math.sin(math.radians(angle))
+
+        if travelled >= path.length:
+            if path.end_kind == 'enemy':
+                self.hit_enemy(slot)
+            pool.kill(slot)
+
+
+# -- level layouts --
+
+def rock_column(x, count, lift, width, height):
+    # a vertical stack of blocks resting on the floor, lift moves it down by that many block heights
+    block_h = height / 20
+    starting_y = (height - count * block_h) / 2 - lift * block_h
+    return [Body(x, starting_y + i * block_h, width / 20, block_h) for i in range(count)]
+
+
+def rock_row(y, x_start, spacing, count, width, height):
+    return [Body(x_start + i * spacing, y, width / 20, height / 20) for i in range(count)]
@@ -0,0 +1,53 @@
+import os
+import json
+
+
+""" One place to turn an image file name into something Kivy can draw. The small
+    sprites and the UI images are packed into a few atlases by build_atlas.py; when
+    an atlas is there, source() hands out atlas:// urls so all of them share one
+    texture, otherwise it falls back to the plain file in img/.
+
+"""
+
+IMG_DIR = 'img'
+# the biggest page an atlas can have, images that don't fit go to another page
+ATLAS_SIZE = 2048
+
+# atlas name -> image files packed in it. Backgrounds are too big to be worth packing.
+ATLASES = {
+    # everything drawn while playing a level
+    'game': ('block.JPEG', 'perpetio.jpg', 'bullet.png', 'cupcake.png', 'tank.png',
+             'cannon_new.png', 'front.png', 'rear.png', 'winnie.png', 'ihoh.png', 'tigro.png'),
+    # buttons and icons of the menus
+    'ui': ('options.png', 'quit.png', 'resume.png', 'tut.png', 'musica_on.png', 'musica_off.png',
+           'icon_1.png', 'icon_2.png', 'icon_3.png', 'confirm.png', 'home.png', 'next.JPEG',
+           'backtolev.png', 'start.png'),
+}
+
+# file name -> atlas:// url, filled the first time source() is called
+_packed = None
+
+
+def _load_index():
+    # read what the built atlases really contain, an atlas file maps each page to its images
+    index = {}
+    for atlas, filenames in ATLASES.items():
+        path = os.path.join(IMG_DIR, atlas + '.atlas')
+        if not os.path.exists(path):
+            continue
+        with open(path) as file:
+            pages = json.load(file)
+        names = {name for page in pages.values() for name in page}
+        for filename in filenames:
+            name = os.path.splitext(filename)[0]
+            if name in names:
+                index[filename] = 'atlas://{}/{}/{}'.format(IMG_DIR, atlas, name)
+    return index
+
+
+def source(filename):
+    # what to put in a source=... for an image of img/
+    global _packed
+    if _packed is None:
+        _packed = _load_index()
+    return _packed.get(filename) or './{}/{}'.format(IMG_DIR, filename)
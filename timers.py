@@ -0,0 +1,118 @@
+import math
+
+
+""" A single-threaded timer wheel driven by the game tick. Every game timer
+    (mirror cooldowns, the hurry up countdown, the warning label, the screen
+    transitions) lives here instead of in threads or in separate Clock events,
+    so they all run on the main loop in a predictable order.
+
+"""
+
+
+class Timer:
+    __slots__ = ('callback', 'deadline', 'interval', 'scheduled_at', 'slot')
+
+    def __init__(self, callback, interval):
+        self.callback = callback
+        self.interval = interval
+        # tick at which the timer fires, and the time it was (re)armed
+        self.deadline = 0
+        self.scheduled_at = 0.0
+        # index of the wheel slot holding the timer, None once it fired or was cancelled
+        self.slot = None
+
+    @property
+    def active(self):
+        return self.slot is not None
+
+
+class TimerWheel:
+    # Timers are hashed into `size` slots by their deadline tick. Advancing the wheel only
+    # looks at the slots of the ticks that went by, so scheduling, cancelling and
+    # rescheduling are all O(1) whatever the number of timers.
+    def __init__(self, resolution=1 / 120, size=256):
+        self.resolution = resolution
+        self.size = size
+        self.slots = [{} for _ in range(size)]
+        self.tick = 0
+        self.time = 0.0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def _arm(self, timer, delay):
+        deadline = max(math.ceil((self.time + delay) / self.resolution - 1e-9), self.tick + 1)
+        timer.deadline = deadline
+        timer.scheduled_at = self.time
+        timer.slot = deadline % self.size
+        self.slots[timer.slot][timer] = None
+        self.count += 1
+
+    def schedule(self, delay, callback):
+        # call callback(dt) once, delay seconds from now
+        timer = Timer(callback, None)
+        self._arm(timer, delay)
+        return timer
+
+    def schedule_interval(self, interval, callback):
+        # call callback(dt) every interval seconds until it is cancelled
+        timer = Timer(callback, interval)
+        self._arm(timer, interval)
+        return timer
+
+    def cancel(self, timer):
+        if timer is not None and timer.slot is not None:
+            del self.slots[timer.slot][timer]
+            timer.slot = None
+            self.count -= 1
+
+    def reschedule(self, timer, delay):
+        # move an existing timer (fired, cancelled or still pending) to delay seconds from now
+        self.cancel(timer)
+        self._arm(timer, delay)
+        return timer
+
+    def remaining(self, timer):
+        if timer is None or timer.slot is None:
+            return 0.0
+        return max(timer.deadline * self.resolution - self.time, 0.0)
+
+    def next_delay(self):
+        # seconds until the next timer fires, None when nothing is pending
+        if not self.count:
+            return None
+        deadline = min(timer.deadline for slot in self.slots for timer in slot)
+        return max(deadline * self.resolution - self.time, 0.0)
+
+    def advance(self, dt):
+        self.time += dt
+        target = int(self.time / self.resolution + 1e-9)
+        if not self.count:
+            # nothing pending, no need to walk the slots
+            self.tick = max(self.tick, target)
+            return
+        while self.tick < target:
+            self.tick += 1
+            slot = self.slots[self.tick % self.size]
+            if not slot:
+                continue
+            due = [timer for timer in slot if timer.deadline <= self.tick]
+            for timer in due:
+                # an earlier callback of this same tick may have cancelled it
+                if timer.slot is None or timer.deadline > self.tick:
+                    continue
+                del slot[timer]
+                timer.slot = None
+                self.count -= 1
+                elapsed = self.time - timer.scheduled_at
+                if timer.interval is not None:
+                    self._arm(timer, timer.interval)
+                timer.callback(elapsed)
+
+    def clear(self):
+        for slot in self.slots:
+            for timer in slot:
+                timer.slot = None
+            slot.clear()
+        self.count = 0